@@ -0,0 +1,143 @@
+"""This module implements a compact index of the gene-GO annotations of a
+GeneWalk network. It contains everything the statistics stage needs from the
+network (GO neighbours of genes, GO names and domains and node degrees) in a
+few arrays, so that the full networkx MultiGraph does not have to be loaded
+to calculate the statistics."""
+import logging
+import numpy as np
+import networkx as nx
+from genewalk.graph import GeneWalkGraph
+
+logger = logging.getLogger('genewalk.annotation_index')
+
+annotation_index_version = 1
+
+
+class AnnotationIndex(object):
+    """Gene to GO-neighbour index of a GeneWalk network.
+
+    The GO neighbours of each gene node are stored in compressed sparse row
+    (CSR) format: the GO neighbours of the gene at position i in gene_ids are
+    go_ids[indices[indptr[i]:indptr[i+1]]], sorted by GO ID.
+
+    Parameters
+    ----------
+    gene_ids : np.array
+        Names of the gene (i.e. non-GO) nodes in the network.
+    gene_degree : np.array
+        The number of distinct neighbours of each gene node.
+    indptr : np.array
+        Row pointers of the gene to GO-neighbour CSR matrix.
+    indices : np.array
+        Column indices (positions in go_ids) of the CSR matrix.
+    go_ids : np.array
+        IDs of the GO nodes that are neighbours of at least one gene node.
+    go_names : np.array
+        The names of the GO terms in go_ids.
+    go_domains : np.array
+        The domains (namespaces) of the GO terms in go_ids.
+    go_degree : np.array
+        The number of distinct neighbours of each GO node.
+    """
+    def __init__(self, gene_ids, gene_degree, indptr, indices, go_ids,
+                 go_names, go_domains, go_degree):
+        self.gene_ids = gene_ids
+        self.gene_degree = gene_degree
+        self.indptr = indptr
+        self.indices = indices
+        self.go_ids = go_ids
+        self.go_names = go_names
+        self.go_domains = go_domains
+        self.go_degree = go_degree
+        self.gene_pos = {g: i for i, g in enumerate(self.gene_ids)}
+        self.go_pos = {g: i for i, g in enumerate(self.go_ids)}
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Return the annotation index of a GeneWalk network.
+
+        Parameters
+        ----------
+        graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
+            A GeneWalk network.
+
+        Returns
+        -------
+        AnnotationIndex
+            The annotation index of the network.
+        """
+        if isinstance(graph, GeneWalkGraph):
+            go_nodes = set(graph.get_node_attributes('GO'))
+            names = graph.get_node_attributes('name')
+            domains = graph.get_node_attributes('domain')
+        else:
+            go_nodes = set(nx.get_node_attributes(graph, 'GO'))
+            names = nx.get_node_attributes(graph, 'name')
+            domains = nx.get_node_attributes(graph, 'domain')
+        gene_ids = sorted(n for n in graph.nodes() if n not in go_nodes)
+        go_neighbors = [sorted(set(graph[g]) & go_nodes) for g in gene_ids]
+        go_ids = sorted(set().union(*go_neighbors))
+        go_pos = {g: i for i, g in enumerate(go_ids)}
+        indptr = np.zeros(len(gene_ids) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(nb) for nb in go_neighbors])
+        indices = np.array([go_pos[go] for nb in go_neighbors for go in nb],
+                           dtype=np.int32)
+        return cls(gene_ids=np.array(gene_ids, dtype=str),
+                   gene_degree=np.array([len(graph[g]) for g in gene_ids],
+                                        dtype=np.int64),
+                   indptr=indptr, indices=indices,
+                   go_ids=np.array(go_ids, dtype=str),
+                   go_names=np.array([names.get(go, '') for go in go_ids],
+                                     dtype=str),
+                   go_domains=np.array([domains.get(go, '')
+                                        for go in go_ids], dtype=str),
+                   go_degree=np.array([len(graph[go]) for go in go_ids],
+                                      dtype=np.int64))
+
+    def save(self, fname):
+        """Save the index into a compressed numpy (npz) file.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file to save the index into.
+        """
+        np.savez_compressed(fname, version=annotation_index_version,
+                            gene_ids=self.gene_ids,
+                            gene_degree=self.gene_degree,
+                            indptr=self.indptr, indices=self.indices,
+                            go_ids=self.go_ids, go_names=self.go_names,
+                            go_domains=self.go_domains,
+                            go_degree=self.go_degree)
+
+    @classmethod
+    def load(cls, fname):
+        """Return an annotation index loaded from a file written by save."""
+        with np.load(fname, allow_pickle=False) as fh:
+            if int(fh['version']) != annotation_index_version:
+                raise ValueError('Annotation index %s has version %d, '
+                                 'expected %d.' %
+                                 (fname, int(fh['version']),
+                                  annotation_index_version))
+            return cls(**{k: fh[k] for k in fh.files if k != 'version'})
+
+    def __contains__(self, node):
+        return node in self.gene_pos or node in self.go_pos
+
+    def degree(self, node):
+        """Return the number of distinct neighbours of a gene or GO node."""
+        if node in self.gene_pos:
+            return int(self.gene_degree[self.gene_pos[node]])
+        return int(self.go_degree[self.go_pos[node]])
+
+    def get_go_neighbors(self, gene):
+        """Return the IDs of the GO nodes connected to a gene node."""
+        pos = self.gene_pos[gene]
+        return [str(self.go_ids[i]) for i in
+                self.indices[self.indptr[pos]:self.indptr[pos + 1]]]
+
+    def get_go_name(self, go_id):
+        return str(self.go_names[self.go_pos[go_id]])
+
+    def get_go_domain(self, go_id):
+        return str(self.go_domains[self.go_pos[go_id]])
@@ -1,19 +1,25 @@
 import gc
 import os
+import csv
 import sys
 import copy
 import pickle
 import random
 import logging
 import argparse
+import multiprocessing
 import numpy as np
-from genewalk import __version__
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from genewalk import __version__, query
 from genewalk.nx_mg_assembler import load_network
 from genewalk.gene_lists import read_gene_list
-from genewalk.deepwalk import run_walks
+from genewalk.deepwalk import run_walks, estimate_walks_memory
 from genewalk.null_distributions import get_rand_graph, \
     get_null_distributions
 from genewalk.perform_statistics import GeneWalk
+from genewalk.annotation_index import AnnotationIndex
+from genewalk.graph import GeneWalkGraph
+from genewalk.reference import ReferenceNetwork, get_reference_fname
 from genewalk import logger as root_logger, default_logger_format, \
     default_date_format
 from genewalk.resources import ResourceManager
@@ -22,12 +28,18 @@ logger = logging.getLogger('genewalk.cli')
 
 default_base_folder = os.path.join(os.path.expanduser('~/'), 'genewalk')
 
+# The arguments of genewalk batch that are the same for all its projects
+batch_arguments = ['base_folder', 'nproc', 'keep_compressed']
+
+# The values of flag columns of a batch manifest
+true_values = ['true', 'yes', '1']
+false_values = ['false', 'no', '0']
+
 
 def create_project_folder(base_folder, project):
     project_folder = os.path.join(base_folder, project)
     logger.info('Creating project folder at %s' % project_folder)
-    if not os.path.exists(project_folder):
-        os.makedirs(project_folder)
+    os.makedirs(project_folder, exist_ok=True)
     return project_folder
 
 
@@ -45,10 +57,491 @@ def load_pickle(project_folder, prefix):
         return pickle.load(fh)
 
 
-def main():
+def save_graph(graph, project_folder):
+    dirname = os.path.join(project_folder, 'genewalk_graph')
+    logger.info('Saving into %s...' % dirname)
+    graph.save(dirname)
+
+
+def load_graph(project_folder):
+    """Return the GeneWalkGraph of a project, memory-mapped from the project
+    folder, or converted from the networkx graph of projects that predate
+    the GeneWalkGraph format."""
+    dirname = os.path.join(project_folder, 'genewalk_graph')
+    if os.path.exists(os.path.join(dirname, 'meta.json')):
+        logger.info('Loading %s...' % dirname)
+        return GeneWalkGraph.load(dirname)
+    return GeneWalkGraph.from_networkx(load_pickle(project_folder,
+                                                   'multi_graph'))
+
+
+def is_up_to_date(fname, dependencies):
+    """Return True if a file exists and is newer than its dependencies."""
+    if not os.path.exists(fname):
+        return False
+    mtime = os.path.getmtime(fname)
+    return all(os.path.getmtime(dep) <= mtime for dep in dependencies
+               if os.path.exists(dep))
+
+
+def run_graph_replicate(project_folder, rep, graph=None, workers=1,
+                        save_dw=False):
+    """Run DeepWalk on the GeneWalk network of a project and save the node
+    vectors of one repeat.
+
+    Parameters
+    ----------
+    project_folder : str
+        The project folder.
+    rep : int
+        The number of the repeat, starting from 1.
+    graph : Optional[genewalk.graph.GeneWalkGraph]
+        The GeneWalk network. By default, it is loaded from the project
+        folder.
+    workers : Optional[int]
+        The number of processes running random walks and of the threads
+        training the node vectors. Default: 1
+    save_dw : Optional[bool]
+        If True, the DeepWalk object is also saved. Default: False
+    """
+    if graph is None:
+        graph = load_graph(project_folder)
+    DW = run_walks(graph, workers=workers)
+
+    # Pickle the node vectors (embeddings) and DW object
+    if save_dw:
+        save_pickle(DW, project_folder, 'deepwalk_%d' % rep)
+    nv = copy.deepcopy(DW.model.wv)
+    save_pickle(nv, project_folder, 'deepwalk_node_vectors_%d' % rep)
+
+    # Delete the DeepWalk object to clear memory
+    del DW, nv
+    gc.collect()
+
+
+def run_null_replicate(project_folder, rep, graph=None, workers=1,
+                       save_dw=False):
+    """Run DeepWalk on a random graph with the degree distribution of the
+    GeneWalk network of a project and return the similarities of its
+    neighboring nodes.
+
+    The parameters are the same as those of run_graph_replicate.
+
+    Returns
+    -------
+    list of float
+        The similarities of the node vectors of neighboring nodes of the
+        random graph.
+    """
+    if graph is None:
+        graph = load_graph(project_folder)
+    RG = get_rand_graph(graph)
+    DW = run_walks(RG, workers=workers)
+
+    # Pickle the node vectors (embeddings) and DW object
+    if save_dw:
+        save_pickle(DW, project_folder, 'deepwalk_rand_%d' % rep)
+    nv = copy.deepcopy(DW.model.wv)
+    save_pickle(nv, project_folder, 'deepwalk_node_vectors_rand_%d' % rep)
+    # Delete the DeepWalk object to clear memory
+    del DW
+    gc.collect()
+
+    # Calculate the null distributions
+    srd = get_null_distributions(RG, nv)
+    del nv
+    gc.collect()
+    return srd
+
+
+def get_njobs(graph, ntasks, nproc=1, memory_budget=None):
+    """Return the number of DeepWalk runs on a graph that can run
+    concurrently given a number of processors and a memory budget in GB."""
+    njobs = max(1, min(nproc, ntasks))
+    if memory_budget:
+        walks_memory = estimate_walks_memory(graph)
+        njobs = max(1, min(njobs, int(memory_budget * 1e9 // walks_memory)))
+        logger.info('Estimated memory usage of a DeepWalk run is %.2f GB' %
+                    (walks_memory / 1e9))
+    return njobs
+
+
+def run_replicates(project_folder, graph, nreps_graph=0, nreps_null=0,
+                   nproc=1, memory_budget=None, save_dw=False,
+                   sequential=False):
+    """Run the DeepWalk repeats on the GeneWalk network of a project and on
+    random graphs.
+
+    Once the network is assembled, the repeats are independent of each
+    other. They are run concurrently in as many processes as the number of
+    processors and the memory budget allow, with the processors split
+    evenly between the processes. If only one process fits or sequential is
+    True, the repeats run one after another in this process, those on the
+    GeneWalk network first, continuing from the current state of the random
+    number generator.
+
+    Parameters
+    ----------
+    project_folder : str
+        The project folder, into which the GeneWalk network is saved.
+    graph : genewalk.graph.GeneWalkGraph
+        The GeneWalk network.
+    nreps_graph : Optional[int]
+        The number of repeats on the GeneWalk network. Default: 0
+    nreps_null : Optional[int]
+        The number of repeats on random graphs. Default: 0
+    nproc : Optional[int]
+        The number of processors to use. Default: 1
+    memory_budget : Optional[float]
+        The memory in GB available to the concurrent repeats. By default,
+        the number of concurrent repeats is not limited by memory.
+    save_dw : Optional[bool]
+        If True, the DeepWalk objects are also saved. Default: False
+    sequential : Optional[bool]
+        If True, the repeats run one after another regardless of nproc and
+        memory_budget, so that a seeded random number generator gives the
+        same results. Default: False
+
+    Returns
+    -------
+    list of float
+        The similarities of neighboring nodes of the random graphs, which
+        make up the null distribution.
+    """
+    tasks = [(run_graph_replicate, 'graph', i + 1, nreps_graph)
+             for i in range(nreps_graph)] + \
+        [(run_null_replicate, 'null', i + 1, nreps_null)
+         for i in range(nreps_null)]
+    njobs = 1 if sequential else \
+        get_njobs(graph, len(tasks), nproc, memory_budget)
+    srd = []
+    if njobs == 1:
+        for func, kind, rep, nreps in tasks:
+            logger.info('%s %s/%s' % (kind, rep, nreps))
+            res = func(project_folder, rep, graph=graph, workers=nproc,
+                       save_dw=save_dw)
+            if kind == 'null':
+                srd += res
+        return srd
+    workers = max(1, nproc // njobs)
+    logger.info('Running %d repeats in %d processes with %d workers each' %
+                (len(tasks), njobs, workers))
+    with ProcessPoolExecutor(njobs) as executor:
+        futures = {}
+        for func, kind, rep, nreps in tasks:
+            future = executor.submit(func, project_folder, rep,
+                                     workers=workers, save_dw=save_dw)
+            futures[future] = (kind, rep, nreps)
+        for future in as_completed(futures):
+            kind, rep, nreps = futures[future]
+            res = future.result()
+            logger.info('Finished %s %s/%s' % (kind, rep, nreps))
+            if kind == 'null':
+                srd += res
+    return srd
+
+
+def load_node_vectors(project_folder, nv_prefixes):
+    """Return the node vectors and the null distribution of a project."""
+    nvs = [load_pickle(project_folder, prefix) for prefix in nv_prefixes]
+    return nvs, load_pickle(project_folder, 'genewalk_rand_simdists')
+
+
+def get_cached_genewalk(project_folder, index, genes, nv_prefixes):
+    """Return the GeneWalk object of the statistics stage.
+
+    The similarities and p-values of the gene-GO pairs of the project's
+    genes are cached, so that rerunning the statistics stage with a
+    different alpha_fdr, id_type or gene subset does not need the node
+    vectors and null distribution.
+    """
+    pair_stats_fname = os.path.join(project_folder, 'genewalk_pair_stats.npz')
+    dependencies = [os.path.join(project_folder, '%s.pkl' % prefix)
+                    for prefix in nv_prefixes +
+                    ['genewalk_rand_simdists', 'multi_graph', 'genes']] + \
+        [os.path.join(project_folder, 'annotation_index.npz'),
+         os.path.join(project_folder, 'genewalk_graph', 'meta.json')]
+    if is_up_to_date(pair_stats_fname, dependencies):
+        GW = GeneWalk(index, genes, None, None)
+        logger.info('Loading %s...' % pair_stats_fname)
+        try:
+            GW.load_pair_stats(pair_stats_fname)
+            if GW.nreps == len(nv_prefixes):
+                return GW
+        except ValueError as e:
+            logger.warning('%s Recalculating.' % e)
+    # The cache covers all genes of the project so that it can be reused
+    # for any subset of them
+    all_genes = load_pickle(project_folder, 'genes')
+    GW = GeneWalk(index, all_genes,
+                  *load_node_vectors(project_folder, nv_prefixes))
+    logger.info('Saving into %s...' % pair_stats_fname)
+    GW.save_pair_stats(pair_stats_fname)
+    if len(genes) == len(all_genes):
+        return GW
+    subset = GeneWalk(index, genes, None, None)
+    subset.load_pair_stats(pair_stats_fname)
+    return subset
+
+
+def filter_genes(genes, fname, id_type):
+    """Return the gene references whose IDs are listed in a file."""
+    ref_keys = {'hgnc_symbol': ('HGNC_SYMBOL', ''),
+                'hgnc_id': ('HGNC', 'HGNC:'),
+                'ensembl_id': ('ENSEMBL', ''),
+                'mgi_id': ('MGI', 'MGI:')}
+    key, prefix = ref_keys[id_type]
+    with open(fname, 'r') as fh:
+        ids = {line.strip() for line in fh}
+    ids |= {i[len(prefix):] for i in ids if prefix and i.startswith(prefix)}
+    subset = [g for g in genes if g.get(key) in ids]
+    logger.info('Restricting statistics to %d/%d genes listed in %s' %
+                (len(subset), len(genes), fname))
+    return subset
+
+
+def build_reference(argv):
+    """Build a whole-genome reference network from which project networks
+    can be induced, run as genewalk build-reference."""
+    parser = argparse.ArgumentParser(
+        prog='genewalk build-reference',
+        description='Build a whole-genome GeneWalk reference network from '
+                    'Pathway Commons (or a SIF file), GO annotations and '
+                    'the GO ontology, from which the networks of projects '
+                    'are then induced using the reference argument.')
+    parser.add_argument('--base_folder', default=default_base_folder,
+                        help='The base folder in which the resource files '
+                             'and reference networks are stored. '
+                             'Default: %(default)s')
+    parser.add_argument('--network_file', default=None,
+                        help='Path to a SIF file (nodeA <relationship type> '
+                             'nodeB, tab-separated, without header) of '
+                             'gene-gene edges to use instead of Pathway '
+                             'Commons.')
+    parser.add_argument('--name', default='pc',
+                        help='The name of the reference network. '
+                             'Default: %(default)s')
+    parser.add_argument('--keep_compressed', action='store_true',
+                        help='If set, downloaded resource files are kept '
+                             'gzip-compressed and parsed from the '
+                             'compressed files.')
+    args = parser.parse_args(argv)
+    rm = ResourceManager(base_folder=args.base_folder,
+                         keep_compressed=args.keep_compressed)
+    ref = ReferenceNetwork.build(rm, network_file=args.network_file)
+    ref.save(get_reference_fname(args.base_folder, args.name))
+
+
+def batch(argv):
+    """Run the projects listed in a manifest, loading the resources that
+    they share once, run as genewalk batch."""
+    parser = argparse.ArgumentParser(
+        prog='genewalk batch',
+        description='Run GeneWalk on several projects listed in a manifest. '
+                    'The resource files and reference networks used by the '
+                    'projects are loaded once and shared by the processes '
+                    'running the projects concurrently.',
+        epilog='Any other arguments, e.g. --nreps_graph, are passed on to '
+               'all projects, see genewalk --help.')
+    parser.add_argument('--manifest', required=True,
+                        help='Path to a comma-separated file with a header '
+                             'and a row for each project. The project, '
+                             'genes and id_type columns are required, other '
+                             'columns such as network_source, network_file, '
+                             'reference or random_seed can be added. Each '
+                             'column is passed to the project as the '
+                             'argument of the same name, unless empty. '
+                             'Flags such as annotate_ancestors are set by '
+                             'true, yes or 1. The base_folder, nproc and '
+                             'keep_compressed arguments are the same for '
+                             'all projects and cannot be columns.')
+    parser.add_argument('--base_folder', default=default_base_folder,
+                        help='The base folder in which the resource files '
+                             'and the project folders are stored. '
+                             'Default: %(default)s')
+    parser.add_argument('--nproc', default=1, type=int,
+                        help='The total number of processors to use, which '
+                             'are split evenly between the projects run '
+                             'concurrently. Default: %(default)s')
+    parser.add_argument('--nprojects', default=None, type=int,
+                        help='The number of projects to run concurrently, '
+                             'each with an equal share of the processors. '
+                             'Default: nproc')
+    parser.add_argument('--keep_compressed', action='store_true',
+                        help='If set, downloaded resource files are kept '
+                             'gzip-compressed and parsed from the '
+                             'compressed files.')
+    args, project_argv = parser.parse_known_args(argv)
+    projects = read_manifest(args.manifest, project_argv,
+                             base_folder=args.base_folder,
+                             keep_compressed=args.keep_compressed)
+    nprojects = max(1, min(args.nprojects or args.nproc, len(projects)))
+    for project_args in projects:
+        project_args.nproc = max(1, args.nproc // nprojects)
+
+    rm = ResourceManager(base_folder=args.base_folder,
+                         keep_compressed=args.keep_compressed,
+                         cache_in_memory=True)
+    rm.download_all()
+    references = load_shared_resources(rm, projects)
+
+    failed = []
+    if nprojects == 1:
+        for project_args in projects:
+            try:
+                run_project(project_args, rm, references)
+            except Exception:
+                logger.exception('Project %s failed' % project_args.project)
+                failed.append(project_args.project)
+    else:
+        logger.info('Running %d projects, %d at a time' %
+                    (len(projects), nprojects))
+        # The worker processes are forked after the resources are loaded so
+        # that they share them
+        _batch_resources.update(resource_manager=rm, references=references)
+        mp_context = multiprocessing.get_context('fork') \
+            if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(nprojects, mp_context=mp_context) \
+                as executor:
+            futures = {executor.submit(_run_batch_project, project_args):
+                       project_args.project for project_args in projects}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    logger.info('Finished project %s' % futures[future])
+                except Exception:
+                    logger.exception('Project %s failed' % futures[future])
+                    failed.append(futures[future])
+    if failed:
+        logger.error('%d/%d projects failed: %s' %
+                     (len(failed), len(projects), ', '.join(failed)))
+        return 1
+    logger.info('Finished all %d projects' % len(projects))
+
+
+# The resources shared by the projects of a batch, set before the worker
+# processes are forked
+_batch_resources = {}
+
+
+def _run_batch_project(args):
+    run_project(args, **_batch_resources)
+
+
+def read_manifest(fname, project_argv=None, **kwargs):
+    """Return the arguments of the projects listed in a batch manifest.
+
+    Parameters
+    ----------
+    fname : str
+        The path to the manifest, see batch.
+    project_argv : Optional[list of str]
+        Command line arguments passed to all projects, which the columns of
+        the manifest override.
+    **kwargs
+        Arguments passed to all projects, which project_argv overrides.
+
+    Returns
+    -------
+    list of argparse.Namespace
+        The arguments of each project, in the order of the manifest.
+    """
+    with open(fname, 'r') as fh:
+        rows = list(csv.DictReader(fh))
+    columns = set(rows[0] if rows else [])
+    missing = {'project', 'genes', 'id_type'} - columns
+    if missing:
+        raise ValueError('The manifest %s has no %s column.' %
+                         (fname, ', '.join(sorted(missing))))
+    shared = columns & set(batch_arguments)
+    if shared:
+        raise ValueError('The manifest %s has %s columns, which are the same '
+                         'for all projects and set by the arguments of '
+                         'genewalk batch.' %
+                         (fname, ', '.join(sorted(shared))))
+    names = [row['project'] for row in rows]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError('The manifest %s lists projects %s more than '
+                         'once.' % (fname, ', '.join(duplicates)))
+    parser = get_parser()
+    parser.set_defaults(**kwargs)
+    actions = {action.dest: action for action in parser._actions
+               if action.option_strings}
+    unknown = columns - set(actions)
+    if unknown:
+        raise ValueError('The manifest %s has %s columns, which are not '
+                         'arguments of genewalk.' %
+                         (fname, ', '.join(sorted(unknown))))
+
+    # Invalid arguments raise an error instead of exiting
+    def error(message):
+        raise ValueError(message)
+    parser.error = error
+
+    projects = []
+    for row in rows:
+        argv = list(project_argv or [])
+        unset_flags = []
+        for column, value in row.items():
+            if not value:
+                continue
+            action = actions[column]
+            # Flags are given without a value if set, and unset after
+            # parsing otherwise so that they override project_argv
+            if action.nargs == 0 or action.type is bool:
+                if value.strip().lower() not in true_values + false_values:
+                    raise ValueError('The %s column of the manifest %s has '
+                                     'value %s, expected true or false.' %
+                                     (column, fname, value))
+                if value.strip().lower() in false_values:
+                    unset_flags.append(action.dest)
+                    continue
+                argv += ['--%s' % column] if action.nargs == 0 else \
+                    ['--%s' % column, 'True']
+            else:
+                argv += ['--%s' % column, value]
+        try:
+            args = parser.parse_args(argv)
+        except ValueError as e:
+            raise ValueError('Invalid arguments of project %s in the '
+                             'manifest %s: %s' % (row['project'], fname, e))
+        for dest in unset_flags:
+            setattr(args, dest, False)
+        projects.append(args)
+    return projects
+
+
+def load_shared_resources(resource_manager, projects):
+    """Load the resources needed to assemble the networks of projects into
+    the memory of a resource manager that has cache_in_memory set, and
+    return the reference networks used by the projects by name."""
+    references = {}
+    for args in projects:
+        if args.stage not in ('all', 'node_vectors'):
+            continue
+        if args.reference:
+            if args.reference not in references:
+                references[args.reference] = ReferenceNetwork.load(
+                    get_reference_fname(args.base_folder, args.reference))
+            continue
+        resource_manager.get_go_ontology()
+        if args.network_source in ('pc', 'indra'):
+            resource_manager.get_goa_index()
+        if args.network_source == 'pc':
+            resource_manager.get_pc_index()
+    return references
+
+
+def get_parser():
+    """Return the parser of the arguments of a GeneWalk project."""
     parser = argparse.ArgumentParser(
         description='Run GeneWalk on a list of genes provided in a text '
-                    'file.')
+                    'file.',
+        epilog='Run genewalk build-reference --help for building a '
+               'reference network, genewalk batch --help for running '
+               'several projects and genewalk query --help for querying '
+               'the results of a project.')
     parser.add_argument('--version', action='version',
                         version='GeneWalk %s' % __version__,
                         help='Print the version of GeneWalk and exit.')
@@ -96,12 +589,20 @@ def main():
                              'of INDRA Statements constituting the network '
                              'is contained. In case network_source is '
                              'edge_list or sif, '
-                             'the network_file argument points to a text file '
+                             'the network_file argument points to a '
+                             'comma-separated text file without header '
                              'representing the network.')
     parser.add_argument('--nproc', default=1, type=int,
                         help='The number of processors to use in a '
                              'multiprocessing environment. Default: '
                              '%(default)s')
+    parser.add_argument('--memory_budget', default=None, type=float,
+                        help='The memory in GB available to the DeepWalk '
+                             'runs. If provided, the repeats on the '
+                             'GeneWalk graph and on the random graphs are '
+                             'only run concurrently as far as their '
+                             'estimated memory usage fits this budget. '
+                             'Default: %(default)s')
     parser.add_argument('--nreps_graph', default=3, type=int,
                         help='The number of repeats to run when calculating '
                              'node vectors on the GeneWalk graph. '
@@ -128,10 +629,87 @@ def main():
                              'seeded with the given value. This should only '
                              'be used if the goal is to deterministically '
                              'reproduce a prior result obtained with the same '
-                             'random seed.')
-    args = parser.parse_args()
+                             'random seed. The DeepWalk repeats then run one '
+                             'after another in a single process, whatever '
+                             'memory_budget is. With nproc greater than 1, '
+                             'the random walks of each repeat still run in '
+                             'several processes and are not reproducible.')
+    parser.add_argument('--reference', default=None,
+                        help='The name of a reference network built with '
+                             'genewalk build-reference in the base folder. '
+                             'If provided, the network of the project is '
+                             'induced from the reference network and the '
+                             'network_source and network_file arguments are '
+                             'not used.')
+    parser.add_argument('--go_ontology', default='full',
+                        help='The part of the GO ontology added to the '
+                             'network: full adds all GO terms, ancestors '
+                             'only adds the GO terms annotated to genes in '
+                             'the network and their ancestors. Not used '
+                             'if network_source is edge_list or sif. '
+                             'Default: %(default)s',
+                        choices=['full', 'ancestors'])
+    parser.add_argument('--go_neighborhood', default=0, type=int,
+                        help='If go_ontology is ancestors, GO terms within '
+                             'this number of is_a edges of the GO terms '
+                             'annotated to genes (and their ancestors) are '
+                             'also added to the network. '
+                             'Default: %(default)s')
+    parser.add_argument('--annotate_ancestors', action='store_true',
+                        help='If set, genes are also connected to all '
+                             'ancestors of the GO terms they are annotated '
+                             'with, i.e. GO annotations are propagated up '
+                             'the GO ontology. Not used if network_source '
+                             'is edge_list or sif.')
+    parser.add_argument('--collapse_edges', action='store_true',
+                        help='If set, parallel edges of the network are '
+                             'collapsed into a single edge per pair of nodes '
+                             'with the number of edges and their labels as '
+                             'attributes, which reduces the size of the '
+                             'network without changing the random walks.')
+    parser.add_argument('--stats_chunk_size', default=None, type=int,
+                        help='If provided, the statistics stage processes '
+                             'the genes in chunks of this size and streams '
+                             'the results into the output file, so that '
+                             'peak memory usage is set by the chunk size '
+                             'rather than by the number of genes. '
+                             'Default: %(default)s')
+    parser.add_argument('--gene_subset', default=None,
+                        help='Path to a text file with a subset of the genes '
+                             '(using the IDs given in the id_type argument) '
+                             'to output statistics for. By default, '
+                             'statistics are output for all genes.')
+    parser.add_argument('--keep_compressed', action='store_true',
+                        help='If set, downloaded resource files are kept '
+                             'gzip-compressed and parsed from the '
+                             'compressed files.')
+    return parser
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'build-reference':
+        return build_reference(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        return batch(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        return query.main(sys.argv[2:])
+    args = get_parser().parse_args()
+    run_project(args)
 
-    # Now we run the relevant stage of processing
+
+def run_project(args, resource_manager=None, references=None):
+    """Run the stages of processing of a project.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The arguments of the project, see get_parser.
+    resource_manager : Optional[genewalk.resources.ResourceManager]
+        The resource manager to get the resource files from. By default, a
+        resource manager of the base folder of the project is created.
+    references : Optional[dict]
+        Reference networks that are already loaded, by name.
+    """
     project_folder = create_project_folder(args.base_folder, args.project)
 
     # Add a logger specific to the project and processing stage
@@ -141,75 +719,116 @@ def main():
     project_log_handler = logging.FileHandler(log_file)
     project_log_handler.setFormatter(formatter)
     root_logger.addHandler(project_log_handler)
+    try:
+        run_stages(args, project_folder, resource_manager, references)
+    finally:
+        root_logger.removeHandler(project_log_handler)
+        project_log_handler.close()
 
+
+def run_stages(args, project_folder, resource_manager=None, references=None):
+    """Run the stages of processing of a project selected by args.stage,
+    see run_project."""
     if args.random_seed:
         logger.info('Running with random seed %d' % args.random_seed)
         random.seed(a=int(args.random_seed))
 
     # Make sure we have all the resource files
-    rm = ResourceManager(base_folder=args.base_folder)
+    rm = resource_manager
+    if rm is None:
+        rm = ResourceManager(base_folder=args.base_folder,
+                             keep_compressed=args.keep_compressed)
     rm.download_all()
 
+    # The graph is kept in memory between stages in case all stages are run
+    graph = None
     if args.stage in ('all', 'node_vectors'):
-        genes = read_gene_list(args.genes, args.id_type)
+        genes = read_gene_list(args.genes, args.id_type,
+                               unmapped_fname=os.path.join(
+                                   project_folder, 'unmapped_genes.csv'),
+                               cache_folder=rm.resource_folder)
         save_pickle(genes, project_folder, 'genes')
-        MG = load_network(args.network_source, args.network_file, genes,
-                          resource_manager=rm)
-        save_pickle(MG.graph, project_folder, 'multi_graph')
-        for i in range(args.nreps_graph):
-            logger.info('%s/%s' % (i + 1, args.nreps_graph))
-            DW = run_walks(MG.graph, workers=args.nproc)
-
-            # Pickle the node vectors (embeddings) and DW object
-            if args.save_dw:
-                save_pickle(DW, project_folder, 'deepwalk_%d' % (i + 1))
-            nv = copy.deepcopy(DW.model.wv)
-            save_pickle(nv, project_folder,
-                        'deepwalk_node_vectors_%d' % (i + 1))
-
-            # Delete the DeepWalk object to clear memory
-            del DW, nv
-            gc.collect()
-
-    if args.stage in ('all', 'null_distribution'):
-        MG = load_pickle(project_folder, 'multi_graph')
-        srd = []
-        for i in range(args.nreps_null):
-            logger.info('%s/%s' % (i + 1, args.nreps_null))
-            RG = get_rand_graph(MG)
-            DW = run_walks(RG, workers=args.nproc)
-
-            # Pickle the node vectors (embeddings) and DW object
-            if args.save_dw:
-                save_pickle(DW, project_folder, 'deepwalk_rand_%d' % (i + 1))
-            nv = copy.deepcopy(DW.model.wv)
-            save_pickle(nv, project_folder, 'deepwalk_node_vectors_rand_%d'
-                                            % (i + 1))
-            # Delete the DeepWalk object to clear memory
-            del DW
-            gc.collect()
-
-            # Calculate the null distributions
-            srd += get_null_distributions(RG, nv)
-            del nv
-            gc.collect()
-        srd = np.asarray(sorted(srd))
-        save_pickle(srd, project_folder, 'genewalk_rand_simdists')
+        if args.reference:
+            if references and args.reference in references:
+                ref = references[args.reference]
+            else:
+                ref = ReferenceNetwork.load(
+                    get_reference_fname(args.base_folder, args.reference))
+            graph = ref.get_graph(genes, go_ontology=args.go_ontology,
+                                  go_neighborhood=args.go_neighborhood,
+                                  annotate_ancestors=args.annotate_ancestors)
+            del ref
+        else:
+            MG = load_network(args.network_source, args.network_file, genes,
+                              resource_manager=rm,
+                              go_ontology=args.go_ontology,
+                              go_neighborhood=args.go_neighborhood,
+                              collapse_edges=args.collapse_edges,
+                              annotate_ancestors=args.annotate_ancestors)
+            graph = MG.to_genewalk_graph()
+            if args.network_source == 'indra':
+                fname = os.path.join(project_folder, 'node_stmts.npz')
+                logger.info('Saving into %s...' % fname)
+                MG.save_node_stmts(fname)
+            del MG
+        save_graph(graph, project_folder)
+        fname = os.path.join(project_folder, 'annotation_index.npz')
+        logger.info('Saving into %s...' % fname)
+        AnnotationIndex.from_graph(graph).save(fname)
+
+    if args.stage in ('all', 'node_vectors', 'null_distribution'):
+        if graph is None:
+            graph = load_graph(project_folder)
+        nreps_graph = args.nreps_graph \
+            if args.stage in ('all', 'node_vectors') else 0
+        nreps_null = args.nreps_null \
+            if args.stage in ('all', 'null_distribution') else 0
+        # With a random seed, the repeats run one after another from the
+        # seeded random number generator
+        srd = run_replicates(project_folder, graph, nreps_graph, nreps_null,
+                             nproc=args.nproc,
+                             memory_budget=args.memory_budget,
+                             save_dw=args.save_dw,
+                             sequential=bool(args.random_seed))
+        if args.stage != 'node_vectors':
+            srd = np.asarray(sorted(srd))
+            save_pickle(srd, project_folder, 'genewalk_rand_simdists')
+        del srd
 
     if args.stage in ('all', 'statistics'):
-        MG = load_pickle(project_folder, 'multi_graph')
+        # The annotation index is all the statistics need from the graph,
+        # fall back to the full graph for projects that predate it
+        fname = os.path.join(project_folder, 'annotation_index.npz')
+        if os.path.exists(fname):
+            logger.info('Loading %s...' % fname)
+            MG = AnnotationIndex.load(fname)
+        else:
+            MG = graph if graph is not None else load_graph(project_folder)
         genes = load_pickle(project_folder, 'genes')
-        nvs = [load_pickle(project_folder,
-                           'deepwalk_node_vectors_%d' % (i + 1))
-               for i in range(args.nreps_graph)]
-        null_dist = load_pickle(project_folder, 'genewalk_rand_simdists')
-        GW = GeneWalk(MG, genes, nvs, null_dist)
-        df = GW.generate_output(alpha_fdr=args.alpha_fdr,
-                                base_id_type=args.id_type)
+        if args.gene_subset:
+            genes = filter_genes(genes, args.gene_subset, args.id_type)
+        nv_prefixes = ['deepwalk_node_vectors_%d' % (i + 1)
+                       for i in range(args.nreps_graph)]
+        if args.stats_chunk_size:
+            # Streamed output keeps no per-pair statistics in memory, so
+            # they are neither loaded nor saved
+            GW = GeneWalk(MG, genes, *load_node_vectors(project_folder,
+                                                        nv_prefixes),
+                          cache_pair_stats=False)
+        else:
+            GW = get_cached_genewalk(project_folder, MG, genes, nv_prefixes)
         fname = os.path.join(project_folder, 'genewalk_results.csv')
-        logger.info('Saving final results into %s' % fname)
-        df.to_csv(fname, index=False, float_format='%.3e')
+        if args.stats_chunk_size:
+            logger.info('Streaming final results into %s' % fname)
+            GW.write_output(fname, alpha_fdr=args.alpha_fdr,
+                            base_id_type=args.id_type,
+                            chunk_size=args.stats_chunk_size)
+        else:
+            df = GW.generate_output(alpha_fdr=args.alpha_fdr,
+                                    base_id_type=args.id_type)
+            logger.info('Saving final results into %s' % fname)
+            df.to_csv(fname, index=False, float_format='%.3e')
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -11,6 +11,7 @@ import functools
 import networkx as nx
 import multiprocessing
 from gensim.models import Word2Vec
+from genewalk.graph import GeneWalkGraph
 
 
 logger = logging.getLogger('genewalk.deepwalk')
@@ -21,12 +22,12 @@ default_niter = 100
 
 class DeepWalk(object):
     """Perform DeepWalk (node2vec), i.e., unbiased random walk over nodes
-    on an undirected networkx MultiGraph.
+    on an undirected GeneWalkGraph or networkx MultiGraph.
 
     Parameters
     ----------
-    graph : networkx.MultiGraph
-        A networkx multigraph to be used as the basis for DeepWalk.
+    graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
+        A graph to be used as the basis for DeepWalk.
     walk_length : Optional[int]
         The length of each random walk on the graph. Default: 10
     niter : Optional[int]
@@ -146,7 +147,7 @@ def run_single_walk(start_node, graph, length):
 
     Parameters
     ----------
-    graph : networks.MultiGraph
+    graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
         The graph on which the random walk is to be run.
     start_node : str
         The identifier of the node from which the random walk starts.
@@ -159,6 +160,8 @@ def run_single_walk(start_node, graph, length):
         A path of the given length, with each element corresponding to a node
         along the path.
     """
+    if isinstance(graph, GeneWalkGraph):
+        return graph.random_walk(start_node, length)
     path = [start_node]
     for i in range(1, length):
         start_node = random.choice(list(graph[start_node]))
@@ -180,7 +183,7 @@ def run_walks_for_node(node, graph, niter, walk_length):
     ----------
     node : str
         The identifier of the node from which the walks start.
-    graph : networks.MultiGraph
+    graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
         The graph on which the random walks are to be run.
     niter : int
         The number of iterations to run for gene nodes.
@@ -199,12 +202,49 @@ def run_walks_for_node(node, graph, niter, walk_length):
     return walks
 
 
+def estimate_walks_memory(graph, walk_length=default_walk_length,
+                          niter=default_niter, size=8):
+    """Return a rough estimate of the memory in bytes taken by a DeepWalk
+    run on a graph: its random walks, which dominate its memory usage, and
+    its Word2Vec model.
+
+    Parameters
+    ----------
+    graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
+        The graph on which the random walks are run.
+    walk_length : Optional[int]
+        The length of each random walk. Default: 10
+    niter : Optional[int]
+        The number of walks started per neighbor of each node. Default: 100
+    size : Optional[int]
+        The dimensionality of the node vectors. Default: 8
+
+    Returns
+    -------
+    int
+        The estimated number of bytes.
+    """
+    # As many walks start from each node as it has distinct neighbors
+    # times niter, see run_walks_for_node
+    if isinstance(graph, GeneWalkGraph):
+        nneighbors = len(graph.indices)
+    else:
+        nneighbors = sum(len(neighbors) for _, neighbors in graph.adjacency())
+    # Each walk is a list of references to the interned node names
+    walks_memory = niter * nneighbors * (walk_length * 8 + 72)
+    # Each node has a vocabulary entry, input and output (negative
+    # sampling) float32 vectors, and a lock factor and noise distribution
+    # entry in the model
+    model_memory = graph.number_of_nodes() * (300 + size * 4 * 2 + 8)
+    return walks_memory + model_memory
+
+
 def run_walks(graph, **kwargs):
     """Run random walks and get node vectors on a given graph.
 
     Parameters
     ----------
-    graph : networkx.MultiGraph
+    graph : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
         The graph on which random walks are going to be run and node vectors
         calculated.
     **kwargs
@@ -0,0 +1,265 @@
+"""This module implements an array-based index of the gene-gene edges of an
+interaction network given in simple interaction format (SIF), such as the
+Pathway Commons network. The index allows extracting the subnetwork induced
+by a list of genes in time proportional to the number of edges of these genes,
+without loading the full network into a networkx graph."""
+import logging
+import numpy as np
+import pandas as pd
+from genewalk.go_index import pack_strings, unpack_strings
+
+logger = logging.getLogger('genewalk.edge_index')
+
+
+class EdgeIndex(object):
+    """Index of the edges of an interaction network.
+
+    Node names are interned as integers in the order of their first
+    appearance in the network file and edges are kept in the order of the
+    file. The edges incident to the node at position i in nodes are
+    node_edges[indptr[i]:indptr[i+1]], sorted by edge position.
+
+    Parameters
+    ----------
+    nodes : list of str
+        The names of the nodes of the network.
+    sources : np.array
+        The positions of the source nodes of the edges.
+    targets : np.array
+        The positions of the target nodes of the edges.
+    rel_type_codes : np.array
+        The codes of the relationship types of the edges.
+    rel_types : list of str
+        The relationship types that rel_type_codes refer to.
+    indptr : np.array
+        Row pointers of the node to incident edge CSR matrix.
+    node_edges : np.array
+        Positions of the edges incident to each node.
+    """
+    def __init__(self, nodes, sources, targets, rel_type_codes, rel_types,
+                 indptr, node_edges):
+        self.nodes = nodes
+        self.sources = sources
+        self.targets = targets
+        self.rel_type_codes = rel_type_codes
+        self.rel_types = rel_types
+        self.indptr = indptr
+        self.node_edges = node_edges
+        self.node_pos = {node: i for i, node in enumerate(self.nodes)}
+
+    @classmethod
+    def from_sif(cls, fname, chunk_size=1000000):
+        """Return the edge index of a SIF file.
+
+        Parameters
+        ----------
+        fname : str
+            The path to a headerless, tab-separated SIF file with source,
+            relationship type and target columns.
+        chunk_size : Optional[int]
+            The number of lines of the file to parse at a time.
+            Default: 1000000
+
+        Returns
+        -------
+        EdgeIndex
+            The edge index of the network in the file.
+        """
+        nodes, sources, targets, rel_type_codes, rel_types = read_edges(
+            fname, chunk_size=chunk_size)
+        indptr, node_edges = _get_incident_edges(sources, targets,
+                                                 len(nodes))
+        logger.info('Indexed %d edges between %d nodes from %s' %
+                    (len(sources), len(nodes), fname))
+        return cls(nodes, sources, targets, rel_type_codes, rel_types,
+                   indptr, node_edges)
+
+    def to_arrays(self):
+        """Return the arrays of the index as a dict."""
+        nodes, node_offsets = pack_strings(self.nodes)
+        rel_types, rel_type_offsets = pack_strings(self.rel_types)
+        return {'nodes': nodes, 'node_offsets': node_offsets,
+                'sources': self.sources, 'targets': self.targets,
+                'rel_type_codes': self.rel_type_codes,
+                'rel_types': rel_types, 'rel_type_offsets': rel_type_offsets,
+                'indptr': self.indptr, 'node_edges': self.node_edges}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Return an index from the arrays returned by to_arrays."""
+        return cls(nodes=unpack_strings(arrays['nodes'],
+                                        arrays['node_offsets']),
+                   sources=arrays['sources'], targets=arrays['targets'],
+                   rel_type_codes=arrays['rel_type_codes'],
+                   rel_types=unpack_strings(arrays['rel_types'],
+                                            arrays['rel_type_offsets']),
+                   indptr=arrays['indptr'], node_edges=arrays['node_edges'])
+
+    def __contains__(self, node):
+        return node in self.node_pos
+
+    def get_subgraph_edges(self, nodes):
+        """Return the positions of the edges of the subnetwork induced by a
+        set of nodes, in the order of the network file.
+
+        Parameters
+        ----------
+        nodes : iterable of str
+            The names of the nodes. Names that are not in the network are
+            ignored.
+
+        Returns
+        -------
+        np.array
+            The positions of the edges between the nodes.
+        """
+        pos = np.array(sorted({self.node_pos[n] for n in nodes
+                               if n in self.node_pos}), dtype=np.int64)
+        if not len(pos):
+            return np.array([], dtype=np.int64)
+        in_subgraph = np.zeros(len(self.nodes), dtype=bool)
+        in_subgraph[pos] = True
+        edges = np.concatenate([self.node_edges[self.indptr[i]:
+                                                self.indptr[i + 1]]
+                                for i in pos])
+        edges = edges[in_subgraph[self.sources[edges]] &
+                      in_subgraph[self.targets[edges]]]
+        return np.unique(edges)
+
+    def get_subgraph(self, nodes):
+        """Return the subnetwork induced by a set of nodes.
+
+        Parameters
+        ----------
+        nodes : iterable of str
+            The names of the nodes. Names that are not in the network are
+            ignored.
+
+        Returns
+        -------
+        node_names : list of str
+            The names of the nodes with at least one edge in the
+            subnetwork, in the order of their first appearance in the
+            network file.
+        edges : list of tuple
+            The (source, target, relationship type) of each edge of the
+            subnetwork, in the order of the network file.
+        """
+        edges = self.get_subgraph_edges(nodes)
+        sources = self.sources[edges]
+        targets = self.targets[edges]
+        node_names = [self.nodes[i] for i in
+                      np.unique(np.concatenate([sources, targets]))]
+        edges = [(self.nodes[s], self.nodes[t], self.rel_types[r])
+                 for s, t, r in zip(sources, targets,
+                                    self.rel_type_codes[edges])]
+        return node_names, edges
+
+
+def read_edges(fname, source_col=0, target_col=2, rel_type_col=1, sep='\t',
+               chunk_size=1000000):
+    """Return the edges of a headerless network file, read in chunks.
+
+    Node names are interned as integers in the order of their first
+    appearance in the file, source before target, so that only the edge
+    arrays and the distinct names are kept in memory. Lines without a source
+    or target node are skipped.
+
+    Parameters
+    ----------
+    fname : str
+        The path to the network file, which is read as gzip-compressed if
+        its name ends with .gz.
+    source_col : Optional[int]
+        The column of the source nodes. Default: 0
+    target_col : Optional[int]
+        The column of the target nodes. Default: 2
+    rel_type_col : Optional[int]
+        The column of the relationship types, or None if the file has no
+        such column. Lines without a relationship type get an empty one,
+        and files in which no line has the column are read without
+        relationship types. Default: 1
+    sep : Optional[str]
+        The column separator. Default: tab
+    chunk_size : Optional[int]
+        The number of lines of the file to parse at a time.
+        Default: 1000000
+
+    Returns
+    -------
+    nodes : list of str
+        The names of the nodes.
+    sources : np.array
+        The positions of the source nodes of the edges.
+    targets : np.array
+        The positions of the target nodes of the edges.
+    rel_type_codes : np.array or None
+        The codes of the relationship types of the edges, or None if the
+        file has no relationship types.
+    rel_types : list of str
+        The relationship types that rel_type_codes refer to.
+    """
+    node_pos = {}
+    rel_type_pos = {}
+    sources, targets, rel_type_codes = [], [], []
+    nskipped = 0
+    has_rel_types = False
+    for chunk in pd.read_csv(fname, sep=sep, dtype=str, header=None,
+                             chunksize=chunk_size):
+        # Lines without a source or target node do not define an edge
+        if target_col in chunk.columns:
+            missing = chunk[source_col].isna() | chunk[target_col].isna()
+        else:
+            missing = pd.Series(True, index=chunk.index)
+        if missing.any():
+            nskipped += int(missing.sum())
+            chunk = chunk[~missing]
+            if chunk.empty:
+                continue
+        # Intern node names in the order they appear in the file, source
+        # before target
+        endpoints = np.column_stack([chunk[source_col].to_numpy(),
+                                     chunk[target_col].to_numpy()]).ravel()
+        codes, uniques = pd.factorize(endpoints)
+        mapping = np.array([node_pos.setdefault(n, len(node_pos))
+                            for n in uniques], dtype=np.int32)
+        codes = mapping[codes].reshape(-1, 2)
+        sources.append(codes[:, 0])
+        targets.append(codes[:, 1])
+        if rel_type_col is None:
+            continue
+        # Lines without a relationship type get an empty one, also if none
+        # of the lines of the chunk have the column
+        if rel_type_col in chunk.columns:
+            has_rel_types = True
+            rel_types = chunk[rel_type_col].fillna('')
+        else:
+            rel_types = pd.Series('', index=chunk.index)
+        codes, uniques = pd.factorize(rel_types)
+        mapping = np.array([rel_type_pos.setdefault(r, len(rel_type_pos))
+                            for r in uniques], dtype=np.int32)
+        rel_type_codes.append(mapping[codes])
+    if nskipped:
+        logger.warning('Skipped %d lines of %s without a source or target '
+                       'node.' % (nskipped, fname))
+    sources = np.concatenate(sources) if sources else \
+        np.array([], dtype=np.int32)
+    targets = np.concatenate(targets) if targets else \
+        np.array([], dtype=np.int32)
+    if not has_rel_types:
+        return list(node_pos), sources, targets, None, []
+    return list(node_pos), sources, targets, np.concatenate(rel_type_codes), \
+        list(rel_type_pos)
+
+
+def _get_incident_edges(sources, targets, nnodes):
+    """Return the CSR matrix of the edges incident to each node, listing self
+    loops once."""
+    edge_pos = np.arange(len(sources), dtype=np.int64)
+    not_loop = sources != targets
+    endpoints = np.concatenate([sources, targets[not_loop]])
+    node_edges = np.concatenate([edge_pos, edge_pos[not_loop]])
+    order = np.lexsort((node_edges, endpoints))
+    indptr = np.zeros(nnodes + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(endpoints, minlength=nnodes))
+    return indptr, node_edges[order]
@@ -1,4 +1,9 @@
+import os
+import json
+import hashlib
 import logging
+import pandas as pd
+import indra
 from indra.databases import hgnc_client
 
 
@@ -6,8 +11,21 @@ logger = logging.getLogger('genewalk.gene_lists')
 
 # TODO: map to MGI symbols if the original genes were mouse genes
 
+# Version of the gene ID mapping, part of the key of the mapping cache
+# files together with the version of INDRA, which provides the mapping
+# tables
+gene_mapping_version = 1
 
-def read_gene_list(fname, id_type):
+# The keys of the gene references for each ID type, in order
+id_type_columns = {
+    'hgnc_symbol': ['HGNC_SYMBOL', 'HGNC', 'UP'],
+    'hgnc_id': ['HGNC_SYMBOL', 'HGNC', 'UP'],
+    'mgi_id': ['HGNC_SYMBOL', 'HGNC', 'UP', 'MGI'],
+    'ensembl_id': ['HGNC_SYMBOL', 'HGNC', 'UP', 'ENSEMBL'],
+}
+
+
+def read_gene_list(fname, id_type, unmapped_fname=None, cache_folder=None):
     """Return references for genes from a file with the given ID type.
 
     Parameters
@@ -18,6 +36,14 @@ def read_gene_list(fname, id_type):
     id_type : str
         The type of identifier contained in each line of the gene list file.
         Possible values are: hgnc_symbol, hgnc_id, ensembl_id, mgi_id.
+    unmapped_fname : Optional[str]
+        If given, the table of the IDs that could not be mapped (see
+        map_gene_ids) is saved into this CSV file.
+    cache_folder : Optional[str]
+        If given, the mapped references are cached in the gene_refs
+        subfolder of this folder, keyed by the hash of the file, the ID
+        type and the version of the mapping, and the mapping is skipped if
+        a cache file exists.
 
     Returns
     -------
@@ -26,24 +52,27 @@ def read_gene_list(fname, id_type):
         and if id_type is mgi_id, MGI, with values corresponding to the
         identifiers of the provided list of genes.
     """
-    with open(fname, 'r') as fh:
-        # This is to make the list unique while preserving
-        # the original order as much as possible
-        unique_lines = []
-        for line in fh.readlines():
-            line = line.strip()
-            if line not in unique_lines:
-                unique_lines.append(line)
-    if id_type == 'hgnc_symbol':
-        refs = map_hgnc_symbols(unique_lines)
-    elif id_type == 'hgnc_id':
-        refs = map_hgnc_ids(unique_lines)
-    elif id_type == 'ensembl_id':
-        refs = map_ensembl_ids(unique_lines)
-    elif id_type == 'mgi_id':
-        refs = map_mgi_ids(unique_lines)
+    cache_fname = get_gene_refs_cache_fname(cache_folder, fname, id_type) \
+        if cache_folder else None
+    if cache_fname and os.path.exists(cache_fname):
+        logger.info('Loading the mapped genes of %s from the cache %s' %
+                    (fname, cache_fname))
+        with open(cache_fname, 'r') as fh:
+            cache = json.load(fh)
+        refs = cache['refs']
+        unmapped = pd.DataFrame(cache['unmapped'],
+                                columns=['gene_id', 'id_type', 'reason'])
     else:
-        raise ValueError('Unknown id_type: %s' % id_type)
+        with open(fname, 'r') as fh:
+            # This is to make the list unique while preserving the original
+            # order
+            unique_lines = list(dict.fromkeys(line.strip() for line in fh
+                                              if line.strip()))
+        refs, unmapped = map_gene_ids(unique_lines, id_type)
+        if cache_fname:
+            save_gene_refs_cache(cache_fname, refs, unmapped)
+    if unmapped_fname:
+        unmapped.to_csv(unmapped_fname, index=False)
     if not refs:
         raise ValueError('None of the IDs in %s could be mapped. It is '
                          'likely that the file uses an ID type or format '
@@ -51,103 +80,135 @@ def read_gene_list(fname, id_type):
     return refs
 
 
+def get_gene_refs_cache_fname(cache_folder, fname, id_type):
+    """Return the path of the mapping cache file of a gene list file."""
+    sha = hashlib.sha256()
+    with open(fname, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            sha.update(block)
+    version_key = json.dumps({'version': gene_mapping_version,
+                              'indra_version': indra.__version__},
+                             sort_keys=True)
+    version_key = \
+        hashlib.sha256(version_key.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cache_folder, 'gene_refs', '%s_%s_%s.json' %
+                        (id_type, sha.hexdigest()[:16], version_key))
+
+
+def save_gene_refs_cache(cache_fname, refs, unmapped):
+    """Save mapped gene references and the unmapped IDs into a mapping
+    cache file."""
+    os.makedirs(os.path.dirname(cache_fname), exist_ok=True)
+    # Concurrent jobs may save the same cache file
+    tmp_fname = '%s.%d.tmp' % (cache_fname, os.getpid())
+    with open(tmp_fname, 'w') as fh:
+        json.dump({'refs': refs,
+                   'unmapped': unmapped.values.tolist()}, fh)
+    os.replace(tmp_fname, cache_fname)
+
+
+def map_gene_ids(gene_ids, id_type):
+    """Return references based on a list of gene IDs of a given type.
+
+    Each distinct ID is looked up once, and the IDs that cannot be mapped
+    are reported in a single summary instead of one warning each.
+
+    Parameters
+    ----------
+    gene_ids : list of str
+        The gene IDs.
+    id_type : str
+        The type of the IDs: hgnc_symbol, hgnc_id, ensembl_id or mgi_id.
+
+    Returns
+    -------
+    refs : list of dict
+        The references of the genes that could be mapped to an HGNC
+        symbol, HGNC ID and UniProt ID, in the order of the IDs.
+    unmapped : pandas.DataFrame
+        The IDs that could not be mapped, with the step at which they
+        failed in the reason column.
+    """
+    if id_type not in id_type_columns:
+        raise ValueError('Unknown id_type: %s' % id_type)
+    columns = id_type_columns[id_type]
+    df = pd.DataFrame({'gene_id': pd.Series(gene_ids, dtype=object)})
+    df['reason'] = None
+    if id_type == 'hgnc_symbol':
+        df['HGNC_SYMBOL'] = df['gene_id']
+        _map_column(df, 'HGNC_SYMBOL', 'HGNC', hgnc_client.get_hgnc_id,
+                    'no HGNC ID')
+    else:
+        if id_type == 'hgnc_id':
+            df['HGNC'] = _strip_prefix(df['gene_id'], 'HGNC:')
+        elif id_type == 'mgi_id':
+            df['MGI'] = _strip_prefix(df['gene_id'], 'MGI:')
+            _map_column(df, 'MGI', 'HGNC', hgnc_client.get_hgnc_from_mouse,
+                        'no HGNC ID')
+        elif id_type == 'ensembl_id':
+            df['ENSEMBL'] = df['gene_id']
+            # Version suffixes are ignored
+            _map_column(df, 'ENSEMBL', 'HGNC',
+                        lambda ensembl_id: hgnc_client.get_hgnc_from_ensembl(
+                            ensembl_id.split('.', maxsplit=1)[0]),
+                        'no HGNC ID')
+        _map_column(df, 'HGNC', 'HGNC_SYMBOL', hgnc_client.get_hgnc_name,
+                    'no HGNC symbol')
+    _map_column(df, 'HGNC', 'UP', hgnc_client.get_uniprot_id,
+                'no UniProt ID')
+    mapped = df['reason'].isna()
+    refs = df.loc[mapped, columns].to_dict('records')
+    unmapped = df.loc[~mapped, ['gene_id', 'reason']]
+    unmapped.insert(1, 'id_type', id_type)
+    log_unmapped(unmapped, len(df))
+    return refs, unmapped.reset_index(drop=True)
+
+
+def _strip_prefix(ids, prefix):
+    return ids.where(~ids.str.startswith(prefix), ids.str[len(prefix):])
+
+
+def _map_column(df, source, target, lookup, reason):
+    """Map the source column of the rows mapped so far into the target
+    column, calling lookup once per distinct value, and record the reason
+    of the rows that fail."""
+    todo = df['reason'].isna()
+    values = df.loc[todo, source]
+    table = {value: lookup(value) for value in values.unique()}
+    df[target] = None
+    df.loc[todo, target] = values.map(table)
+    df.loc[todo & ~df[target].fillna('').astype(bool), 'reason'] = reason
+
+
+def log_unmapped(unmapped, ngenes):
+    """Log a summary of the IDs that could not be mapped."""
+    if unmapped.empty:
+        logger.info('Mapped all %d gene IDs.' % ngenes)
+        return
+    logger.warning('Could not map %d of %d gene IDs:' %
+                   (len(unmapped), ngenes))
+    for reason, ids in unmapped.groupby('reason', sort=False)['gene_id']:
+        examples = ', '.join(ids[:5])
+        logger.warning('  %s: %d (%s%s)' %
+                       (reason, len(ids), examples,
+                        ', ...' if len(ids) > 5 else ''))
+
+
 def map_hgnc_symbols(hgnc_symbols):
     """Return references based on a list of HGNC symbols."""
-    refs = []
-    for hgnc_symbol in hgnc_symbols:
-        ref = {'HGNC_SYMBOL': hgnc_symbol, 'HGNC': None, 'UP': None}
-        hgnc_id = hgnc_client.get_hgnc_id(hgnc_symbol)
-        if not hgnc_id:
-            logger.warning('Could not get HGNC ID for symbol %s' % hgnc_symbol)
-            continue
-        ref['HGNC'] = hgnc_id
-        uniprot_id = hgnc_client.get_uniprot_id(hgnc_id)
-        if not uniprot_id:
-            logger.warning('Could not get UniProt ID for symbol %s' %
-                           hgnc_symbol)
-            continue
-        ref['UP'] = uniprot_id
-        refs.append(ref)
-    return refs
+    return map_gene_ids(hgnc_symbols, 'hgnc_symbol')[0]
 
 
 def map_hgnc_ids(hgnc_ids):
     """Return references based on a list of HGNC IDs."""
-    refs = []
-    for hgnc_id in hgnc_ids:
-        if hgnc_id.startswith('HGNC:'):
-            hgnc_id = hgnc_id[5:]
-        ref = {'HGNC_SYMBOL': None, 'HGNC': hgnc_id, 'UP': None}
-        hgnc_name = hgnc_client.get_hgnc_name(hgnc_id)
-        if not hgnc_name:
-            logger.warning('Could not get HGNC name for ID %s' %
-                           hgnc_id)
-            continue
-        ref['HGNC_SYMBOL'] = hgnc_name
-        uniprot_id = hgnc_client.get_uniprot_id(hgnc_id)
-        if not uniprot_id:
-            logger.warning('Could not get UniProt ID for HGNC ID %s' %
-                           hgnc_id)
-            continue
-        ref['UP'] = uniprot_id
-        refs.append(ref)
-    return refs
+    return map_gene_ids(hgnc_ids, 'hgnc_id')[0]
 
 
 def map_mgi_ids(mgi_ids):
     """Return references based on a list of MGI IDs."""
-    refs = []
-    for mgi_id in mgi_ids:
-        if mgi_id.startswith('MGI:'):
-            mgi_id = mgi_id[4:]
-        ref = {'HGNC_SYMBOL': None, 'HGNC': None, 'UP': None,
-               'MGI': mgi_id}
-        hgnc_id = hgnc_client.get_hgnc_from_mouse(mgi_id)
-        if not hgnc_id:
-            logger.warning('Could not get HGNC ID for MGI ID %s' %
-                           mgi_id)
-            continue
-        ref['HGNC'] = hgnc_id
-        hgnc_name = hgnc_client.get_hgnc_name(hgnc_id)
-        if not hgnc_name:
-            logger.warning('Could not get HGNC name for ID %s' %
-                           hgnc_id)
-            continue
-        ref['HGNC_SYMBOL'] = hgnc_name
-        uniprot_id = hgnc_client.get_uniprot_id(hgnc_id)
-        if not uniprot_id:
-            logger.warning('Could not get UniProt ID for HGNC ID %s' %
-                           hgnc_id)
-            continue
-        ref['UP'] = uniprot_id
-        refs.append(ref)
-    return refs
+    return map_gene_ids(mgi_ids, 'mgi_id')[0]
 
 
 def map_ensembl_ids(ensembl_ids):
     """Return references based on a list of Ensembl IDs."""
-    refs = []
-    for ensembl_id in ensembl_ids:
-        ref = {'HGNC_SYMBOL': None, 'HGNC': None, 'UP': None,
-               'ENSEMBL': ensembl_id}
-        ensembl_id = ensembl_id.split('.', maxsplit=1)[0]
-        hgnc_id = hgnc_client.get_hgnc_from_ensembl(ensembl_id)
-        if not hgnc_id:
-            logger.warning('Could not get HGNC ID for ENSEMBL ID %s' %
-                           ensembl_id)
-            continue
-        ref['HGNC'] = hgnc_id
-        hgnc_name = hgnc_client.get_hgnc_name(hgnc_id)
-        if not hgnc_name:
-            logger.warning('Could not get HGNC name for ID %s' %
-                           hgnc_id)
-            continue
-        ref['HGNC_SYMBOL'] = hgnc_name
-        uniprot_id = hgnc_client.get_uniprot_id(hgnc_id)
-        if not uniprot_id:
-            logger.warning('Could not get UniProt ID for HGNC ID %s' %
-                           hgnc_id)
-            continue
-        ref['UP'] = uniprot_id
-        refs.append(ref)
-    return refs
+    return map_gene_ids(ensembl_ids, 'ensembl_id')[0]
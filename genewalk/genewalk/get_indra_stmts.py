@@ -5,11 +5,19 @@ and familiex/complexes of interest, as well as targeted biological processes.
 It downloads the relevant Statement objects for reference and dumps them into
 a pickle file.
 """
+import os
+import json
+import time
 import pandas
 import pickle
+import sqlite3
 import logging
 import argparse
+import functools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from indra.util import batch_iter
+from indra.statements import stmt_from_json
 from indra.databases import go_client
 from indra.sources import indra_db_rest
 from indra.databases import hgnc_client
@@ -60,15 +68,181 @@ def load_indra_df(fname):
     return df
 
 
-def dump_pickle(stmts, fname):
-    """Dump a list of Statements into a picke file."""
+class IndraStatementFrame(object):
+    """INDRA Statement data frame with categorical agent columns and indexes
+    of the rows of each agent.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A flat INDRA Statement data frame with agA_ns, agA_id, agB_ns and
+        agB_id columns.
+
+    Attributes
+    ----------
+    df : pandas.DataFrame
+        The data frame, with categorical agent columns.
+    source_index : dict
+        The positions of the rows of each (agA_ns, agA_id) agent.
+    target_index : dict
+        The positions of the rows of each (agB_ns, agB_id) agent.
+    source_ns_index : dict
+        The positions of the rows of each agA_ns namespace.
+    target_ns_index : dict
+        The positions of the rows of each agB_ns namespace.
+    """
+    agent_columns = ['agA_ns', 'agA_id', 'agA_name',
+                     'agB_ns', 'agB_id', 'agB_name']
+
+    def __init__(self, df):
+        self.df = df.astype({col: 'category' for col in self.agent_columns
+                             if col in df.columns})
+        self.source_index = self.df.groupby(['agA_ns', 'agA_id'],
+                                            observed=True).indices
+        self.target_index = self.df.groupby(['agB_ns', 'agB_id'],
+                                            observed=True).indices
+        self.source_ns_index = self.df.groupby('agA_ns',
+                                               observed=True).indices
+        self.target_ns_index = self.df.groupby('agB_ns',
+                                               observed=True).indices
+
+    def __len__(self):
+        return len(self.df)
+
+    def filter_to_genes(self, genes, fplx_terms):
+        """Return the rows of the data frame whose source is a gene or
+        FamPlex term of interest and whose target is a gene or FamPlex term
+        of interest or a GO term, see filter_to_genes."""
+        agents = [('HGNC', g) for g in genes] + \
+            [('FPLX', t) for t in fplx_terms]
+        sources = self._get_rows(self.source_index, agents)
+        targets = np.union1d(
+            self._get_rows(self.target_index, agents),
+            self._get_rows(self.target_ns_index, ['GO']))
+        return self.df.iloc[np.intersect1d(sources, targets)]
+
+    def get_famplex_appearing(self):
+        """Return the names of the genes and the IDs of the FamPlex terms
+        appearing as agents, see get_famplex_links."""
+        genes_appearing = set()
+        for ns_index, column in ((self.source_ns_index, 'agA_name'),
+                                 (self.target_ns_index, 'agB_name')):
+            if 'HGNC' not in ns_index:
+                continue
+            names = self.df[column]
+            codes = np.unique(names.cat.codes.to_numpy()[ns_index['HGNC']])
+            genes_appearing |= set(names.cat.categories[codes[codes >= 0]])
+        fplx_appearing = {agent_id for index in (self.source_index,
+                                                 self.target_index)
+                          for ns, agent_id in index if ns == 'FPLX'}
+        return genes_appearing, fplx_appearing
+
+    @staticmethod
+    def _get_rows(index, keys):
+        rows = [index[key] for key in keys if key in index]
+        return np.unique(np.concatenate(rows)) if rows else \
+            np.array([], dtype=np.int64)
+
+
+def load_indra_frame(fname, indexed_fname=None):
+    """Return the indexed INDRA Statement frame of a pickled data frame.
+
+    Parameters
+    ----------
+    fname : str
+        The path to the pickled INDRA Statement data frame.
+    indexed_fname : Optional[str]
+        If given, the path to a pickle file of the indexed frame, which is
+        loaded if it exists and saved otherwise, so that the data frame is
+        only indexed once.
+
+    Returns
+    -------
+    IndraStatementFrame
+        The indexed INDRA Statement frame.
+    """
+    if indexed_fname and os.path.exists(indexed_fname):
+        with open(indexed_fname, 'rb') as fh:
+            frame = pickle.load(fh)
+        logger.info('Loaded %d indexed rows from %s' %
+                    (len(frame), indexed_fname))
+        return frame
+    frame = IndraStatementFrame(load_indra_df(fname))
+    if indexed_fname:
+        with open(indexed_fname, 'wb') as fh:
+            pickle.dump(frame, fh)
+        logger.info('Saved the indexed rows into %s' % indexed_fname)
+    return frame
+
+
+def dump_pickle(stmts, fname, chunk_size=None):
+    """Dump a list of Statements into a picke file.
+
+    If chunk_size is given, the Statements are dumped as consecutive pickled
+    lists of at most chunk_size Statements, which iter_statements reads one
+    chunk at a time.
+    """
     with open(fname, 'wb') as fh:
-        pickle.dump(stmts, fh)
+        if chunk_size:
+            for chunk in batch_iter(stmts, chunk_size):
+                pickle.dump(list(chunk), fh)
+        else:
+            pickle.dump(stmts, fh)
+    logger.info('Dumped %d statements into %s' % (len(stmts), fname))
+
+
+def dump_jsonl(stmts, fname):
+    """Dump a list of Statements into a file with the JSON of one Statement
+    per line."""
+    with open(fname, 'w') as fh:
+        for stmt in stmts:
+            fh.write(json.dumps(stmt.to_json()) + '\n')
     logger.info('Dumped %d statements into %s' % (len(stmts), fname))
 
 
+def iter_statements(fname):
+    """Iterate over the Statements of a file without loading them all.
+
+    Parameters
+    ----------
+    fname : str
+        The path to a file written by dump_jsonl (if its name ends with
+        .jsonl) or by dump_pickle, with or without chunks. A pickle file
+        without chunks is loaded at once.
+
+    Yields
+    ------
+    indra.statements.Statement
+        The Statements of the file, in order. No reference to a Statement is
+        kept after it is yielded.
+    """
+    if fname.endswith('.jsonl'):
+        with open(fname, 'r') as fh:
+            for line in fh:
+                if line.strip():
+                    yield stmt_from_json(json.loads(line))
+        return
+    with open(fname, 'rb') as fh:
+        while True:
+            try:
+                chunk = pickle.load(fh)
+            except EOFError:
+                break
+            chunk.reverse()
+            while chunk:
+                yield chunk.pop()
+
+
 def filter_to_genes(df, genes, fplx_terms):
-    """Filter a data frame of INDRA Statements given gene and FamPlex IDs."""
+    """Filter a data frame of INDRA Statements given gene and FamPlex IDs.
+
+    If df is an IndraStatementFrame, the rows are selected with its agent
+    indexes instead of scanning the whole data frame.
+    """
+    if isinstance(df, IndraStatementFrame):
+        df = df.filter_to_genes(genes, fplx_terms)
+        logger.info('Filtered data frame to %d rows.' % len(df))
+        return df
     # Look for sources that are in the gene list or whose families/complexes
     # are in the FamPlex term list
     source_filter = (((df.agA_ns == 'HGNC') & (df.agA_id.isin(genes))) |
@@ -85,11 +259,17 @@ def filter_to_genes(df, genes, fplx_terms):
 
 
 def get_gene_parents(hgnc_id):
+    return list(_get_parents('HGNC', hgnc_id))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_parents(ns, entity_id):
+    """Return the IDs of the parents of an entity in the entity hierarchy,
+    memoized since the same genes and FamPlex terms are looked up many
+    times."""
     eh = hierarchies['entity']
-    gene_uri = eh.get_uri('HGNC', hgnc_id)
-    parents = eh.get_parents(gene_uri)
-    parent_ids = [eh.ns_id_from_uri(par_uri)[1] for par_uri in parents]
-    return parent_ids
+    parents = eh.get_parents(eh.get_uri(ns, entity_id))
+    return tuple(eh.ns_id_from_uri(par_uri)[1] for par_uri in parents)
 
 
 def get_famplex_terms(genes):
@@ -104,11 +284,18 @@ def get_famplex_terms(genes):
 
 
 def get_famplex_links(df, fname):
-    """Given a list of INDRA Statements, construct FamPlex links."""
-    genes_appearing = (set(df[df.agA_ns == 'HGNC'].agA_name) |
-                       set(df[df.agB_ns == 'HGNC'].agB_name))
-    fplx_appearing = (set(df[df.agA_ns == 'FPLX'].agA_id) |
-                      set(df[df.agB_ns == 'FPLX'].agB_id))
+    """Given a list of INDRA Statements, construct FamPlex links.
+
+    If df is an IndraStatementFrame, the agents are taken from its indexes
+    instead of scanning the whole data frame.
+    """
+    if isinstance(df, IndraStatementFrame):
+        genes_appearing, fplx_appearing = df.get_famplex_appearing()
+    else:
+        genes_appearing = (set(df[df.agA_ns == 'HGNC'].agA_name) |
+                           set(df[df.agB_ns == 'HGNC'].agB_name))
+        fplx_appearing = (set(df[df.agA_ns == 'FPLX'].agA_id) |
+                          set(df[df.agB_ns == 'FPLX'].agB_id))
     links = get_famplex_links_from_lists(genes_appearing, fplx_appearing)
     with open(fname, 'w') as fh:
         for link in links:
@@ -122,40 +309,172 @@ def get_famplex_links_from_stmts(stmts):
         agents = [a for a in stmt.agent_list() if a is not None]
         if len(agents) < 2:
             continue
-        for agent in agents:
-            if 'HGNC' in agent.db_refs:
-                genes_appearing.add(agent.name)
-            elif 'FPLX' in agent.db_refs:
-                fplx_appearing.add(agent.name)
+        add_famplex_appearing(agents, genes_appearing, fplx_appearing)
     return get_famplex_links_from_lists(genes_appearing, fplx_appearing)
 
 
+def add_famplex_appearing(agents, genes_appearing, fplx_appearing):
+    """Add the names of the gene and FamPlex agents of a Statement to the
+    sets of genes and FamPlex entities appearing in Statements."""
+    for agent in agents:
+        if 'HGNC' in agent.db_refs:
+            genes_appearing.add(agent.name)
+        elif 'FPLX' in agent.db_refs:
+            fplx_appearing.add(agent.name)
+
+
 def get_famplex_links_from_lists(genes_appearing, fplx_appearing):
     links = []
     for gene in genes_appearing:
         parent_ids = get_gene_parents(gene)
         parents_appearing = fplx_appearing & set(parent_ids)
         links += [(gene, parent) for parent in parents_appearing]
-    eh = hierarchies['entity']
     for fplx_child in fplx_appearing:
-        fplx_uri = eh.get_uri('FPLX', fplx_child)
-        parents = eh.get_parents(fplx_uri)
-        parent_ids = [eh.ns_id_from_uri(par_uri)[1] for par_uri in parents]
+        parent_ids = _get_parents('FPLX', fplx_child)
         parents_appearing = fplx_appearing & set(parent_ids)
         links += [(fplx_child, parent) for parent in parents_appearing]
     return links
 
 
-def download_statements(df, ev_limit=5):
+def download_statements(df, ev_limit=5, cache_fname=None, nthreads=4,
+                        batch_size=500, retries=3, backoff=1.0, fetch=None):
     """Download the INDRA Statements corresponding to entries in a data frame.
+
+    Batches of Statements are fetched concurrently, and batches that fail
+    are retried with exponential backoff.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A data frame of INDRA Statements with a hash column.
+    ev_limit : Optional[int]
+        The maximum number of evidences per Statement. Default: 5
+    cache_fname : Optional[str]
+        If given, the path to a StatementCache file. Only the Statements
+        that are not in the cache are downloaded, and they are added to it.
+    nthreads : Optional[int]
+        The maximum number of batches fetched at the same time. Default: 4
+    batch_size : Optional[int]
+        The number of Statements fetched per request. Default: 500
+    retries : Optional[int]
+        The number of times a failed batch is retried. Default: 3
+    backoff : Optional[float]
+        The number of seconds to wait before the first retry of a batch,
+        doubled at each retry. Default: 1
+    fetch : Optional[function]
+        A function returning a dict of Statements by hash given a list of
+        hashes and ev_limit. By default, the Statements are fetched from
+        the INDRA DB REST API.
+
+    Returns
+    -------
+    list[indra.statements.Statement]
+        The Statements, in the order of the data frame.
+    """
+    fetch = fetch if fetch else fetch_statements
+    hashes = list(dict.fromkeys(int(h) for h in df.hash))
+    cache = StatementCache(cache_fname) if cache_fname else None
+    try:
+        stmts_by_hash = cache.get(hashes, ev_limit) if cache else {}
+        missing = [h for h in hashes if h not in stmts_by_hash]
+        logger.info('Downloading %d of %d statements' %
+                    (len(missing), len(hashes)))
+        stmts_by_hash.update(_fetch_batches(
+            missing, ev_limit, cache, nthreads, batch_size, retries, backoff,
+            fetch))
+    finally:
+        if cache:
+            cache.close()
+    return [stmts_by_hash[h] for h in hashes if h in stmts_by_hash]
+
+
+def _fetch_batches(hashes, ev_limit, cache, nthreads, batch_size,
+                   retries, backoff, fetch):
+    """Return the Statements with the given hashes by hash, fetched in
+    concurrent batches and added to the cache, if any, see
+    download_statements."""
+    stmts_by_hash = {}
+
+    def fetch_batch(batch):
+        for attempt in range(retries + 1):
+            try:
+                return fetch(batch, ev_limit)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                wait = backoff * 2 ** attempt
+                logger.warning('Getting statement batch failed (%s), '
+                               'retrying in %.1f seconds.' % (e, wait))
+                time.sleep(wait)
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        futures = [executor.submit(fetch_batch, list(batch))
+                   for batch in batch_iter(hashes, batch_size)]
+        for idx, future in enumerate(as_completed(futures)):
+            batch_stmts = future.result()
+            logger.info('Got statement batch %d of %d' %
+                        (idx + 1, len(futures)))
+            if cache:
+                cache.add(batch_stmts, ev_limit)
+            stmts_by_hash.update(batch_stmts)
+    return stmts_by_hash
+
+
+def fetch_statements(hashes, ev_limit):
+    """Return the Statements with the given hashes from the INDRA DB REST
+    API by hash.
+
+    The Statements are keyed by their hashes in the INDRA DB, i.e. the
+    requested ones, which can differ from the hashes calculated by the
+    installed version of INDRA.
+    """
+    idbp = indra_db_rest.get_statements_by_hash(hashes, ev_limit=ev_limit)
+    return {int(stmt_hash): stmt for stmt_hash, stmt
+            in idbp.get_hash_statements_dict().items()}
+
+
+class StatementCache(object):
+    """A local cache of INDRA Statements in an SQLite file, keyed by
+    Statement hash and evidence limit.
+
+    Parameters
+    ----------
+    fname : str
+        The path to the SQLite file, created if it does not exist.
     """
-    all_stmts = []
-    for idx, group in enumerate(batch_iter(df.hash, 500)):
-        logger.info('Getting statement batch %d' % idx)
-        idbp = indra_db_rest.get_statements_by_hash(list(group),
-                                                    ev_limit=ev_limit)
-        all_stmts += idbp.statements
-    return all_stmts
+    def __init__(self, fname):
+        self.fname = fname
+        self.conn = sqlite3.connect(fname, timeout=60)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS statements '
+                          '(hash INTEGER, ev_limit INTEGER, json TEXT, '
+                          'PRIMARY KEY (hash, ev_limit))')
+        self.conn.commit()
+
+    def get(self, hashes, ev_limit):
+        """Return the cached Statements with the given hashes by hash."""
+        stmts = {}
+        for batch in batch_iter(hashes, 500):
+            batch = list(batch)
+            rows = self.conn.execute(
+                'SELECT hash, json FROM statements WHERE ev_limit = ? AND '
+                'hash IN (%s)' % ','.join('?' * len(batch)),
+                [ev_limit] + batch)
+            for stmt_hash, stmt_json in rows:
+                stmts[stmt_hash] = stmt_from_json(json.loads(stmt_json))
+        logger.info('Found %d of %d statements in %s' %
+                    (len(stmts), len(hashes), self.fname))
+        return stmts
+
+    def add(self, stmts_by_hash, ev_limit):
+        """Add Statements by hash to the cache."""
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO statements VALUES (?, ?, ?)',
+            [(stmt_hash, ev_limit, json.dumps(stmt.to_json()))
+             for stmt_hash, stmt in stmts_by_hash.items()])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
 
 
 def remap_go_ids(stmts):
@@ -174,9 +493,26 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Choose a file with a list of genes to get a SIF for.')
     parser.add_argument('--df', default='data/stmt_df.pkl')
+    parser.add_argument('--indexed_df',
+                        help='Path to a pickle file in which the indexed '
+                             'data frame is saved the first time, and '
+                             'loaded from afterwards.')
     parser.add_argument('--genes', default='data/JQ1_HGNCidForINDRA.csv')
     parser.add_argument('--mouse_genes')
     parser.add_argument('--stmts', default='data/JQ1_HGNCidForINDRA_stmts.pkl')
+    parser.add_argument('--stmt_cache',
+                        help='Path to an SQLite file in which downloaded '
+                             'Statements are cached, so that Statements '
+                             'shared with earlier gene lists are not '
+                             'downloaded again.')
+    parser.add_argument('--nthreads', type=int, default=4,
+                        help='The number of statement batches downloaded '
+                             'at the same time.')
+    parser.add_argument('--chunk_size', type=int,
+                        help='If given, the Statements are dumped in chunks '
+                             'of this size, which GeneWalk reads one at a '
+                             'time. Statements are dumped as JSON lines if '
+                             'the --stmts file name ends with .jsonl.')
     args = parser.parse_args()
 
     # Load genes and get FamPlex terms
@@ -186,12 +522,16 @@ if __name__ == '__main__':
         genes = load_genes(args.genes)
     fplx_terms = get_famplex_terms(genes)
     # Load INDRA Statements in a flat data frame
-    df = load_indra_df(args.df)
+    df = load_indra_frame(args.df, args.indexed_df)
     # Filter the data frame to relevant entities
     df = filter_to_genes(df, genes, fplx_terms)
     # Download the Statement corresponding to each row
-    stmts = download_statements(df)
+    stmts = download_statements(df, cache_fname=args.stmt_cache,
+                                nthreads=args.nthreads)
     # Remap any outdated GO IDs
     remap_go_ids(stmts)
     # Dump the Statements into a pickle file
-    dump_pickle(stmts, args.stmts)
+    if args.stmts.endswith('.jsonl'):
+        dump_jsonl(stmts, args.stmts)
+    else:
+        dump_pickle(stmts, args.stmts, chunk_size=args.chunk_size)
@@ -0,0 +1,460 @@
+"""This module implements array-based indexes over the GO resources used to
+assemble GeneWalk networks, which can be saved into and loaded from the
+resource folder instead of reparsing the original resource files."""
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('genewalk.go_index')
+
+# Evidence codes of GO annotations corresponding to experimental evidence
+default_goa_evidence_codes = {'EXP', 'IDA', 'IPI', 'IMP', 'IGI', 'IEP', 'HTP',
+                              'HDA', 'HMP', 'HGI', 'HEP', 'IBA', 'IBD'}
+
+goa_gaf_columns = ['DB',
+                   'DB_ID',
+                   'DB_Symbol',
+                   'Qualifier',
+                   'GO_ID',
+                   'DB_Reference',
+                   'Evidence_Code',
+                   'With_From',
+                   'Aspect',
+                   'DB_Object_Name',
+                   'DB_Object_Synonym',
+                   'DB_Object_Type',
+                   'Taxon',
+                   'Date',
+                   'Assigned',
+                   'Annotation_Extension',
+                   'Gene_Product_Form_ID']
+
+
+# Columns of the GO annotations kept in the parsed resource cache
+goa_cache_columns = ['DB_ID', 'DB_Symbol', 'Qualifier', 'GO_ID',
+                     'Evidence_Code', 'Aspect']
+
+
+def pack_strings(strings):
+    """Return a list of strings packed into a UTF-8 byte array and the
+    offsets of each string in the array."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(buffer, offsets):
+    """Return the list of strings packed by pack_strings."""
+    data = buffer.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8')
+            for i in range(len(offsets) - 1)]
+
+
+def goa_to_arrays(goa):
+    """Return the cached columns of GO annotations as typed arrays.
+
+    Each column is stored as categorical codes together with its packed
+    categories.
+    """
+    arrays = {}
+    for col in goa_cache_columns:
+        values = pd.Categorical(goa[col].fillna(''))
+        arrays['%s_codes' % col] = values.codes.astype(np.int32)
+        arrays['%s_categories' % col], arrays['%s_offsets' % col] = \
+            pack_strings(values.categories)
+    return arrays
+
+
+def goa_from_arrays(arrays):
+    """Return GO annotations as a data frame with categorical columns from
+    the arrays returned by goa_to_arrays."""
+    columns = {}
+    for col in goa_cache_columns:
+        categories = unpack_strings(arrays['%s_categories' % col],
+                                    arrays['%s_offsets' % col])
+        columns[col] = pd.Categorical.from_codes(arrays['%s_codes' % col],
+                                                 categories=categories)
+    return pd.DataFrame(columns)
+
+
+def read_goa_gaf(fname, evidence_codes=None):
+    """Return the gene/GO annotations of a GAF file as a pandas data frame.
+
+    Parameters
+    ----------
+    fname : str
+        The path to the GOA GAF file, which is read as gzip-compressed if
+        its name ends with .gz.
+    evidence_codes : Optional[set]
+        The evidence codes of the annotations to keep. Default:
+        experimental evidence codes (default_goa_evidence_codes)
+
+    Returns
+    -------
+    pandas.DataFrame
+        The annotations, without "NOT" qualified annotations, sorted by
+        DB_ID and GO_ID.
+    """
+    if evidence_codes is None:
+        evidence_codes = default_goa_evidence_codes
+    goa = pd.read_csv(fname, sep='\t', skiprows=23, dtype=str, header=None,
+                      names=goa_gaf_columns)
+    goa = goa.sort_values(by=['DB_ID', 'GO_ID'])
+    # Filter out all "NOT" negative evidences
+    goa['Qualifier'] = goa['Qualifier'].fillna('')
+    goa = goa[~goa['Qualifier'].str.startswith('NOT')]
+    # Filter to rows with evidence code corresponding to experimental
+    # evidence
+    goa = goa[goa['Evidence_Code'].isin(evidence_codes)]
+    return goa
+
+
+class GoaIndex(object):
+    """Index from UniProt IDs to the sorted IDs of the GO terms they are
+    annotated with.
+
+    The GO IDs annotated to the UniProt ID at position i in up_ids are
+    go_ids[indptr[i]:indptr[i+1]].
+
+    Parameters
+    ----------
+    up_ids : np.array
+        Sorted UniProt IDs with at least one annotation.
+    indptr : np.array
+        Offsets of the annotations of each UniProt ID in go_ids.
+    go_ids : np.array
+        GO IDs of the annotations, grouped by UniProt ID and sorted
+        within each group.
+    """
+    def __init__(self, up_ids, indptr, go_ids):
+        self.up_ids = up_ids
+        self.indptr = indptr
+        self.go_ids = go_ids
+        self.up_pos = {up: i for i, up in enumerate(self.up_ids)}
+
+    @classmethod
+    def from_goa(cls, goa):
+        """Return the index of a data frame of GO annotations.
+
+        Parameters
+        ----------
+        goa : pandas.DataFrame
+            GO annotations with DB_ID and GO_ID columns, for instance as
+            returned by read_goa_gaf.
+        """
+        pairs = goa[['DB_ID', 'GO_ID']].drop_duplicates()
+        pairs = pairs.sort_values(by=['DB_ID', 'GO_ID'])
+        db_ids = pairs['DB_ID'].to_numpy(dtype=str)
+        up_ids, starts = np.unique(db_ids, return_index=True)
+        indptr = np.append(starts, len(db_ids)).astype(np.int64)
+        return cls(up_ids, indptr, pairs['GO_ID'].to_numpy(dtype=str))
+
+    def to_arrays(self):
+        """Return the arrays of the index as a dict."""
+        return {'goa_up_ids': self.up_ids, 'goa_indptr': self.indptr,
+                'goa_go_ids': self.go_ids}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Return an index from the arrays returned by to_arrays."""
+        return cls(arrays['goa_up_ids'], arrays['goa_indptr'],
+                   arrays['goa_go_ids'])
+
+    def get_go_ids(self, up_id):
+        """Return the sorted GO IDs annotated to a UniProt ID."""
+        pos = self.up_pos.get(up_id)
+        if pos is None:
+            return []
+        return [str(go_id) for go_id in
+                self.go_ids[self.indptr[pos]:self.indptr[pos + 1]]]
+
+
+class GoOntology(object):
+    """Array-based representation of the GO ontology (GO terms with their
+    names, namespaces and is_a parents).
+
+    The is_a parents of the term at position i in go_ids are at positions
+    parent_indices[parent_indptr[i]:parent_indptr[i+1]].
+
+    Parameters
+    ----------
+    go_ids : np.array
+        The (primary) IDs of the GO terms.
+    names : list of str
+        The names of the GO terms.
+    namespaces : list of str
+        The namespaces (domains) of the GO terms.
+    is_obsolete : np.array
+        Whether each GO term is obsolete.
+    parent_indptr : np.array
+        Row pointers of the is_a parent CSR matrix.
+    parent_indices : np.array
+        Positions of the is_a parents of each term.
+    alt_ids : Optional[np.array]
+        Alternative GO IDs.
+    alt_pos : Optional[np.array]
+        The positions of the terms the alternative IDs refer to.
+    ancestor_indptr : Optional[np.array]
+        Row pointers of the ancestor CSR matrix: the ancestors of the term
+        at position i are at positions
+        ancestor_indices[ancestor_indptr[i]:ancestor_indptr[i+1]]. Built
+        from the parents when first needed if not given.
+    ancestor_indices : Optional[np.array]
+        Sorted positions of the (is_a) ancestors of each term.
+    """
+    def __init__(self, go_ids, names, namespaces, is_obsolete, parent_indptr,
+                 parent_indices, alt_ids=None, alt_pos=None,
+                 ancestor_indptr=None, ancestor_indices=None):
+        self.go_ids = go_ids
+        self.names = names
+        self.namespaces = namespaces
+        self.is_obsolete = is_obsolete
+        self.parent_indptr = parent_indptr
+        self.parent_indices = parent_indices
+        self.alt_ids = alt_ids if alt_ids is not None else \
+            np.array([], dtype=str)
+        self.alt_pos = alt_pos if alt_pos is not None else \
+            np.array([], dtype=np.int64)
+        self.go_pos = {go_id: i for i, go_id in enumerate(self.go_ids)}
+        self.go_pos.update(zip(self.alt_ids, self.alt_pos.tolist()))
+        self._child_indptr = None
+        self._child_indices = None
+        self._ancestor_indptr = ancestor_indptr
+        self._ancestor_indices = ancestor_indices
+
+    @classmethod
+    def from_obo(cls, fname):
+        """Return the ontology parsed from a GO OBO file."""
+        from goatools.obo_parser import GODag
+        go_dag = GODag(fname)
+        # Alternative IDs map to the same term objects as the primary IDs
+        terms = {}
+        for term in go_dag.values():
+            terms.setdefault(term.id, term)
+        go_pos = {go_id: i for i, go_id in enumerate(terms)}
+        parents = [sorted(go_pos[p.id] for p in term.parents)
+                   for term in terms.values()]
+        parent_indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        parent_indptr[1:] = np.cumsum([len(p) for p in parents])
+        alt_ids = sorted(go_id for go_id, term in go_dag.items()
+                         if go_id != term.id)
+        return cls(go_ids=np.array(list(terms), dtype=str),
+                   names=[term.name for term in terms.values()],
+                   namespaces=[term.namespace for term in terms.values()],
+                   is_obsolete=np.array([term.is_obsolete
+                                         for term in terms.values()],
+                                        dtype=bool),
+                   parent_indptr=parent_indptr,
+                   parent_indices=np.array([p for ps in parents for p in ps],
+                                           dtype=np.int64),
+                   alt_ids=np.array(alt_ids, dtype=str),
+                   alt_pos=np.array([go_pos[go_dag[go_id].id]
+                                     for go_id in alt_ids], dtype=np.int64))
+
+    def to_arrays(self):
+        """Return the arrays of the ontology, including its ancestor index,
+        as a dict."""
+        self._build_ancestor_index()
+        names, name_offsets = pack_strings(self.names)
+        namespaces = pd.Categorical(self.namespaces)
+        namespace_categories, namespace_offsets = \
+            pack_strings(namespaces.categories)
+        return {'go_ids': self.go_ids, 'names': names,
+                'name_offsets': name_offsets,
+                'namespace_codes': namespaces.codes.astype(np.int32),
+                'namespace_categories': namespace_categories,
+                'namespace_offsets': namespace_offsets,
+                'is_obsolete': self.is_obsolete,
+                'parent_indptr': self.parent_indptr,
+                'parent_indices': self.parent_indices,
+                'alt_ids': self.alt_ids, 'alt_pos': self.alt_pos,
+                'ancestor_indptr': self._ancestor_indptr,
+                'ancestor_indices': self._ancestor_indices}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Return an ontology from the arrays returned by to_arrays."""
+        namespace_categories = unpack_strings(
+            arrays['namespace_categories'], arrays['namespace_offsets'])
+        namespaces = [namespace_categories[c]
+                      for c in arrays['namespace_codes']]
+        return cls(go_ids=arrays['go_ids'],
+                   names=unpack_strings(arrays['names'],
+                                        arrays['name_offsets']),
+                   namespaces=namespaces,
+                   is_obsolete=arrays['is_obsolete'],
+                   parent_indptr=arrays['parent_indptr'],
+                   parent_indices=arrays['parent_indices'],
+                   alt_ids=arrays['alt_ids'], alt_pos=arrays['alt_pos'],
+                   ancestor_indptr=arrays.get('ancestor_indptr'),
+                   ancestor_indices=arrays.get('ancestor_indices'))
+
+    def __contains__(self, go_id):
+        return go_id in self.go_pos
+
+    def __len__(self):
+        return len(self.go_ids)
+
+    def get_pos(self, go_id):
+        """Return the position of a GO term given its primary or
+        alternative ID, or None if the term is not in the ontology."""
+        return self.go_pos.get(go_id)
+
+    def get_parents(self, pos):
+        """Return the positions of the is_a parents of a GO term."""
+        return self.parent_indices[self.parent_indptr[pos]:
+                                   self.parent_indptr[pos + 1]]
+
+    def get_children(self, pos):
+        """Return the positions of the is_a children of a GO term."""
+        if self._child_indptr is None:
+            child_pos = np.repeat(np.arange(len(self), dtype=np.int64),
+                                  np.diff(self.parent_indptr))
+            order = np.argsort(self.parent_indices, kind='stable')
+            self._child_indices = child_pos[order]
+            self._child_indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            self._child_indptr[1:] = np.cumsum(
+                np.bincount(self.parent_indices, minlength=len(self)))
+        return self._child_indices[self._child_indptr[pos]:
+                                   self._child_indptr[pos + 1]]
+
+    def get_subontology(self, positions, neighborhood=0):
+        """Return a boolean mask of a set of GO terms, the terms within a
+        number of is_a edges (in either direction) of them, and all their
+        ancestors, excluding obsolete terms.
+
+        Parameters
+        ----------
+        positions : iterable of int
+            The positions of the GO terms.
+        neighborhood : Optional[int]
+            The number of is_a edges around the GO terms within which other
+            terms are included. Default: 0
+
+        Returns
+        -------
+        np.array
+            A boolean mask over the GO terms of the ontology.
+        """
+        keep = np.zeros(len(self), dtype=bool)
+        positions = np.asarray(list(positions), dtype=np.int64)
+        keep[positions[~self.is_obsolete[positions]]] = True
+        frontier = np.flatnonzero(keep)
+        for _ in range(neighborhood):
+            if not len(frontier):
+                break
+            neighbors = [self.get_parents(pos) for pos in frontier] + \
+                [self.get_children(pos) for pos in frontier]
+            neighbors = np.unique(np.concatenate(neighbors))
+            frontier = neighbors[~keep[neighbors] &
+                                 ~self.is_obsolete[neighbors]]
+            keep[frontier] = True
+        keep = self.get_ancestors(np.flatnonzero(keep))
+        return keep & ~self.is_obsolete
+
+    def get_is_a_edges(self, mask=None):
+        """Return the is_a edges between the GO terms in a mask.
+
+        Parameters
+        ----------
+        mask : Optional[np.array]
+            A boolean mask of the GO terms. Default: all non-obsolete terms.
+
+        Returns
+        -------
+        children : np.array
+            The positions of the child terms of the edges, in order.
+        parents : np.array
+            The positions of the parent terms of the edges, in the order of
+            the parents of each child.
+        """
+        if mask is None:
+            mask = ~self.is_obsolete
+        children = np.repeat(np.arange(len(self), dtype=np.int64),
+                             np.diff(self.parent_indptr))
+        parents = self.parent_indices
+        in_mask = mask[children] & mask[parents]
+        return children[in_mask], parents[in_mask]
+
+    def get_nlistings(self):
+        """Return the number of IDs (primary and alternative) of each term.
+
+        The GO DAG lists each term once for each of its IDs, and GeneWalk
+        networks add the is_a edges of each listing, i.e. this many times.
+        """
+        return 1 + np.bincount(self.alt_pos, minlength=len(self))
+
+    def get_ancestor_positions(self, pos):
+        """Return the sorted positions of all (is_a) ancestors of a GO
+        term."""
+        self._build_ancestor_index()
+        return self._ancestor_indices[self._ancestor_indptr[pos]:
+                                      self._ancestor_indptr[pos + 1]]
+
+    def get_ancestors(self, positions):
+        """Return a boolean mask of a set of GO terms and all their
+        ancestors."""
+        mask = np.zeros(len(self), dtype=bool)
+        positions = np.asarray(list(positions), dtype=np.int64)
+        mask[positions] = True
+        for pos in np.unique(positions):
+            mask[self.get_ancestor_positions(pos)] = True
+        return mask
+
+    def get_propagated_terms(self, positions):
+        """Return the sorted positions of the non-obsolete ancestors of a set
+        of GO terms that are not themselves in the set, i.e. the terms that
+        annotations to the set of terms propagate to."""
+        positions = np.asarray(list(positions), dtype=np.int64)
+        if not len(positions):
+            return positions
+        ancestors = np.unique(np.concatenate(
+            [self.get_ancestor_positions(pos) for pos in positions]))
+        ancestors = ancestors[~self.is_obsolete[ancestors]]
+        return np.setdiff1d(ancestors, positions)
+
+    def _build_ancestor_index(self):
+        """Build the CSR index of the ancestors of each term, visiting the
+        terms in topological order so that the ancestors of a term are the
+        union of its parents and their ancestors."""
+        if self._ancestor_indptr is not None:
+            return
+        ancestors = [None] * len(self)
+        for pos in self._get_topological_order():
+            parents = self.get_parents(pos)
+            ancestors[pos] = np.unique(np.concatenate(
+                [parents] + [ancestors[p] for p in parents])) \
+                if len(parents) else parents
+        self._ancestor_indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        self._ancestor_indptr[1:] = np.cumsum([len(a) for a in ancestors])
+        self._ancestor_indices = np.concatenate(
+            [np.array([], dtype=np.int64)] + ancestors).astype(np.int64)
+
+    def _get_topological_order(self):
+        """Return the positions of the terms ordered such that each term
+        comes after all its parents."""
+        nparents = np.diff(self.parent_indptr)
+        order = list(np.flatnonzero(nparents == 0))
+        nparents = nparents.tolist()
+        for pos in order:
+            for child in self.get_children(pos):
+                nparents[child] -= 1
+                if not nparents[child]:
+                    order.append(child)
+        if len(order) != len(self):
+            raise ValueError('The GO ontology contains an is_a cycle.')
+        return order
+
+
+def log_go_ontology_size(go_ontology, keep, mode):
+    """Log the number of GO terms and is_a edges in a part of the GO ontology
+    relative to the full ontology."""
+    nlistings = go_ontology.get_nlistings()
+    children, _ = go_ontology.get_is_a_edges()
+    kept_children, _ = go_ontology.get_is_a_edges(keep)
+    logger.info('Added %d of %d GO terms and %d of %d GO is_a edges '
+                '(go_ontology: %s).' %
+                (keep.sum(), (~go_ontology.is_obsolete).sum(),
+                 nlistings[kept_children].sum(), nlistings[children].sum(),
+                 mode))
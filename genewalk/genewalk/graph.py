@@ -0,0 +1,436 @@
+"""This module implements GeneWalkGraph, a compact array-based representation
+of a GeneWalk network. Neighbours are stored in compressed sparse row (CSR)
+format with the number of parallel edges and a bitmask of edge labels for
+each pair of neighbouring nodes, and node attributes are stored as columns.
+Random walks, null distributions and statistics can be calculated on it
+directly, it can be converted from and to a networkx graph, and it can be
+saved into a folder of numpy arrays which can be memory-mapped when
+loaded."""
+import os
+import json
+import random
+import shutil
+import logging
+import numpy as np
+import networkx as nx
+from genewalk.go_index import pack_strings, unpack_strings
+
+logger = logging.getLogger('genewalk.graph')
+
+# The maximum number of distinct edge labels that fit into the label bitmask
+max_edge_labels = 64
+
+# Version of the on-disk format written by GeneWalkGraph.save
+graph_format_version = 1
+
+# The arrays of a graph that are saved as they are and can be memory-mapped
+graph_arrays = ['indptr', 'indices', 'counts', 'label_masks']
+
+
+class GeneWalkGraph(object):
+    """Array-based undirected graph with parallel edge counts.
+
+    The neighbours of the node at position i in node_names are
+    node_names[indices[indptr[i]:indptr[i+1]]]. Each pair of neighbouring
+    nodes is listed once in the row of each node (a self loop once in the
+    row of its node), with the number of edges between the nodes in counts
+    and the labels of these edges in label_masks: bit k is set if one of the
+    edges has label labels[k].
+
+    Parameters
+    ----------
+    node_names : list of str
+        The names of the nodes.
+    indptr : np.array
+        Row pointers of the CSR adjacency matrix.
+    indices : np.array
+        Column indices (node positions) of the CSR adjacency matrix.
+    counts : np.array
+        The number of edges between each pair of neighbouring nodes.
+    label_masks : np.array
+        The bitmask of the labels of the edges between each pair of
+        neighbouring nodes.
+    labels : list of str
+        The edge labels that the bits of label_masks refer to.
+    node_attributes : Optional[dict]
+        Node attribute columns, a list of values (None if a node does not
+        have the attribute) for each attribute name, for instance name, GO,
+        domain, HGNC and UP. Values are usually strings, other values are
+        kept as they are and need to be JSON serializable to be saved.
+    """
+    def __init__(self, node_names, indptr, indices, counts, label_masks,
+                 labels, node_attributes=None):
+        self.node_names = list(node_names)
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.label_masks = label_masks
+        self.labels = list(labels)
+        self.node_attributes = node_attributes if node_attributes else {}
+        self._init_caches()
+
+    def _init_caches(self):
+        self.node_pos = {n: i for i, n in enumerate(self.node_names)}
+        self._adjacency = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['node_pos']
+        del state['_adjacency']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_caches()
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Return the GeneWalkGraph of a networkx graph.
+
+        The order of the nodes and of the neighbours of each node is kept.
+
+        Parameters
+        ----------
+        graph : networkx.MultiGraph or networkx.Graph
+            A GeneWalk network. Edge labels are taken from the label (or
+            rel_type) attribute of the edges of a MultiGraph, and from the
+            count and labels attributes of the edges of a graph with
+            collapsed edges.
+
+        Returns
+        -------
+        GeneWalkGraph
+            The GeneWalkGraph of the network.
+        """
+        node_names = list(graph.nodes())
+        node_pos = {n: i for i, n in enumerate(node_names)}
+        label_pos = {}
+        indptr = np.zeros(len(node_names) + 1, dtype=np.int64)
+        indices, counts, label_masks = [], [], []
+        for i, node in enumerate(node_names):
+            for neighbor, data in graph[node].items():
+                if graph.is_multigraph():
+                    edges = list(data.values())
+                    edge_labels = {_get_edge_label(d) for d in edges}
+                    count = len(edges)
+                elif 'labels' in data:
+                    edge_labels = set(data['labels'])
+                    count = data.get('count', 1)
+                else:
+                    edge_labels = {_get_edge_label(data)}
+                    count = data.get('count', 1)
+                mask = 0
+                for label in sorted(edge_labels - {None}):
+                    mask |= 1 << label_pos.setdefault(label, len(label_pos))
+                indices.append(node_pos[neighbor])
+                counts.append(count)
+                label_masks.append(mask)
+            indptr[i + 1] = len(indices)
+        labels = list(label_pos)
+        if not _check_labels(labels):
+            label_masks, labels = [0] * len(label_masks), []
+        return cls(node_names, indptr,
+                   np.array(indices, dtype=np.int32),
+                   np.array(counts, dtype=np.int32),
+                   np.array(label_masks, dtype=np.uint64), labels,
+                   _get_node_attribute_columns(graph, node_names))
+
+    @classmethod
+    def from_edges(cls, node_names, sources, targets, edge_labels=None,
+                   labels=None, node_attributes=None):
+        """Return a GeneWalkGraph given its nodes and a list of edges.
+
+        The neighbours of each node are ordered by their first edge, as in a
+        networkx graph to which the edges are added in order.
+
+        Parameters
+        ----------
+        node_names : list of str
+            The names of the nodes.
+        sources : np.array
+            The positions of the source nodes of the edges.
+        targets : np.array
+            The positions of the target nodes of the edges.
+        edge_labels : Optional[np.array]
+            The position of the label of each edge in labels.
+        labels : Optional[list of str]
+            The edge labels. If there are more than max_edge_labels of them,
+            the edges are added without labels.
+        node_attributes : Optional[dict]
+            Node attribute columns, see GeneWalkGraph.
+
+        Returns
+        -------
+        GeneWalkGraph
+            The graph.
+        """
+        labels = list(labels) if labels is not None else []
+        if not _check_labels(labels):
+            edge_labels, labels = None, []
+        nnodes = len(node_names)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        edge_pos = np.arange(len(sources), dtype=np.int64)
+        not_loop = sources != targets
+        rows = np.concatenate([sources, targets[not_loop]])
+        cols = np.concatenate([targets, sources[not_loop]])
+        edge_pos = np.concatenate([edge_pos, edge_pos[not_loop]])
+        pairs, inverse = np.unique(rows * nnodes + cols, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(pairs))
+        first_edge = np.full(len(pairs), len(sources), dtype=np.int64)
+        np.minimum.at(first_edge, inverse, edge_pos)
+        label_masks = np.zeros(len(pairs), dtype=np.uint64)
+        if edge_labels is not None:
+            edge_labels = np.asarray(edge_labels, dtype=np.uint64)
+            edge_labels = np.concatenate([edge_labels,
+                                          edge_labels[not_loop]])
+            np.bitwise_or.at(label_masks, inverse,
+                             np.left_shift(np.uint64(1), edge_labels))
+        pair_rows, pair_cols = pairs // nnodes, pairs % nnodes
+        order = np.lexsort((first_edge, pair_rows))
+        indptr = np.zeros(nnodes + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(pair_rows, minlength=nnodes))
+        return cls(node_names, indptr, pair_cols[order].astype(np.int32),
+                   counts[order].astype(np.int32), label_masks[order],
+                   labels, node_attributes)
+
+    def to_networkx(self):
+        """Return the graph as a networkx graph with collapsed edges.
+
+        Returns
+        -------
+        networkx.Graph
+            A graph with the same nodes and node attributes, in which the
+            count attribute of each edge is the number of edges between its
+            nodes and the labels attribute is the set of their labels.
+        """
+        graph = nx.Graph()
+        for i, node in enumerate(self.node_names):
+            graph.add_node(node, **self._get_node_data(i))
+        for i, node in enumerate(self.node_names):
+            for j, count, mask in self._get_row(i):
+                if j < i:
+                    continue
+                graph.add_edge(node, self.node_names[j], count=int(count),
+                               labels=self._get_labels(mask))
+        return graph
+
+    def save(self, dirname):
+        """Save the graph into a folder of numpy (npy) files.
+
+        The folder contains the CSR arrays, the packed node names and node
+        attribute columns, and a meta.json file with the format version,
+        the edge labels and the node attribute names. Attribute columns
+        with values other than strings are saved as JSON. An existing
+        folder of the same name is replaced.
+
+        Parameters
+        ----------
+        dirname : str
+            The path of the folder to save the graph into.
+        """
+        arrays = {name: getattr(self, name) for name in graph_arrays}
+        arrays['node_names'], arrays['node_name_offsets'] = \
+            pack_strings(self.node_names)
+        attribute_names = list(self.node_attributes)
+        json_attributes = []
+        for k, name in enumerate(attribute_names):
+            values = self.node_attributes[name]
+            # Columns with values other than strings are saved as JSON
+            if any(v is not None and not isinstance(v, str)
+                   for v in values):
+                json_attributes.append(name)
+                values = [v if v is None else _dump_json(name, v)
+                          for v in values]
+            arrays['attribute_%d' % k], arrays['attribute_%d_offsets' % k] = \
+                pack_strings(['' if v is None else v for v in values])
+            arrays['attribute_%d_present' % k] = \
+                np.array([v is not None for v in values], dtype=bool)
+        tmp_dirname = dirname + '.tmp'
+        if os.path.exists(tmp_dirname):
+            shutil.rmtree(tmp_dirname)
+        os.makedirs(tmp_dirname)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dirname, '%s.npy' % name), array)
+        meta = {'version': graph_format_version,
+                'number_of_nodes': len(self),
+                'labels': self.labels,
+                'node_attributes': attribute_names,
+                'json_attributes': json_attributes}
+        with open(os.path.join(tmp_dirname, 'meta.json'), 'w') as fh:
+            json.dump(meta, fh, indent=1)
+        if os.path.exists(dirname):
+            shutil.rmtree(dirname)
+        os.rename(tmp_dirname, dirname)
+
+    @classmethod
+    def load(cls, dirname, mmap_mode='r'):
+        """Return a graph loaded from a folder written by save.
+
+        Parameters
+        ----------
+        dirname : str
+            The path of the folder the graph was saved into.
+        mmap_mode : Optional[str]
+            The mode in which the CSR arrays are memory-mapped, see
+            numpy.load, or None to read them into memory. Default: 'r'
+
+        Returns
+        -------
+        GeneWalkGraph
+            The loaded graph.
+        """
+        with open(os.path.join(dirname, 'meta.json'), 'r') as fh:
+            meta = json.load(fh)
+        if meta['version'] != graph_format_version:
+            raise ValueError('Graph %s has version %d, expected %d.' %
+                             (dirname, meta['version'], graph_format_version))
+
+        def load_array(name, mmap_mode=None):
+            return np.load(os.path.join(dirname, '%s.npy' % name),
+                           mmap_mode=mmap_mode, allow_pickle=False)
+
+        arrays = {name: load_array(name, mmap_mode) for name in graph_arrays}
+        node_attributes = {}
+        for k, name in enumerate(meta['node_attributes']):
+            values = unpack_strings(load_array('attribute_%d' % k),
+                                    load_array('attribute_%d_offsets' % k))
+            present = load_array('attribute_%d_present' % k)
+            if name in meta.get('json_attributes', []):
+                values = [json.loads(v) if p else None
+                          for v, p in zip(values, present)]
+            node_attributes[name] = [v if p else None
+                                     for v, p in zip(values, present)]
+        return cls(unpack_strings(load_array('node_names'),
+                                  load_array('node_name_offsets')),
+                   labels=meta['labels'], node_attributes=node_attributes,
+                   **arrays)
+
+    def __len__(self):
+        return len(self.node_names)
+
+    def __iter__(self):
+        return iter(self.node_names)
+
+    def __contains__(self, node):
+        return node in self.node_pos
+
+    def __getitem__(self, node):
+        """Return the names of the neighbours of a node."""
+        return [self.node_names[j] for j in self._get_adjacency()[
+                self.node_pos[node]]]
+
+    def nodes(self):
+        """Return the names of the nodes."""
+        return self.node_names
+
+    def number_of_nodes(self):
+        return len(self.node_names)
+
+    def number_of_edges(self):
+        """Return the number of edges, counting parallel edges."""
+        self_loops = self.indices == self._get_rows()
+        return int((self.counts.sum() + self.counts[self_loops].sum()) // 2)
+
+    def degree(self, node=None):
+        """Return the degree of a node, or of all nodes if node is None.
+
+        As in a networkx MultiGraph, parallel edges are counted
+        separately and self loops count twice.
+        """
+        rows = self._get_rows()
+        weights = self.counts * np.where(self.indices == rows, 2, 1)
+        if node is not None:
+            i = self.node_pos[node]
+            return int(weights[self.indptr[i]:self.indptr[i + 1]].sum())
+        return np.bincount(rows, weights=weights,
+                           minlength=len(self)).astype(np.int64)
+
+    def get_node_attributes(self, name):
+        """Return a dict of the values of a node attribute by node name,
+        like networkx.get_node_attributes."""
+        values = self.node_attributes.get(name, [])
+        return {node: value for node, value in zip(self.node_names, values)
+                if value is not None}
+
+    def get_node_data(self, node):
+        """Return the attributes of a node as a dict."""
+        return self._get_node_data(self.node_pos[node])
+
+    def get_edge_data(self, u, v):
+        """Return the count and labels of the edges between two nodes, or
+        None if the nodes are not connected."""
+        for j, count, mask in self._get_row(self.node_pos[u]):
+            if self.node_names[j] == v:
+                return {'count': int(count), 'labels': self._get_labels(mask)}
+        return None
+
+    def random_walk(self, start_node, length):
+        """Return a random walk of a given length from a start node,
+        choosing uniformly among the distinct neighbours at each step."""
+        adjacency = self._get_adjacency()
+        node = self.node_pos[start_node]
+        path = [start_node]
+        for _ in range(1, length):
+            node = random.choice(adjacency[node])
+            path.append(self.node_names[node])
+        return path
+
+    def _get_adjacency(self):
+        if self._adjacency is None:
+            indices = self.indices.tolist()
+            indptr = self.indptr.tolist()
+            self._adjacency = [indices[indptr[i]:indptr[i + 1]]
+                               for i in range(len(self))]
+        return self._adjacency
+
+    def _get_rows(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64),
+                         np.diff(self.indptr))
+
+    def _get_row(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return zip(self.indices[start:end], self.counts[start:end],
+                   self.label_masks[start:end])
+
+    def _get_labels(self, mask):
+        mask = int(mask)
+        return {label for k, label in enumerate(self.labels)
+                if mask & (1 << k)}
+
+    def _get_node_data(self, i):
+        return {name: values[i] for name, values in
+                self.node_attributes.items() if values[i] is not None}
+
+
+def _get_edge_label(data):
+    return data.get('label', data.get('rel_type'))
+
+
+def _check_labels(labels):
+    """Return whether the edge labels fit into the label bitmask, warning
+    that they are left out of the graph otherwise."""
+    if len(labels) <= max_edge_labels:
+        return True
+    logger.warning('Got %d distinct edge labels, more than the %d that are '
+                   'supported, the edges are kept without labels.' %
+                   (len(labels), max_edge_labels))
+    return False
+
+
+def _get_node_attribute_columns(graph, node_names):
+    columns = {}
+    for i, node in enumerate(node_names):
+        for name, value in graph.nodes[node].items():
+            if name not in columns:
+                columns[name] = [None] * len(node_names)
+            columns[name][i] = value
+    return columns
+
+
+def _dump_json(name, value):
+    try:
+        return json.dumps(value)
+    except TypeError:
+        raise ValueError('Node attribute %s has a value of type %s, which '
+                         'cannot be saved.' % (name, type(value).__name__))
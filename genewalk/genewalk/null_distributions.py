@@ -1,7 +1,9 @@
 """This module implements functions related to the construction of a null
 distribution for GeneWalk networks."""
+import random
 import logging
 import networkx as nx
+from genewalk.graph import GeneWalkGraph
 
 logger = logging.getLogger('genewalk.get_null_distributions')
 
@@ -11,23 +13,29 @@ def get_rand_graph(mg):
 
     Parameters
     ----------
-    mg : networkx.MultiGraph
-        An input graph based on which a random graph is generated.
+    mg : genewalk.graph.GeneWalkGraph or networkx.MultiGraph
+        An input graph based on which a random graph is generated. If it is a
+        networkx graph with collapsed edges, the degree of each node is the
+        sum of the count attributes of its edges.
 
     Returns
     -------
-    networkx.MultiGraph
+    genewalk.graph.GeneWalkGraph
         A random graph whose degree distribution matches that of the output.
     """
+    if not isinstance(mg, GeneWalkGraph):
+        mg = GeneWalkGraph.from_networkx(mg)
     # this is not randomized: order is same
-    d_seq = sorted([mg.degree(n) for n in mg.nodes()], reverse=True)
-    # creates random multigraph with same degree sequence
-    rg = nx.configuration_model(d_seq)
+    d_seq = sorted(mg.degree().tolist(), reverse=True)
+    # creates random multigraph with same degree sequence by randomly
+    # pairing the edge stubs of the nodes, as networkx.configuration_model
+    stubs = [n for n, d in enumerate(d_seq) for _ in range(d)]
+    random.shuffle(stubs)
+    half = len(stubs) // 2
     # the node labels are numbers which gives problems in word2vec
     # so adjust 0 to n0
-    mapping = {n: 'n%s' % n for n in rg.nodes()}
-    rg = nx.relabel_nodes(rg, mapping, copy=False)
-    return rg
+    return GeneWalkGraph.from_edges(['n%s' % n for n in range(len(d_seq))],
+                                    stubs[:half], stubs[half:])
 
 
 def get_null_distributions(rg, nv):
@@ -1,17 +1,23 @@
-import pickle
 import logging
 import itertools
+import numpy as np
 import pandas as pd
 import networkx as nx
 from indra.databases import go_client
-from goatools.obo_parser import GODag
+from genewalk.graph import GeneWalkGraph
+from genewalk.edge_index import read_edges
+from genewalk.go_index import log_go_ontology_size, pack_strings, \
+    unpack_strings
 from genewalk.resources import ResourceManager
-from genewalk.get_indra_stmts import get_famplex_links_from_stmts
+from genewalk.get_indra_stmts import iter_statements, \
+    add_famplex_appearing, get_famplex_links_from_lists
 
 logger = logging.getLogger('genewalk.nx_mg_assembler')
 
 
-def load_network(network_type, network_file, genes, resource_manager=None):
+def load_network(network_type, network_file, genes, resource_manager=None,
+                 go_ontology='full', go_neighborhood=0, collapse_edges=False,
+                 annotate_ancestors=False):
     """Return a network assembler of the given type based on a set of genes.
 
     Parameters
@@ -20,36 +26,66 @@ def load_network(network_type, network_file, genes, resource_manager=None):
         The type of the network to be constructed.
     network_file : str
         The path to a file containing information to construct the network.
+        For INDRA networks, a file of INDRA Statements, see
+        genewalk.get_indra_stmts.iter_statements.
     genes : list
         A list of gene references.
     resource_manager : Optional[:py:class:`genewalk.resources.ResourceManager`]
         A resource manager object which, if specified, is used to get the
         resource files. Otherwise, the default resource manager is used.
+    go_ontology : Optional[str]
+        Which part of the GO ontology to add to the network, 'full'
+        (default) or 'ancestors'. Not used for user-provided networks. See
+        NxMgAssembler.
+    go_neighborhood : Optional[int]
+        The number of is_a edges around the GO terms in the network within
+        which other terms are also added if go_ontology is 'ancestors'.
+        Default: 0
+    collapse_edges : Optional[bool]
+        If True, parallel edges are collapsed into a single edge with count
+        and labels attributes and the network is a networkx Graph instead of
+        a MultiGraph. Default: False
+    annotate_ancestors : Optional[bool]
+        If True, genes are also connected to all ancestors of the GO terms
+        they are annotated with. Not used for user-provided networks.
+        Default: False
 
     Returns
     -------
     :py:class:`genewalk.nx_mg_assembler.NxMgAssembler`
         An instance of an NxMgAssembler containing the assembled networkx
-        MultiGraph as its graph attribute.
+        MultiGraph (or Graph if collapse_edges is True) as its graph
+        attribute.
     """
     if not resource_manager:
         resource_manager = None
     if network_type == 'pc':
-        mg = PcNxMgAssembler(genes, resource_manager=resource_manager)
+        mg = PcNxMgAssembler(genes, resource_manager=resource_manager,
+                             go_ontology=go_ontology,
+                             go_neighborhood=go_neighborhood,
+                             collapse_edges=collapse_edges,
+                             annotate_ancestors=annotate_ancestors)
     elif network_type == 'indra':
         logger.info('Loading %s' % network_file)
-        with open(network_file, 'rb') as fh:
-            stmts = pickle.load(fh)
+        stmts = iter_statements(network_file)
         mg = IndraNxMgAssembler(genes, stmts,
-                                resource_manager=resource_manager)
+                                resource_manager=resource_manager,
+                                go_ontology=go_ontology,
+                                go_neighborhood=go_neighborhood,
+                                collapse_edges=collapse_edges,
+                                annotate_ancestors=annotate_ancestors)
     elif network_type == 'edge_list':
         logger.info('Loading user-provided GeneWalk Network from %s.' %
                     network_file)
-        mg = UserNxMgAssembler(network_file, gwn_format='el')
+        mg = UserNxMgAssembler(network_file, gwn_format='el',
+                               collapse_edges=collapse_edges,
+                               resource_manager=resource_manager)
     elif network_type == 'sif':
         logger.info('Loading user-provided GeneWalk Network from %s.' %
                     network_file)
-        mg = UserNxMgAssembler(network_file, gwn_format='sif')
+        mg = UserNxMgAssembler(network_file, gwn_format='sif',
+                               collapse_edges=collapse_edges,
+                               resource_manager=resource_manager)
     else:
         raise ValueError('Unknown network_type: %s' % network_type)
     return mg
@@ -62,6 +98,27 @@ class NxMgAssembler(object):
     ----------
     genes : list of dict
         A list of gene references based on which the graph is assembled.
+    resource_manager : Optional[genewalk.resources.ResourceManager]
+        The resource manager used to get the GO resources. By default, a
+        new resource manager using the default base folder is used.
+    go_ontology : Optional[str]
+        'full' (default) to add all (non-obsolete) GO terms and their is_a
+        edges to the graph, or 'ancestors' to only add the GO terms
+        connected to genes in the graph, the terms within go_neighborhood
+        is_a edges of them, and all their ancestors.
+    go_neighborhood : Optional[int]
+        The number of is_a edges (in either direction) around the GO terms
+        connected to genes within which GO terms are added if go_ontology
+        is 'ancestors'. Default: 0
+    collapse_edges : Optional[bool]
+        If True, the graph is a networkx Graph with a single edge per pair
+        of nodes, whose count attribute is the number of edges between the
+        nodes and whose labels attribute is the set of their labels.
+        Default: False
+    annotate_ancestors : Optional[bool]
+        If True, annotations are propagated up the GO ontology: each gene is
+        also connected to all (non-obsolete) ancestors of the GO terms it is
+        annotated with by edges labeled GO:transitivity. Default: False
 
     Attributes
     ----------
@@ -70,15 +127,23 @@ class NxMgAssembler(object):
         GO annotations for genes, and the GO ontology.
     """
 
-    def __init__(self, genes, resource_manager=None):
+    def __init__(self, genes, resource_manager=None, go_ontology='full',
+                 go_neighborhood=0, collapse_edges=False,
+                 annotate_ancestors=False):
+        if go_ontology not in ('full', 'ancestors'):
+            raise ValueError('Unknown go_ontology: %s' % go_ontology)
         self.genes = genes
-        self.graph = nx.MultiGraph()
+        self.go_ontology_mode = go_ontology
+        self.go_neighborhood = go_neighborhood
+        self.collapse_edges = collapse_edges
+        self.annotate_ancestors = annotate_ancestors
+        self.graph = nx.Graph() if collapse_edges else nx.MultiGraph()
         if not resource_manager:
             self.resource_manager = ResourceManager()
         else:
             self.resource_manager = resource_manager
-        self.go_dag = GODag(self.resource_manager.get_go_obo())
-        self.goa = self._load_goa_gaf()
+        self.go_ontology = self.resource_manager.get_go_ontology()
+        self.goa_index = self._load_goa_gaf()
 
     def _get_go_terms_for_gene(self, gene):
         # Filter to rows with the given gene's UniProt ID
@@ -86,9 +151,7 @@ class NxMgAssembler(object):
             return []
         elif gene['HGNC_SYMBOL'] not in self.graph:
             return []
-        df = self.goa[self.goa['DB_ID'] == gene['UP']]
-        go_ids = sorted(list(set(df['GO_ID'])))
-        return go_ids
+        return self.goa_index.get_go_ids(gene['UP'])
 
     def add_go_annotations(self):
         """Add edges between gene nodes and GO nodes based on GO
@@ -96,41 +159,87 @@ class NxMgAssembler(object):
         logger.info('Adding GO annotations for genes in graph.')
         for gene in self.genes:
             go_ids = self._get_go_terms_for_gene(gene)
+            annotated = []
             for go_id in go_ids:
-                if go_id in self.go_dag:
-                    go_term = self.go_dag[go_id]
-                    if go_term.is_obsolete:
-                        continue
-                    self.graph.add_node(go_term.id,
-                                        name=go_term.name,
-                                        GO=go_term.id,
-                                        domain=go_term.namespace)
-                    self.graph.add_edge(gene['HGNC_SYMBOL'], go_term.id,
-                                        label='GO:annotation')
+                pos = self.go_ontology.get_pos(go_id)
+                if pos is None or self.go_ontology.is_obsolete[pos]:
+                    continue
+                self._add_edge(gene['HGNC_SYMBOL'], self._add_go_node(pos),
+                               'GO:annotation')
+                annotated.append(pos)
+            if not self.annotate_ancestors:
+                continue
+            for pos in self.go_ontology.get_propagated_terms(annotated):
+                self._add_edge(gene['HGNC_SYMBOL'], self._add_go_node(pos),
+                               'GO:transitivity')
 
     def add_go_ontology(self):
         """Add edges between GO nodes based on the GO ontology."""
         logger.info('Adding GO ontology edges to graph.')
-        for go_term in list(self.go_dag.values()):
-            if go_term.is_obsolete:
-                continue
-            self.graph.add_node(go_term.id,
-                                name=go_term.name,
-                                GO=go_term.id,
-                                domain=go_term.namespace)
-            for parent_term in go_term.parents:
-                if parent_term.is_obsolete:
+        # A term is listed once for its primary ID and once for each of its
+        # alternative IDs in the GO DAG and its is_a edges were added for
+        # each listing, we keep that edge multiplicity
+        nlistings = self.go_ontology.get_nlistings()
+        if self.go_ontology_mode == 'ancestors':
+            positions = [self.go_ontology.get_pos(node)
+                         for node in self.graph.nodes()]
+            keep = self.go_ontology.get_subontology(
+                [pos for pos in positions if pos is not None],
+                self.go_neighborhood)
+        else:
+            keep = ~self.go_ontology.is_obsolete
+        for pos in np.flatnonzero(keep):
+            go_id = self._add_go_node(pos)
+            for parent_pos in self.go_ontology.get_parents(pos):
+                if not keep[parent_pos]:
                     continue
-                self.graph.add_node(go_term.id,
-                                    name=go_term.name,
-                                    GO=go_term.id,
-                                    domain=go_term.namespace)
-                self.graph.add_edge(go_term.id, parent_term.id,
-                                    label='GO:is_a')
+                for _ in range(nlistings[pos]):
+                    self._add_edge(go_id,
+                                   str(self.go_ontology.go_ids[parent_pos]),
+                                   'GO:is_a')
+        log_go_ontology_size(self.go_ontology, keep, self.go_ontology_mode)
+
+    def _add_go_node(self, pos):
+        """Add the node of the GO term at a given position of the GO
+        ontology and return its ID."""
+        go_id = str(self.go_ontology.go_ids[pos])
+        self.graph.add_node(go_id,
+                            name=self.go_ontology.names[pos],
+                            GO=go_id,
+                            domain=self.go_ontology.namespaces[pos])
+        return go_id
+
+    def _add_edge(self, u, v, label, key=None, label_attr='label'):
+        """Add an edge with a given label between two nodes.
+
+        If edges are collapsed, the count of the existing edge between the
+        nodes is incremented and the label added to its labels instead.
+        """
+        if not self.collapse_edges:
+            self.graph.add_edge(u, v, key=key, **{label_attr: label})
+        elif self.graph.has_edge(u, v):
+            edge = self.graph[u][v]
+            edge['count'] += 1
+            edge['labels'].add(label)
+        else:
+            self.graph.add_edge(u, v, count=1, labels={label})
 
     def node2edges(self, node_key):
-        """Return the edges corresponding to a node."""
-        return self.graph.edges(node_key, keys=True)
+        """Return the edges corresponding to a node (with their data if
+        edges are collapsed)."""
+        if self.graph.is_multigraph():
+            return self.graph.edges(node_key, keys=True)
+        return self.graph.edges(node_key, data=True)
+
+    def to_genewalk_graph(self):
+        """Return the assembled graph as a GeneWalkGraph.
+
+        Returns
+        -------
+        genewalk.graph.GeneWalkGraph
+            The array-based representation of the assembled graph.
+        """
+        return GeneWalkGraph.from_networkx(self.graph)
 
     def save_graph(self, fname):
         """Save the file into a GraphML file.
@@ -140,40 +249,12 @@ class NxMgAssembler(object):
         fname : str
             The name of the file to save the graph into.
         """
-        nx.write_graphml(self.graph, fname)
+        nx.write_graphml(get_graphml_graph(self.graph), fname)
 
     def _load_goa_gaf(self):
-        """Load the gene/GO annotations as a pandas data frame."""
-        goa_ec = {'EXP', 'IDA', 'IPI', 'IMP', 'IGI', 'IEP', 'HTP', 'HDA',
-                  'HMP', 'HGI', 'HEP', 'IBA', 'IBD'}
-        goa = pd.read_csv(self.resource_manager.get_goa_gaf(), sep='\t',
-                          skiprows=23, dtype=str,
-                          header=None,
-                          names=['DB',
-                                 'DB_ID',
-                                 'DB_Symbol',
-                                 'Qualifier',
-                                 'GO_ID',
-                                 'DB_Reference',
-                                 'Evidence_Code',
-                                 'With_From',
-                                 'Aspect',
-                                 'DB_Object_Name',
-                                 'DB_Object_Synonym',
-                                 'DB_Object_Type',
-                                 'Taxon',
-                                 'Date',
-                                 'Assigned',
-                                 'Annotation_Extension',
-                                 'Gene_Product_Form_ID'])
-        goa = goa.sort_values(by=['DB_ID', 'GO_ID'])
-        # Filter out all "NOT" negative evidences
-        goa['Qualifier'].fillna('', inplace=True)
-        goa = goa[~goa['Qualifier'].str.startswith('NOT')]
-        # Filter to rows with evidence code corresponding to experimental
-        # evidence
-        goa = goa[goa['Evidence_Code'].isin(goa_ec)]
-        return goa
+        """Load the gene/GO annotations as an index from UniProt IDs to
+        sorted GO IDs."""
+        return self.resource_manager.get_goa_index()
 
 
 class PcNxMgAssembler(NxMgAssembler):
@@ -191,8 +272,11 @@ class PcNxMgAssembler(NxMgAssembler):
     graph : networkx.MultiGraph
         A GeneWalk Network that is assembled by this assembler.
     """
-    def __init__(self, genes, resource_manager=None):
-        super().__init__(genes, resource_manager)
+    def __init__(self, genes, resource_manager=None, go_ontology='full',
+                 go_neighborhood=0, collapse_edges=False,
+                 annotate_ancestors=False):
+        super().__init__(genes, resource_manager, go_ontology,
+                         go_neighborhood, collapse_edges, annotate_ancestors)
         self.add_pc_edges()
         self.add_go_annotations()
         self.add_go_ontology()
@@ -201,30 +285,19 @@ class PcNxMgAssembler(NxMgAssembler):
         """Add edges between gene nodes based on PathwayCommons
         interactions."""
         logger.info('Adding gene edges from Pathway Commons to graph.')
-        gwn_df = pd.read_csv(self.resource_manager.get_pc(), sep='\t',
-                             dtype=str, header=None)
-        col_mapper = {}
-        col_mapper[0] = 'source'
-        col_mapper[1] = 'rel_type'
-        col_mapper[2] = 'target'
-        edge_attributes = True
-        gwn_df = gwn_df.rename(mapper=col_mapper, axis='columns')
-        pc = nx.from_pandas_edgelist(gwn_df, source='source', target='target',
-                                     edge_attr=edge_attributes,
-                                     create_using=nx.MultiGraph)
+        pc_index = self.resource_manager.get_pc_index()
         # subset over genes in the input gene list
         hgnc_symbols = [g['HGNC_SYMBOL'] for g in self.genes]
-        hgnc_ids = [g['HGNC'] for g in self.genes]
-        up_ids = [g['UP'] for g in self.genes]
-        pc_sub = pc.subgraph(hgnc_symbols)
-        gene2hgnc_dict = dict(zip(hgnc_symbols, hgnc_ids))
-        nx.set_node_attributes(pc_sub, gene2hgnc_dict, 'HGNC')
-        gene2up_dict = dict(zip(hgnc_symbols, up_ids))
-        nx.set_node_attributes(pc_sub, gene2up_dict, 'UP')
-        # Make a copy to unfreeze graph
-        self.graph = nx.MultiGraph(pc_sub)
-        # Delete unconnected nodes
-        self.graph.remove_nodes_from(nx.isolates(pc_sub))
+        gene2hgnc_dict = {g['HGNC_SYMBOL']: g['HGNC'] for g in self.genes}
+        gene2up_dict = {g['HGNC_SYMBOL']: g['UP'] for g in self.genes}
+        # Only genes with edges are added, i.e. unconnected genes are left
+        # out
+        nodes, edges = pc_index.get_subgraph(hgnc_symbols)
+        for node in nodes:
+            self.graph.add_node(node, HGNC=gene2hgnc_dict[node],
+                                UP=gene2up_dict[node])
+        for source, target, rel_type in edges:
+            self._add_edge(source, target, rel_type, label_attr='rel_type')
         logger.info('Number of PC originating nodes %d' %
                     nx.number_of_nodes(self.graph))
 
@@ -239,17 +312,29 @@ class IndraNxMgAssembler(NxMgAssembler):
     ----------
     stmts : list[indra.statements.Statement]
         A list of INDRA Statements to be added to the assembler's list
-        of Statements.
+        of Statements. Can also be an iterator over the Statements, e.g.
+        one returned by genewalk.get_indra_stmts.iter_statements, in which
+        case the Statements are read in a single pass and not kept, and
+        node2stmts is not available.
 
     Attributes
     ----------
     graph : networkx.MultiGraph
         A GeneWalk Network that is assembled by this assembler.
     """
-    def __init__(self, genes, stmts, resource_manager=None):
+    def __init__(self, genes, stmts, resource_manager=None,
+                 go_ontology='full', go_neighborhood=0, collapse_edges=False,
+                 annotate_ancestors=False):
         self.indra_nodes = set()
-        self.stmts = stmts
-        super().__init__(genes, resource_manager)
+        self.stmts = stmts if isinstance(stmts, list) else None
+        self._stmts_iter = stmts
+        # The indices of the Statements in which each node appears
+        self.node_stmts = {}
+        # Memoized node keys of GO agents and GO labels of the nodes
+        self._agent_nodes = {}
+        self._go_labels = {}
+        super().__init__(genes, resource_manager, go_ontology,
+                         go_neighborhood, collapse_edges, annotate_ancestors)
         self.add_indra_edges()
         self.add_fplx_edges()
         self.add_go_annotations()
@@ -257,69 +342,147 @@ class IndraNxMgAssembler(NxMgAssembler):
 
     def add_indra_edges(self):
         """Add edges between gene nodes and GO nodes based on INDRA Statements.
+
+        The Statements are processed in a single pass: the node of each
+        distinct agent is resolved once, the nodes and edges are then added
+        to the graph in bulk, and the indices of the Statements in which
+        each node appears are recorded in node_stmts.
         """
         logger.info('Adding nodes from INDRA statements.')
-        for i, st in enumerate(self.stmts):
+        node_attrs = {}
+        edges = []
+        # The genes and FamPlex entities appearing in Statements, see
+        # add_fplx_edges
+        self._fplx_appearing = (set(), set())
+        for i, st in enumerate(self._stmts_iter):
             # Get all agents in the statement
             agents = [a for a in st.agent_list() if a is not None]
+            nodes = [self._get_agent_node(a) for a in agents]
+            for node in dict.fromkeys(nodes):
+                self.node_stmts.setdefault(node, []).append(i)
             # Only include edges for statements with at least 2 Agents
             # excludes (irrelevant) stmt types: Translocation, ActiveForm,
             # SelfModification
             if len(agents) < 2:
                 continue
+            for agent in agents:
+                self._get_agent_node(agent, node_attrs)
+            add_famplex_appearing(agents, *self._fplx_appearing)
             # Create a label that is unique to the statement and its type
             edge_type = type(st).__name__
             edge_key = '%d_%s' % (i, edge_type)
             # Iterate over all the agent combinations and add edge
-            for a, b in itertools.combinations(agents, 2):
-                a_node = self.add_agent_node(a)
-                b_node = self.add_agent_node(b)
-                self.graph.add_edge(a_node, b_node, key=edge_key,
-                                    label=edge_type)
+            for a_node, b_node in itertools.combinations(nodes, 2):
+                self.indra_nodes.add(a_node)
+                self.indra_nodes.add(b_node)
+                edges.append((a_node, b_node, edge_key, edge_type))
+        # Nodes are added in the order of their first edge
+        for node in dict.fromkeys(n for u, v, _, _ in edges for n in (u, v)):
+            self.graph.add_node(node, **node_attrs[node])
+        if self.collapse_edges:
+            for u, v, key, edge_type in edges:
+                self._add_edge(u, v, edge_type, key=key)
+        else:
+            self.graph.add_edges_from((u, v, key, {'label': edge_type})
+                                      for u, v, key, edge_type in edges)
 
+        self._stmts_iter = None
         logger.info('Number of INDRA originating nodes %d.' %
                     len(self.indra_nodes))
 
     def add_fplx_edges(self):
         """Add edges between gene nodes and families/complexes they are part
-        of."""
-        links = get_famplex_links_from_stmts(self.stmts)
+        of, among the ones appearing in the Statements read by
+        add_indra_edges."""
+        links = get_famplex_links_from_lists(*self._fplx_appearing)
         for s, t in links:
-            self.graph.add_edge(s, t, label='FPLX:is_a')
+            self._add_edge(s, t, 'FPLX:is_a')
 
     def add_agent_node(self, agent):
         """Add a node corresponding to an INDRA Agent."""
+        node_attrs = {}
+        node_key = self._get_agent_node(agent, node_attrs)
+        self.graph.add_node(node_key, **node_attrs[node_key])
+        self.indra_nodes.add(node_key)
+        return node_key
+
+    def _get_agent_node(self, agent, node_attrs=None):
+        """Return the key of the node of an INDRA Agent and, if node_attrs is
+        given, update the attributes of the node in it."""
         go_id = agent.db_refs.get('GO')
         if go_id:
-            go_id = go_id if go_id.startswith('GO:') else 'GO:%s' % go_id
-            node_key = go_id
-            name = go_client.get_go_label(go_id)
-            self.graph.add_node(node_key, name=name,
-                                source='indra', **agent.db_refs)
+            if go_id not in self._agent_nodes:
+                node_key = go_id if go_id.startswith('GO:') else \
+                    'GO:%s' % go_id
+                self._agent_nodes[go_id] = node_key
+                self._go_labels[node_key] = go_client.get_go_label(node_key)
+            node_key = self._agent_nodes[go_id]
+            if node_attrs is not None:
+                node_attrs.setdefault(node_key, {}).update(
+                    name=self._go_labels[node_key], source='indra',
+                    **agent.db_refs)
         else:
             node_key = agent.name
-            self.graph.add_node(node_key, name=agent.name, **agent.db_refs,
-                                source='indra')
-        self.indra_nodes.add(node_key)
+            if node_attrs is not None:
+                node_attrs.setdefault(node_key, {}).update(
+                    name=agent.name, **agent.db_refs, source='indra')
         return node_key
 
     def node2stmts(self, node_key):
         """Return the INDRA Statements given the key of a graph node."""
-        matching_stmts = []
-        node_name = self.graph.nodes[node_key]['name']
-        for stmt in self.stmts:
-            for agent in stmt.agent_list():
-                if agent is not None:
-                    agent_name = agent.name
-                    if agent_name == node_name:
-                        matching_stmts.append(stmt)
-                        break
-        return matching_stmts
+        if self.stmts is None:
+            raise ValueError('The INDRA Statements were read from an '
+                             'iterator and not kept, see node_stmts for '
+                             'their indices instead.')
+        return [self.stmts[i] for i in self.node_stmts.get(node_key, [])]
+
+    def save_node_stmts(self, fname):
+        """Save the indices of the INDRA Statements of each node into a
+        numpy (npz) file, see load_node_stmts.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file to save the indices into.
+        """
+        nodes, node_offsets = pack_strings(list(self.node_stmts))
+        indptr = np.zeros(len(self.node_stmts) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(v) for v in self.node_stmts.values()])
+        indices = np.array([i for v in self.node_stmts.values() for i in v],
+                           dtype=np.int64)
+        np.savez_compressed(fname, nodes=nodes, node_offsets=node_offsets,
+                            indptr=indptr, indices=indices)
+
+
+def load_node_stmts(fname):
+    """Return the indices of the INDRA Statements of each node saved by
+    IndraNxMgAssembler.save_node_stmts.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the file the indices were saved into.
+
+    Returns
+    -------
+    dict
+        The list of the indices (in the list of INDRA Statements the network
+        was assembled from) of the Statements of each node, by node key.
+    """
+    with np.load(fname, allow_pickle=False) as fh:
+        nodes = unpack_strings(fh['nodes'], fh['node_offsets'])
+        indptr = fh['indptr']
+        indices = fh['indices']
+    return {node: indices[indptr[i]:indptr[i + 1]].tolist()
+            for i, node in enumerate(nodes)}
 
 
 class UserNxMgAssembler(object):
     """Loads a user-provided GeneWalk Network from a given file.
 
+    The file is read in chunks, interning node names as integers, and the
+    network is built directly as a GeneWalkGraph.
+
     Parameters
     ----------
     filepath : str
@@ -327,43 +490,123 @@ class UserNxMgAssembler(object):
         gene symbols and GO IDs. See gwn_format for supported format details.
     gwn_format : Optional[str]
         'el' (default, edge list: nodeA nodeB (if more columns
-        present: interpreted as edge attributes) \
+        present: the third one is interpreted as the relationship type and
+        further ones are ignored) \
         or 'sif' (simple interaction format: nodeA <relationship type> nodeB).
-        Do not include column headers.
+        Columns are comma-separated. Do not include column headers.
+    collapse_edges : Optional[bool]
+        If True, graph is a networkx Graph with a single edge per pair of
+        nodes, whose count attribute is the number of edges between the
+        nodes and whose labels attribute is the set of their relationship
+        types. Default: False
+    resource_manager : Optional[genewalk.resources.ResourceManager]
+        The resource manager used to get the GO ontology from which the
+        names and domains of the GO nodes are taken. By default, a new
+        resource manager using the default base folder is used.
+    chunk_size : Optional[int]
+        The number of lines of the file to parse at a time.
+        Default: 1000000
 
     Attributes
     ----------
-    graph : networkx.MultiGraph
+    genewalk_graph : genewalk.graph.GeneWalkGraph
         A GeneWalk Network that is loaded by this assembler.
+    graph : networkx.MultiGraph
+        The loaded GeneWalk Network as a networkx MultiGraph (or Graph if
+        collapse_edges is True) with the relationship types of the edges as
+        their rel_type attribute, created when first accessed.
     """
-    def __init__(self, filepath, gwn_format='el'):
-        self.graph = nx.MultiGraph()
+    def __init__(self, filepath, gwn_format='el', collapse_edges=False,
+                 resource_manager=None, chunk_size=1000000):
+        if gwn_format not in ('el', 'sif'):
+            raise ValueError('Unknown gwn_format: %s' % gwn_format)
         self.filepath = filepath
         self.gwn_format = gwn_format
+        self.collapse_edges = collapse_edges
+        self.chunk_size = chunk_size
+        if not resource_manager:
+            self.resource_manager = ResourceManager()
+        else:
+            self.resource_manager = resource_manager
+        self.genewalk_graph = None
+        self._edges = None
+        self._graph = None
         self.add_network_edges()
 
+    @property
+    def graph(self):
+        if self._graph is None:
+            if self.collapse_edges:
+                self._graph = self.genewalk_graph.to_networkx()
+            else:
+                self._graph = self._get_multigraph()
+        return self._graph
+
+    def to_genewalk_graph(self):
+        """Return the loaded graph as a GeneWalkGraph."""
+        return self.genewalk_graph
+
     def add_network_edges(self):
         """Assemble the GeneWalk Network from the user-provided file path."""
-        gwn_df = pd.read_csv(self.filepath, dtype=str, header=None)
-        col_mapper = {}
         if self.gwn_format == 'el':
-            col_mapper[0] = 'source'
-            col_mapper[1] = 'target'
-            if len(gwn_df.columns) > 2:
-                col_mapper[2] = 'rel_type'
-                if len(gwn_df.columns) > 3:
-                    for c in gwn_df.columns[3:]:
-                        col_mapper[c] = 'edge_attr'+str(c-1)
-                edge_attributes = True
-            else:
-                edge_attributes = False
-        elif self.gwn_format == 'sif':
-            col_mapper[0] = 'source'
-            col_mapper[1] = 'rel_type'
-            col_mapper[2] = 'target'
-            edge_attributes = True
-
-        gwn_df.rename(mapper=col_mapper, axis='columns')
-        self.graph = nx.from_pandas_edgelist(gwn_df, 'source', 'target',
-                                             edge_attr=edge_attributes,
-                                             create_using=nx.MultiGraph)
+            columns = dict(source_col=0, target_col=1, rel_type_col=2)
+        else:
+            columns = dict(source_col=0, target_col=2, rel_type_col=1)
+        nodes, sources, targets, rel_type_codes, rel_types = read_edges(
+            self.filepath, sep=',', chunk_size=self.chunk_size, **columns)
+        logger.info('Loaded %d edges between %d nodes from %s' %
+                    (len(sources), len(nodes), self.filepath))
+        self.genewalk_graph = GeneWalkGraph.from_edges(
+            nodes, sources, targets, rel_type_codes, rel_types,
+            self._get_go_attributes(nodes))
+        # The individual edges are only needed for the MultiGraph
+        if not self.collapse_edges:
+            self._edges = (sources, targets, rel_type_codes, rel_types)
+        self._graph = None
+
+    def _get_multigraph(self):
+        """Return the loaded network as a networkx MultiGraph with the
+        edges in the order of the file."""
+        graph = nx.MultiGraph()
+        nodes = self.genewalk_graph.node_names
+        for node in nodes:
+            graph.add_node(node, **self.genewalk_graph.get_node_data(node))
+        sources, targets, rel_type_codes, rel_types = self._edges
+        if rel_type_codes is None:
+            graph.add_edges_from((nodes[u], nodes[v]) for u, v
+                                 in zip(sources.tolist(), targets.tolist()))
+        else:
+            graph.add_edges_from(
+                (nodes[u], nodes[v], {'rel_type': rel_types[r]})
+                for u, v, r in zip(sources.tolist(), targets.tolist(),
+                                   rel_type_codes.tolist()))
+        return graph
+
+    def _get_go_attributes(self, nodes):
+        """Return the node attribute columns of the GO nodes among the nodes,
+        i.e. the ones named by a GO ID, taking their names and domains from
+        the GO ontology."""
+        go_ontology = self.resource_manager.get_go_ontology()
+        columns = {name: [None] * len(nodes)
+                   for name in ('name', 'GO', 'domain')}
+        for i, node in enumerate(nodes):
+            if not node.startswith('GO:'):
+                continue
+            columns['GO'][i] = node
+            pos = go_ontology.get_pos(node)
+            if pos is not None:
+                columns['name'][i] = go_ontology.names[pos]
+                columns['domain'][i] = go_ontology.namespaces[pos]
+        return columns
+
+
+def get_graphml_graph(graph):
+    """Return a graph that can be written into GraphML, i.e. in which the
+    label sets of collapsed edges are joined into strings."""
+    if graph.is_multigraph():
+        return graph
+    graph = graph.copy()
+    for _, _, data in graph.edges(data=True):
+        if 'labels' in data:
+            data['labels'] = ','.join(sorted(data['labels']))
+    return graph
@@ -1,9 +1,11 @@
+import os
+import pickle
 import logging
 import pandas as pd
 import numpy as np
-import networkx as nx
 from statsmodels.stats.multitest import fdrcorrection
 from scipy.stats import gmean, gstd
+from genewalk.annotation_index import AnnotationIndex
 
 logger = logging.getLogger('genewalk.perform_statistics')
 
@@ -26,27 +28,72 @@ class GeneWalk(object):
 
     Parameters
     ----------
-    graph : networkx.MultiGraph
-        GeneWalk network for which the statistics are calculated.
+    graph : networkx.MultiGraph or AnnotationIndex
+        GeneWalk network for which the statistics are calculated, or its
+        annotation index (see genewalk.annotation_index).
     genes : list of dict
         List of gene references for relevant genes.
     nvs : list of dict
-        Node vectors for nodes in the graph.
+        Node vectors for nodes in the graph. Can be None if the similarities
+        and p-values of all gene-GO pairs are loaded with load_pair_stats.
     null_dist : np.array
-        Similarity random (null) distribution.
+        Similarity random (null) distribution. Can be None if the
+        similarities and p-values of all gene-GO pairs are loaded with
+        load_pair_stats.
+
+    cache_pair_stats : Optional[bool]
+        If True, the similarities and p-values of the gene-GO pairs of the
+        genes are kept once calculated, so that they can be saved with
+        save_pair_stats. If False, they are calculated whenever a gene is
+        output and memory usage does not grow with the number of genes.
+        Default: True
+
+    Attributes
+    ----------
+    sims : np.array
+        The similarity of each gene-GO pair of the genes (columns, ordered
+        by gene position in the annotation index and then as in the
+        annotation index) in each node vector replicate (rows), or None if
+        cache_pair_stats is False.
+    pvals : np.array
+        The p-value of each gene-GO pair in each replicate, same shape as
+        sims.
     """
-    def __init__(self, graph, genes, nvs, null_dist):
+    def __init__(self, graph, genes, nvs, null_dist, cache_pair_stats=True):
         self.graph = graph
         self.genes = genes
         self.nvs = nvs
         self.srd = null_dist
-        self.go_nodes = set(nx.get_node_attributes(self.graph, 'GO'))
+        if isinstance(graph, AnnotationIndex):
+            self.index = graph
+        else:
+            self.index = AnnotationIndex.from_graph(graph)
         self.gene_nodes = set([g['HGNC_SYMBOL'] for g in self.genes])
+        self.nreps = len(nvs) if nvs is not None else 0
+        # The gene-GO pairs of the genes in the annotation index, in a CSR
+        # layout of their own
+        self.pair_gene_pos = np.unique(np.array(
+            [self.index.gene_pos[g] for g in self.gene_nodes
+             if g in self.index.gene_pos], dtype=np.int64))
+        self.pair_rows = {pos: k for k, pos in
+                          enumerate(self.pair_gene_pos.tolist())}
+        self.pair_indptr = np.zeros(len(self.pair_gene_pos) + 1,
+                                    dtype=np.int64)
+        self.pair_indptr[1:] = np.cumsum(
+            self.index.indptr[self.pair_gene_pos + 1] -
+            self.index.indptr[self.pair_gene_pos])
+        if cache_pair_stats:
+            npairs = int(self.pair_indptr[-1])
+            self.sims = np.full((self.nreps, npairs), np.nan)
+            self.pvals = np.full((self.nreps, npairs), np.nan)
+        else:
+            self.sims = self.pvals = None
+        self.pairs_done = np.zeros(len(self.pair_gene_pos), dtype=bool)
 
     def get_gene_attribs(self, gene):
         """Return an attribute dict for a given gene."""
-        if gene['HGNC_SYMBOL'] in self.graph:
-            ncon_gene = len(self.graph[gene['HGNC_SYMBOL']])
+        if gene['HGNC_SYMBOL'] in self.index:
+            ncon_gene = self.index.degree(gene['HGNC_SYMBOL'])
         else:
             ncon_gene = np.nan
         return {
@@ -55,29 +102,107 @@ class GeneWalk(object):
             'ncon_gene': ncon_gene
         }
 
-    def get_go_attribs(self, gene_attribs, nv, alpha_fdr):
-        """Return GO entries and their attributes for a given gene."""
-        gene_node_id = gene_attribs['hgnc_symbol']
-        connected = set(self.graph[gene_node_id]) & self.go_nodes
-        go_attribs = []
-        pvals = []
-        for go_node_id in connected:
-            go_attrib = {}
-            sim_score = nv.similarity(gene_node_id, go_node_id)
-            go_attrib['sim_score'] = sim_score
-            go_attrib['go_id'] = go_node_id
-            go_attrib['ncon_go'] = len(self.graph[go_node_id])
-            go_attrib['go_name'] = self.graph.nodes[go_node_id]['name']
-            go_attrib['go_domain'] = \
-                self.graph.nodes[go_node_id]['domain'].replace('_', ' ')
-            go_attrib['pval'] = self.psim(sim_score)
-            pvals.append(go_attrib['pval'])
-            go_attribs.append(go_attrib)
-        _, qvals = fdrcorrection(pvals, alpha=alpha_fdr, method='indep')
-        for idx in range(len(go_attribs)):
-            go_attribs[idx]['qval'] = qvals[idx]
-        return go_attribs
-        
+    def get_pair_stats(self, gene_node_id):
+        """Return the GO IDs connected to a gene node and the similarities
+        and p-values of the gene-GO pairs in each replicate.
+
+        The similarities and p-values of the genes of this object are
+        calculated the first time a gene is requested and are stored in
+        the sims and pvals attributes, unless cache_pair_stats is False.
+        Those of other genes in the annotation index are calculated on
+        every request.
+        """
+        pos = self.index.gene_pos[gene_node_id]
+        go_ids = [str(self.index.go_ids[i]) for i in
+                  self.index.indices[self.index.indptr[pos]:
+                                     self.index.indptr[pos + 1]]]
+        row = self.pair_rows.get(pos) if self.sims is not None else None
+        if row is None:
+            return (go_ids,) + self._calculate_pair_stats(gene_node_id,
+                                                          go_ids)
+        pairs = slice(self.pair_indptr[row], self.pair_indptr[row + 1])
+        if not self.pairs_done[row]:
+            self.sims[:, pairs], self.pvals[:, pairs] = \
+                self._calculate_pair_stats(gene_node_id, go_ids)
+            self.pairs_done[row] = True
+        return go_ids, self.sims[:, pairs], self.pvals[:, pairs]
+
+    def _calculate_pair_stats(self, gene_node_id, go_ids):
+        sims = np.array([[nv.similarity(gene_node_id, go_id)
+                          for go_id in go_ids] for nv in self.nvs],
+                        dtype=np.float64).reshape(self.nreps, len(go_ids))
+        return sims, self.psim(sims)
+
+    def compute_pair_stats(self):
+        """Calculate the similarities and p-values of all gene-GO pairs of
+        the genes."""
+        for pos in self.pair_gene_pos:
+            self.get_pair_stats(str(self.index.gene_ids[pos]))
+
+    def save_pair_stats(self, fname):
+        """Save the similarities and p-values of all gene-GO pairs of the
+        genes.
+
+        The saved arrays can be loaded with load_pair_stats to generate the
+        output with a different alpha_fdr, base_id_type or subset of genes
+        without the node vectors and the null distribution.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the numpy (npz) file to save the arrays into.
+        """
+        if self.sims is None:
+            raise ValueError('The pair statistics are not kept if '
+                             'cache_pair_stats is False.')
+        self.compute_pair_stats()
+        np.savez(fname, sims=self.sims, pvals=self.pvals,
+                 gene_ids=self.index.gene_ids[self.pair_gene_pos],
+                 indptr=self.pair_indptr,
+                 indices=self._get_pair_go_pos())
+
+    def load_pair_stats(self, fname):
+        """Load the similarities and p-values of the gene-GO pairs of the
+        genes from a file saved with save_pair_stats for the same genes or
+        for a superset of them.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the numpy (npz) file to load the arrays from.
+        """
+        if self.sims is None:
+            raise ValueError('The pair statistics are not kept if '
+                             'cache_pair_stats is False.')
+        with np.load(fname, allow_pickle=False) as fh:
+            saved_rows = {g: k for k, g in enumerate(fh['gene_ids'])}
+            saved_indptr = fh['indptr']
+            rows = [saved_rows.get(g) for g in
+                    self.index.gene_ids[self.pair_gene_pos]]
+            if any(row is None for row in rows):
+                raise ValueError('The gene-GO pairs in %s do not match the '
+                                 'GeneWalk network.' % fname)
+            pairs = np.concatenate(
+                [np.arange(saved_indptr[row], saved_indptr[row + 1])
+                 for row in rows] + [np.array([], dtype=np.int64)])
+            if not np.array_equal(fh['indices'][pairs],
+                                  self._get_pair_go_pos()):
+                raise ValueError('The gene-GO pairs in %s do not match the '
+                                 'GeneWalk network.' % fname)
+            self.sims = fh['sims'][:, pairs]
+            self.pvals = fh['pvals'][:, pairs]
+        self.nreps = self.sims.shape[0]
+        self.pairs_done[:] = True
+
+    def _get_pair_go_pos(self):
+        """Return the positions of the GO terms of the gene-GO pairs of the
+        genes in the annotation index."""
+        return np.concatenate(
+            [self.index.indices[self.index.indptr[pos]:
+                                self.index.indptr[pos + 1]]
+             for pos in self.pair_gene_pos] +
+            [np.array([], dtype=self.index.indices.dtype)])
+
     def log_stats(self, vals):
         eps = 1e-16
         nreps = len(vals)
@@ -94,7 +219,11 @@ class GeneWalk(object):
                gene_attribs['ncon_gene'],
                np.nan, np.nan, np.nan, np.nan,
                np.nan, np.nan, np.nan, np.nan, np.nan]
-        row.extend([np.nan for i in range(len(self.nvs))])
+        row.extend([np.nan for i in range(self.nreps)])
+        return self.add_base_id(gene, row, base_id_type)
+
+    def add_base_id(self, gene, row, base_id_type):
+        """Prepend the gene's base ID to a row if it is not an HGNC ID."""
         if base_id_type == 'mgi_id':
             row = [gene.get('MGI', '')] + row
         elif base_id_type == 'ensembl_id':
@@ -104,6 +233,64 @@ class GeneWalk(object):
             row = [gene.get('EGID', '')] + row
         return row
 
+    def get_header(self, base_id_type):
+        """Return the column names of the rows returned by get_gene_rows."""
+        header = ['hgnc_symbol', 'hgnc_id',
+                  'go_name', 'go_id', 'go_domain',
+                  'ncon_gene', 'ncon_go',
+                  'gene_padj', 'pval',
+                  'sim',  'sem_sim',
+                  'cilow_gene_padj', 'ciupp_gene_padj',
+                  'cilow_pval', 'ciupp_pval']
+        header.extend(self.get_pval_rep_columns())
+        if base_id_type in {'mgi_id', 'ensembl_id', 'entrez_human',
+                            'entrez_mouse'}:
+            header = [base_id_type] + header
+        return header
+
+    def get_pval_rep_columns(self):
+        return ['pval_rep'+str(i) for i in range(self.nreps)]
+
+    def get_gene_rows(self, gene, alpha_fdr, base_id_type):
+        """Return the output rows (including the per-replicate p-values)
+        for a given gene."""
+        rows = []
+        gene_attribs = self.get_gene_attribs(gene)
+        # gene present in GW network
+        if not np.isnan(gene_attribs['ncon_gene']):
+            go_ids, sims, pvals = \
+                self.get_pair_stats(gene_attribs['hgnc_symbol'])
+            qvals = np.empty_like(pvals)
+            if go_ids:  # gene has GO connections
+                for i in range(self.nreps):
+                    _, qvals[i] = fdrcorrection(pvals[i], alpha=alpha_fdr,
+                                                method='indep')
+            for j, go_id in enumerate(go_ids):
+                gene_padj, low_gene_padj, upp_gene_padj = \
+                    self.log_stats(qvals[:, j])
+                mean_pval, low_pval, upp_pval = self.log_stats(pvals[:, j])
+                mean_sim = np.mean(sims[:, j])
+                sem_sim = np.std(sims[:, j]) / np.sqrt(self.nreps)
+                if gene_padj < alpha_fdr or alpha_fdr == 1:
+                    row = [gene_attribs['hgnc_symbol'],
+                           gene_attribs['hgnc_id'],
+                           self.index.get_go_name(go_id),
+                           go_id,
+                           self.index.get_go_domain(go_id).replace('_', ' '),
+                           gene_attribs['ncon_gene'],
+                           self.index.degree(go_id),
+                           gene_padj, mean_pval,
+                           mean_sim, sem_sim,
+                           low_gene_padj, upp_gene_padj,
+                           low_pval, upp_pval]
+                    row.extend(pvals[:, j])
+                    # If dealing with mouse genes, prepend the MGI ID
+                    row = self.add_base_id(gene, row, base_id_type)
+                    rows.append(row)
+        elif alpha_fdr == 1:  # case: not in graph
+            rows.append(self.add_empty_row(gene, gene_attribs, base_id_type))
+        return rows
+
     def generate_output(self, alpha_fdr=1, base_id_type='hgnc_symbol'):
         """Main function of GeneWalk object that generates the final
         GeneWalk output table (in csv format).
@@ -122,84 +309,133 @@ class GeneWalk(object):
         """
         rows = []
         for gene in self.genes:
-            gene_attribs = self.get_gene_attribs(gene)
-            # gene present in GW network
-            if not np.isnan(gene_attribs['ncon_gene']):
-                all_go_attribs = [self.get_go_attribs(gene_attribs, nv,
-                                                      alpha_fdr)
-                                  for nv in self.nvs]
-                if all_go_attribs:  # gene has GO connections
-                    go_attrib_dict = {}
-                    for go_attrib_list in all_go_attribs:
-                        for go_attribs in go_attrib_list:
-                            go_id = go_attribs['go_id']
-                            if go_id in go_attrib_dict:
-                                go_attrib_dict[go_id].append(go_attribs)
-                            else:
-                                go_attrib_dict[go_id] = [go_attribs]
-
-                    for go_id, go_attribs in go_attrib_dict.items():
-                        gene_padj, low_gene_padj, upp_gene_padj = \
-                            self.log_stats([attr['qval']
-                                            for attr in go_attribs])
-                        mean_pval, low_pval, upp_pval = \
-                            self.log_stats([attr['pval']
-                                            for attr in go_attribs])
-                        mean_sim = np.mean([attr['sim_score']
-                                            for attr in go_attribs])
-                        sem_sim = (np.std([attr['sim_score']
-                                           for attr in go_attribs]) /
-                                   np.sqrt(len(self.nvs)))
-                        if gene_padj < alpha_fdr or alpha_fdr == 1:
-                            row = [gene_attribs['hgnc_symbol'],
-                                   gene_attribs['hgnc_id'],
-                                   go_attribs[0]['go_name'],
-                                   go_attribs[0]['go_id'],
-                                   go_attribs[0]['go_domain'],
-                                   gene_attribs['ncon_gene'],
-                                   go_attribs[0]['ncon_go'],
-                                   gene_padj, mean_pval, 
-                                   mean_sim, sem_sim,
-                                   low_gene_padj, upp_gene_padj,
-                                   low_pval, upp_pval]
-                            row.extend([attr['pval'] for attr in go_attribs])
-                            # If dealing with mouse genes, prepend the MGI ID
-                            if base_id_type == 'mgi_id':
-                                row = [gene.get('MGI', '')] + row
-                            elif base_id_type == 'ensembl_id':
-                                row = [gene.get('ENSEMBL', '')] + row
-                            elif base_id_type == 'entrez_mouse' or \
-                                 base_id_type == 'entrez_human':
-                                row = [gene.get('EGID', '')] + row
-                            rows.append(row)
-                elif alpha_fdr == 1:  #case: no GO connections
-                    row = self.add_empty_row(gene, gene_attribs, base_id_type)
-                    rows.append(row)
-            elif alpha_fdr == 1:  # case: not in graph
-                row = self.add_empty_row(gene, gene_attribs, base_id_type)
-                rows.append(row)
-        header = ['hgnc_symbol', 'hgnc_id',
-                  'go_name', 'go_id', 'go_domain',
-                  'ncon_gene', 'ncon_go',
-                  'gene_padj', 'pval', 
-                  'sim',  'sem_sim',
-                  'cilow_gene_padj', 'ciupp_gene_padj',
-                  'cilow_pval', 'ciupp_pval']
-        header.extend(['pval_rep'+str(i) for i in range(len(self.nvs))])
-        if base_id_type in {'mgi_id', 'ensembl_id', 'entrez_human',
-                            'entrez_mouse'}:
-            header = [base_id_type] + header
+            rows += self.get_gene_rows(gene, alpha_fdr, base_id_type)
+        df = pd.DataFrame.from_records(rows,
+                                       columns=self.get_header(base_id_type))
+        df = self.global_fdr(df, alpha_fdr)
+        df.drop(self.get_pval_rep_columns(), axis=1, inplace=True)
+        return self.format_output(df, base_id_type)
+
+    def write_output(self, fname, alpha_fdr=1, base_id_type='hgnc_symbol',
+                     chunk_size=1000, float_format='%.3e'):
+        """Stream the GeneWalk output table into a csv file.
 
-        df = pd.DataFrame.from_records(rows, columns=header)
-        df = self.global_fdr(df,alpha_fdr)
-        df.drop(['pval_rep'+str(i) for i in range(len(self.nvs))],
-                axis=1, inplace=True) 
-        df[base_id_type] = df[base_id_type].astype('category')
-        df[base_id_type].cat.set_categories(df[base_id_type].unique(),
-                                            inplace=True)
+        Genes are processed in chunks of chunk_size genes. The result rows
+        of each chunk are written into a temporary file as they are
+        generated, while the per-replicate p-values needed for the global
+        FDR correction are kept in an on-disk float array rather than in
+        data frame columns. If the object was created with
+        cache_pair_stats=False, peak memory is therefore set by chunk_size
+        rather than by the number of genes. The resulting file has the same
+        rows and columns as the table returned by generate_output.
+
+        Parameters
+        ----------
+        fname : str
+            The path to the csv file to write the results into.
+        alpha_fdr : Optional[float]
+            Significance level for FDR [0,1], see generate_output.
+        base_id_type : Optional[str]
+            The type of gene IDs that were the basis of doing the analysis,
+            see generate_output.
+        chunk_size : Optional[int]
+            The number of genes processed per chunk. Default: 1000
+        float_format : Optional[str]
+            Format string for floating point numbers in the csv file.
+            Default: %.3e
+        """
+        header = self.get_header(base_id_type)
+        pval_cols = self.get_pval_rep_columns()
+        rows_fname = fname + '.rows.tmp'
+        pvals_fname = fname + '.pvals.tmp'
+        tmp_fname = fname + '.tmp'
+        qvals = None
+        # The temporary files are removed and the csv file is only put in
+        # place if all passes succeed
+        try:
+            # Pass 1: generate the rows chunk by chunk, set aside their
+            # per-replicate p-values and pickle the rest of each chunk
+            nrows = 0
+            chunk_sizes = []
+            # Connection counts are formatted as floats if any row in the
+            # whole table has a missing count, as in generate_output
+            float_cols = set()
+            with open(rows_fname, 'wb') as rows_fh, \
+                    open(pvals_fname, 'wb') as pvals_fh:
+                for idx in range(0, len(self.genes), chunk_size):
+                    rows = []
+                    for gene in self.genes[idx:idx + chunk_size]:
+                        rows += self.get_gene_rows(gene, alpha_fdr,
+                                                   base_id_type)
+                    df = pd.DataFrame.from_records(rows, columns=header)
+                    pvals_fh.write(np.ascontiguousarray(
+                        df[pval_cols].to_numpy(dtype=np.float64)).tobytes())
+                    df.drop(pval_cols, axis=1, inplace=True)
+                    float_cols |= {col for col in ('ncon_gene', 'ncon_go')
+                                   if df[col].isna().any()}
+                    pickle.dump(df, rows_fh)
+                    nrows += len(df)
+                    chunk_sizes.append(len(df))
+                    logger.info('Statistics for %d/%d genes complete.' %
+                                (min(idx + chunk_size, len(self.genes)),
+                                 len(self.genes)))
+            # Pass 2: replace the p-values in the on-disk array by their
+            # FDR-corrected values over all gene-GO pairs, per replicate
+            if nrows:
+                qvals = np.memmap(pvals_fname, dtype=np.float64, mode='r+',
+                                  shape=(nrows, self.nreps))
+                ids = np.flatnonzero(~np.isnan(qvals[:, 0]))
+                if len(ids):
+                    for i in range(self.nreps):
+                        _, qvals[ids, i] = fdrcorrection(qvals[ids, i],
+                                                         alpha=alpha_fdr,
+                                                         method='indep')
+                qvals.flush()
+            # Pass 3: add the global statistics to each chunk and write it
+            # out
+            offset = 0
+            first = True
+            with open(rows_fname, 'rb') as rows_fh:
+                for chunk_len in chunk_sizes:
+                    df = pickle.load(rows_fh)
+                    if not chunk_len:
+                        continue
+                    chunk_qvals = np.asarray(
+                        qvals[offset:offset + chunk_len])
+                    offset += chunk_len
+                    ids = np.flatnonzero(~np.isnan(chunk_qvals[:, 0]))
+                    df = self.add_global_stats(df, df.index[ids],
+                                               chunk_qvals[ids])
+                    for col in float_cols:
+                        df[col] = df[col].astype(float)
+                    df = self.format_output(df, base_id_type)
+                    df.to_csv(tmp_fname, index=False,
+                              float_format=float_format,
+                              mode='w' if first else 'a', header=first)
+                    first = False
+            # No rows at all: still write a table with a header
+            if first:
+                df = pd.DataFrame(columns=header).drop(pval_cols, axis=1)
+                df = self.add_global_stats(df, df.index,
+                                           np.empty((0, self.nreps)))
+                df = self.format_output(df, base_id_type)
+                df.to_csv(tmp_fname, index=False, float_format=float_format)
+            os.replace(tmp_fname, fname)
+        finally:
+            # Release the memory map before removing its file
+            qvals = None
+            for tmp in (rows_fname, pvals_fname, tmp_fname):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def format_output(self, df, base_id_type):
+        """Return the output table with categorical base IDs in input order,
+        string-valued connection counts and sorted rows."""
+        df[base_id_type] = pd.Categorical(
+            df[base_id_type], categories=pd.unique(df[base_id_type]))
         df[['ncon_gene', 'ncon_go']] = \
             df[['ncon_gene', 'ncon_go']].astype('str')
-        df = df.sort_values(by=[base_id_type, 'global_padj', 'gene_padj', 
+        df = df.sort_values(by=[base_id_type, 'global_padj', 'gene_padj',
                                 'sim', 'go_domain', 'go_name'],
                             ascending=[True, True, True, False, True, True])
         return df
@@ -210,30 +446,36 @@ class GeneWalk(object):
         with random similarity values.
         """
         rank = np.searchsorted(self.srd, sim)
-        pct_rank = float(rank) / len(self.srd)
+        pct_rank = rank / float(len(self.srd))
         pval = 1 - pct_rank
         eps = 1e-16
-        if pval < eps:
-            pval = eps
-        return pval
+        return np.maximum(pval, eps)
 
-    def global_fdr(self,df,alpha_fdr):
-        global_stats = {'global_padj': [], 'cilow_global_padj': [],
-                        'ciupp_global_padj': []}
-        colloc = {'global_padj': 8, 'cilow_global_padj': 4,
-                          'ciupp_global_padj': 4} 
+    def global_fdr(self, df, alpha_fdr):
+        """Add FDR-corrected p-values over all gene-GO pairs (global_padj)
+        with their confidence intervals across replicates."""
         ids = df[~df['pval_rep0'].isna()].index
-        qvals = np.empty((len(ids),len(self.nvs)))
+        qvals = np.empty((len(ids), self.nreps))
         qvals[:] = np.nan
-        for i in range(len(self.nvs)):
-            _, qvals[:,i] = fdrcorrection(df['pval_rep'+str(i)][ids], 
-                                        alpha=alpha_fdr, method='indep')
+        for i in range(self.nreps):
+            _, qvals[:, i] = fdrcorrection(df['pval_rep'+str(i)][ids],
+                                           alpha=alpha_fdr, method='indep')
+        return self.add_global_stats(df, ids, qvals)
+
+    def add_global_stats(self, df, ids, qvals):
+        """Insert the global_padj columns given the per-replicate global
+        FDR-corrected p-values (qvals) of the rows with the given index."""
+        global_stats = {'global_padj': [], 'cilow_global_padj': [],
+                        'ciupp_global_padj': []}
+        collocs = {'global_padj': 'gene_padj',
+                   'cilow_global_padj': 'cilow_gene_padj',
+                   'ciupp_global_padj': 'cilow_gene_padj'}
         for i in range(qvals.shape[0]):
-            mean_padj, low_padj, upp_padj = self.log_stats(qvals[i,:])
+            mean_padj, low_padj, upp_padj = self.log_stats(qvals[i, :])
             global_stats['global_padj'].append(mean_padj)
             global_stats['cilow_global_padj'].append(low_padj)
             global_stats['ciupp_global_padj'].append(upp_padj)
         for key in global_stats.keys():
-            df.insert((len(df.columns)-colloc[key]-len(self.nvs)),key,np.nan)
-            df.loc[ids,key] = global_stats[key]
-        return df
\ No newline at end of file
+            df.insert(df.columns.get_loc(collocs[key]), key, np.nan)
+            df.loc[ids, key] = global_stats[key]
+        return df
@@ -0,0 +1,292 @@
+"""This module implements an in-process query layer over the results of a
+GeneWalk project. It loads the node vectors, the null distribution and the
+annotation index of a project once, and then answers queries for the GO
+terms of individual genes without rerunning the statistics stage over all
+genes. Queries can be made through the GeneWalkQuery class, from the command
+line (genewalk query), or through a local HTTP server."""
+import os
+import sys
+import csv
+import json
+import pickle
+import logging
+import argparse
+import numpy as np
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, unquote
+from genewalk.perform_statistics import GeneWalk
+from genewalk.annotation_index import AnnotationIndex
+from genewalk.graph import GeneWalkGraph
+
+logger = logging.getLogger('genewalk.query')
+
+default_base_folder = os.path.join(os.path.expanduser('~/'), 'genewalk')
+
+query_columns = ['go_name', 'go_id', 'go_domain', 'ncon_gene', 'ncon_go',
+                 'gene_padj', 'pval', 'sim', 'sem_sim',
+                 'cilow_gene_padj', 'ciupp_gene_padj',
+                 'cilow_pval', 'ciupp_pval']
+
+
+class GeneWalkQuery(object):
+    """Answers per-gene queries on the results of a GeneWalk project.
+
+    Parameters
+    ----------
+    project_folder : str
+        The folder of a GeneWalk project for which the node_vectors and
+        null_distribution stages have been run.
+    nreps_graph : Optional[int]
+        The number of node vector replicates to use. By default all
+        replicates found in the project folder are used.
+
+    Attributes
+    ----------
+    gw : genewalk.perform_statistics.GeneWalk
+        The GeneWalk object used to calculate the statistics of a gene.
+    """
+    def __init__(self, project_folder, nreps_graph=None):
+        self.project_folder = project_folder
+        genes = self._load_pickle('genes')
+        fname = os.path.join(project_folder, 'annotation_index.npz')
+        if os.path.exists(fname):
+            logger.info('Loading %s...' % fname)
+            index = AnnotationIndex.load(fname)
+        elif os.path.exists(os.path.join(project_folder, 'genewalk_graph')):
+            index = AnnotationIndex.from_graph(GeneWalkGraph.load(
+                os.path.join(project_folder, 'genewalk_graph')))
+        else:
+            index = AnnotationIndex.from_graph(
+                self._load_pickle('multi_graph'))
+        if nreps_graph is None:
+            nreps_graph = 0
+            while os.path.exists(self._get_fname(
+                    'deepwalk_node_vectors_%d' % (nreps_graph + 1))):
+                nreps_graph += 1
+        if not nreps_graph:
+            raise ValueError('No node vectors found in %s.' % project_folder)
+        nvs = [self._load_pickle('deepwalk_node_vectors_%d' % (i + 1))
+               for i in range(nreps_graph)]
+        null_dist = self._load_pickle('genewalk_rand_simdists')
+        self.gw = GeneWalk(index, genes, nvs, null_dist)
+        self.gene_refs = {}
+        for gene in genes:
+            for key in ('MGI', 'ENSEMBL', 'HGNC', 'HGNC_SYMBOL'):
+                if gene.get(key):
+                    self.gene_refs[gene[key]] = gene
+            if gene.get('HGNC'):
+                self.gene_refs['HGNC:%s' % gene['HGNC']] = gene
+        self._cache = {}
+
+    def _get_fname(self, prefix):
+        return os.path.join(self.project_folder, '%s.pkl' % prefix)
+
+    def _load_pickle(self, prefix):
+        fname = self._get_fname(prefix)
+        logger.info('Loading %s...' % fname)
+        with open(fname, 'rb') as fh:
+            return pickle.load(fh)
+
+    def get_gene_ref(self, gene):
+        """Return the gene reference for a gene symbol or ID.
+
+        Genes that are not in the project's gene list but are part of the
+        GeneWalk network can be queried by their HGNC symbol.
+        """
+        if gene in self.gene_refs:
+            return self.gene_refs[gene]
+        elif gene in self.gw.index.gene_pos:
+            return {'HGNC_SYMBOL': gene, 'HGNC': None}
+        raise KeyError('Unknown gene: %s' % gene)
+
+    def query(self, gene, alpha_fdr=1):
+        """Return the GO terms connected to a gene and their statistics.
+
+        Results are cached per (gene, alpha_fdr).
+
+        Parameters
+        ----------
+        gene : str
+            An HGNC symbol, HGNC ID, MGI ID or Ensembl ID of a gene in the
+            project's gene list, or the HGNC symbol of any gene in the
+            GeneWalk network.
+        alpha_fdr : Optional[float]
+            Significance level for FDR [0,1]. If set to a value below 1,
+            only GO terms with gene_padj < alpha_fdr are returned.
+            Default: 1
+
+        Returns
+        -------
+        list of dict
+            The GO terms connected to the gene with their similarity,
+            p-value and gene_padj (and confidence intervals), sorted by
+            gene_padj and similarity.
+        """
+        gene_ref = self.get_gene_ref(gene)
+        key = (gene_ref['HGNC_SYMBOL'], alpha_fdr)
+        if key not in self._cache:
+            self._cache[key] = self._query(gene_ref, alpha_fdr)
+        return self._cache[key]
+
+    def _query(self, gene_ref, alpha_fdr):
+        header = self.gw.get_header('hgnc_symbol')
+        results = []
+        for row in self.gw.get_gene_rows(gene_ref, alpha_fdr,
+                                         'hgnc_symbol'):
+            row = dict(zip(header, row))
+            if not row['go_id']:
+                continue
+            results.append({col: _to_json_value(row[col])
+                            for col in query_columns})
+        return sorted(results, key=lambda r: (_sort_value(r['gene_padj']),
+                                              -_sort_value(r['sim'])))
+
+
+def _to_json_value(value):
+    """Return a value as a JSON-serializable Python object, with NaN as
+    None."""
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _sort_value(value):
+    return np.inf if value is None else value
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(gwq, host='127.0.0.1', port=8000):
+    """Serve gene queries over HTTP until interrupted.
+
+    Parameters
+    ----------
+    gwq : GeneWalkQuery
+        The query object answering the requests.
+    host : Optional[str]
+        The host name to listen on. Default: 127.0.0.1
+    port : Optional[int]
+        The port to listen on. Default: 8000
+    """
+    server = get_server(gwq, host=host, port=port)
+    logger.info('Serving GeneWalk queries on http://%s:%d/genes/<gene>' %
+                (host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def get_server(gwq, host='127.0.0.1', port=8000):
+    """Return an HTTP server answering gene queries.
+
+    The server answers GET requests of the form /genes/<gene>?alpha_fdr=0.1
+    with the JSON-encoded result of GeneWalkQuery.query, in which missing
+    values are null.
+
+    Parameters
+    ----------
+    gwq : GeneWalkQuery
+        The query object answering the requests.
+    host : Optional[str]
+        The host name to listen on. Default: 127.0.0.1
+    port : Optional[int]
+        The port to listen on, or 0 for any free port. Default: 8000
+
+    Returns
+    -------
+    http.server.HTTPServer
+        The server, which is started with its serve_forever method.
+    """
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [unquote(p) for p in url.path.split('/') if p]
+            if len(parts) != 2 or parts[0] != 'genes':
+                return self._respond(404, {'error': 'Not found'})
+            params = parse_qs(url.query)
+            try:
+                alpha_fdr = float(params.get('alpha_fdr', [1])[0])
+                res = gwq.query(parts[1], alpha_fdr=alpha_fdr)
+            except KeyError as e:
+                return self._respond(404, {'error': str(e.args[0])})
+            except ValueError as e:
+                return self._respond(400, {'error': str(e)})
+            self._respond(200, res)
+
+        def _respond(self, status, content):
+            body = json.dumps(content, allow_nan=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.info(format % args)
+
+    return _ThreadingHTTPServer((host, port), QueryHandler)
+
+
+def main(argv=None):
+    """Query genes of a project and optionally serve queries, run as
+    genewalk query."""
+    parser = argparse.ArgumentParser(
+        prog='genewalk query',
+        description='Query the GO terms of genes in a GeneWalk project '
+                    'for which the node_vectors and null_distribution '
+                    'stages have been run.')
+    parser.add_argument('--project', required=True,
+                        help='The name of the project (i.e. its folder '
+                             'within the base folder).')
+    parser.add_argument('--base_folder', default=default_base_folder,
+                        help='The base folder containing the project '
+                             'folder. Default: %(default)s')
+    parser.add_argument('--nreps_graph', default=None, type=int,
+                        help='The number of node vector replicates to use. '
+                             'By default all replicates in the project '
+                             'folder are used.')
+    parser.add_argument('--genes', nargs='*', default=[],
+                        help='Genes to query and print the results for.')
+    parser.add_argument('--alpha_fdr', default=1, type=float,
+                        help='Significance level for FDR of printed '
+                             'results. Default: %(default)s')
+    parser.add_argument('--serve', action='store_true',
+                        help='Start a local HTTP server answering queries '
+                             'of the form /genes/<gene>?alpha_fdr=<alpha>.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='The host of the HTTP server. '
+                             'Default: %(default)s')
+    parser.add_argument('--port', default=8000, type=int,
+                        help='The port of the HTTP server. '
+                             'Default: %(default)s')
+    args = parser.parse_args(argv)
+
+    gwq = GeneWalkQuery(os.path.join(args.base_folder, args.project),
+                        nreps_graph=args.nreps_graph)
+    writer = csv.writer(sys.stdout)
+    for gene in args.genes:
+        try:
+            res = gwq.query(gene, alpha_fdr=args.alpha_fdr)
+        except KeyError:
+            logger.warning('Gene %s is not in the GeneWalk network.' % gene)
+            continue
+        writer.writerow(['gene'] + query_columns)
+        for row in res:
+            writer.writerow([gene] + ['%.3e' % row[col]
+                                      if isinstance(row[col], float)
+                                      else row[col]
+                                      for col in query_columns])
+    if args.serve:
+        serve(gwq, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,241 @@
+"""This module implements a whole-genome GeneWalk reference network, which is
+built once from the gene-gene edges of Pathway Commons (or of a user-provided
+SIF file), the GO annotations and the GO ontology. The GeneWalk network of a
+project is then induced from the reference network given the project's genes,
+without assembling it from the resource files."""
+import os
+import logging
+import numpy as np
+from genewalk.graph import GeneWalkGraph
+from genewalk.edge_index import EdgeIndex
+from genewalk.go_index import GoaIndex, GoOntology, log_go_ontology_size
+
+logger = logging.getLogger('genewalk.reference')
+
+reference_format_version = 1
+
+
+def get_reference_fname(base_folder, name):
+    """Return the path of the file of a reference network in a base
+    folder."""
+    return os.path.join(base_folder, 'references', '%s.npz' % name)
+
+
+class ReferenceNetwork(object):
+    """Whole-genome GeneWalk network in indexed form.
+
+    Parameters
+    ----------
+    edge_index : genewalk.edge_index.EdgeIndex
+        The gene-gene edges of the network.
+    goa_index : genewalk.go_index.GoaIndex
+        The GO annotations of UniProt IDs.
+    go_ontology : genewalk.go_index.GoOntology
+        The GO ontology.
+    source : Optional[str]
+        A description of the source of the gene-gene edges.
+    """
+    def __init__(self, edge_index, goa_index, go_ontology, source=''):
+        self.edge_index = edge_index
+        self.goa_index = goa_index
+        self.go_ontology = go_ontology
+        self.source = source
+
+    @classmethod
+    def build(cls, resource_manager, network_file=None):
+        """Return the reference network built from the resources.
+
+        Parameters
+        ----------
+        resource_manager : genewalk.resources.ResourceManager
+            The resource manager used to get the GO annotations, the GO
+            ontology and, by default, the Pathway Commons network.
+        network_file : Optional[str]
+            The path to a SIF file (source, relationship type, target) of
+            gene-gene edges to use instead of Pathway Commons.
+
+        Returns
+        -------
+        ReferenceNetwork
+            The reference network.
+        """
+        if network_file:
+            edge_index = EdgeIndex.from_sif(network_file)
+            source = os.path.abspath(network_file)
+        else:
+            edge_index = resource_manager.get_pc_index()
+            source = 'pc'
+        return cls(edge_index, resource_manager.get_goa_index(),
+                   resource_manager.get_go_ontology(), source)
+
+    def save(self, fname):
+        """Save the reference network into a numpy (npz) file."""
+        arrays = {'edges_%s' % k: v
+                  for k, v in self.edge_index.to_arrays().items()}
+        arrays.update(self.goa_index.to_arrays())
+        arrays.update({'go_%s' % k: v
+                       for k, v in self.go_ontology.to_arrays().items()})
+        dirname = os.path.dirname(fname)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        logger.info('Saving reference network into %s' % fname)
+        tmp_fname = fname + '.tmp'
+        with open(tmp_fname, 'wb') as fh:
+            np.savez(fh, version=reference_format_version,
+                     source=np.array(self.source), **arrays)
+        os.replace(tmp_fname, fname)
+
+    @classmethod
+    def load(cls, fname):
+        """Return a reference network loaded from a file written by save."""
+        logger.info('Loading reference network from %s' % fname)
+        with np.load(fname, allow_pickle=False) as fh:
+            if int(fh['version']) != reference_format_version:
+                raise ValueError('Reference network %s has version %d, '
+                                 'expected %d.' %
+                                 (fname, int(fh['version']),
+                                  reference_format_version))
+            arrays = {k: fh[k] for k in fh.files}
+
+        def get_arrays(prefix):
+            return {k[len(prefix):]: v for k, v in arrays.items()
+                    if k.startswith(prefix)}
+
+        return cls(EdgeIndex.from_arrays(get_arrays('edges_')),
+                   GoaIndex.from_arrays(arrays),
+                   GoOntology.from_arrays(get_arrays('go_')),
+                   str(arrays['source']))
+
+    def get_graph(self, genes, go_ontology='full', go_neighborhood=0,
+                  annotate_ancestors=False):
+        """Return the GeneWalk network induced by a list of genes.
+
+        The network is the same as the one assembled by PcNxMgAssembler
+        from the same resources: the input genes with at least one edge
+        between them, their GO annotations, and the GO ontology.
+
+        Parameters
+        ----------
+        genes : list of dict
+            A list of gene references.
+        go_ontology : Optional[str]
+            'full' (default) or 'ancestors', see
+            genewalk.nx_mg_assembler.NxMgAssembler.
+        go_neighborhood : Optional[int]
+            See genewalk.nx_mg_assembler.NxMgAssembler. Default: 0
+        annotate_ancestors : Optional[bool]
+            See genewalk.nx_mg_assembler.NxMgAssembler. Default: False
+
+        Returns
+        -------
+        genewalk.graph.GeneWalkGraph
+            The GeneWalk network of the genes.
+        """
+        if go_ontology not in ('full', 'ancestors'):
+            raise ValueError('Unknown go_ontology: %s' % go_ontology)
+        label_pos = {}
+
+        def get_label_pos(label):
+            return label_pos.setdefault(label, len(label_pos))
+
+        # Gene-gene edges between the input genes, genes without such edges
+        # are left out
+        edges = self.edge_index.get_subgraph_edges(
+            [g['HGNC_SYMBOL'] for g in genes])
+        edge_sources = self.edge_index.sources[edges]
+        edge_targets = self.edge_index.targets[edges]
+        gene_pos = np.unique(np.concatenate([edge_sources, edge_targets]))
+        node_names = [self.edge_index.nodes[i] for i in gene_pos]
+        node_pos = {n: i for i, n in enumerate(node_names)}
+        rel_type_codes = self.edge_index.rel_type_codes[edges]
+        rel_type_pos = np.zeros(len(self.edge_index.rel_types),
+                                dtype=np.int64)
+        for code in np.unique(rel_type_codes):
+            rel_type_pos[code] = \
+                get_label_pos(self.edge_index.rel_types[code])
+        sources = [np.searchsorted(gene_pos, edge_sources)]
+        targets = [np.searchsorted(gene_pos, edge_targets)]
+        edge_labels = [rel_type_pos[rel_type_codes]]
+        logger.info('Number of PC originating nodes %d' % len(node_names))
+
+        # GO annotations of the genes in the network
+        go_node_pos = {}
+        annotations = []
+
+        def add_annotation(gene_node, pos, label):
+            if pos not in go_node_pos:
+                go_node_pos[pos] = len(node_names)
+                node_names.append(str(self.go_ontology.go_ids[pos]))
+            annotations.append((gene_node, go_node_pos[pos],
+                                get_label_pos(label)))
+
+        for gene in genes:
+            if 'UP' not in gene or gene.get('HGNC_SYMBOL') not in node_pos:
+                continue
+            gene_node = node_pos[gene['HGNC_SYMBOL']]
+            annotated = []
+            for go_id in self.goa_index.get_go_ids(gene['UP']):
+                pos = self.go_ontology.get_pos(go_id)
+                if pos is None or self.go_ontology.is_obsolete[pos]:
+                    continue
+                add_annotation(gene_node, pos, 'GO:annotation')
+                annotated.append(pos)
+            if not annotate_ancestors:
+                continue
+            for pos in self.go_ontology.get_propagated_terms(annotated):
+                add_annotation(gene_node, pos, 'GO:transitivity')
+        annotations = np.array(annotations, dtype=np.int64).reshape(-1, 3)
+        sources.append(annotations[:, 0])
+        targets.append(annotations[:, 1])
+        edge_labels.append(annotations[:, 2])
+
+        # GO ontology, with GO nodes added in the order of the terms, each
+        # followed by its parents
+        if go_ontology == 'ancestors':
+            keep = self.go_ontology.get_subontology(list(go_node_pos),
+                                                    go_neighborhood)
+        else:
+            keep = ~self.go_ontology.is_obsolete
+        children, parents = self.go_ontology.get_is_a_edges(keep)
+        terms = np.flatnonzero(keep)
+        order = np.lexsort((np.concatenate([np.zeros(len(terms)),
+                                            1 + np.arange(len(parents))]),
+                            np.concatenate([terms, children])))
+        terms = np.concatenate([terms, parents])[order]
+        _, first = np.unique(terms, return_index=True)
+        for pos in terms[np.sort(first)]:
+            if pos not in go_node_pos:
+                go_node_pos[pos] = len(node_names)
+                node_names.append(str(self.go_ontology.go_ids[pos]))
+        go_local_pos = np.zeros(len(self.go_ontology), dtype=np.int64)
+        go_local_pos[list(go_node_pos)] = list(go_node_pos.values())
+        # Edges are repeated for each listing of the child term, see
+        # GoOntology.get_nlistings
+        nlistings = self.go_ontology.get_nlistings()[children]
+        sources.append(go_local_pos[np.repeat(children, nlistings)])
+        targets.append(go_local_pos[np.repeat(parents, nlistings)])
+        edge_labels.append(np.full(nlistings.sum(), get_label_pos('GO:is_a')))
+        log_go_ontology_size(self.go_ontology, keep, go_ontology)
+
+        node_attributes = self._get_node_attributes(genes, node_names,
+                                                    go_node_pos)
+        return GeneWalkGraph.from_edges(node_names, np.concatenate(sources),
+                                        np.concatenate(targets),
+                                        np.concatenate(edge_labels),
+                                        list(label_pos), node_attributes)
+
+    def _get_node_attributes(self, genes, node_names, go_node_pos):
+        ngenes = len(node_names) - len(go_node_pos)
+        columns = {name: [None] * len(node_names)
+                   for name in ('HGNC', 'UP', 'name', 'GO', 'domain')}
+        gene_refs = {g['HGNC_SYMBOL']: g for g in genes}
+        for i, node in enumerate(node_names[:ngenes]):
+            for name in ('HGNC', 'UP'):
+                value = gene_refs[node][name]
+                columns[name][i] = value if value is None or \
+                    isinstance(value, str) else str(value)
+        for pos, i in go_node_pos.items():
+            columns['name'][i] = self.go_ontology.names[pos]
+            columns['GO'][i] = node_names[i]
+            columns['domain'][i] = self.go_ontology.namespaces[pos]
+        return columns
@@ -1,71 +1,584 @@
 import os
+import glob
 import gzip
+import json
+import zlib
 import shutil
+import hashlib
 import logging
+import threading
+import http.client
+import urllib.error
 import urllib.request
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from genewalk.edge_index import EdgeIndex
+from genewalk.go_index import GoaIndex, GoOntology, read_goa_gaf, \
+    goa_to_arrays, goa_from_arrays, default_goa_evidence_codes
+
+try:
+    import fcntl
+except ImportError:
+    # File locking is not available on Windows
+    fcntl = None
 
 logger = logging.getLogger('genewalk.resources')
 
+# Version of the format of the parsed resource cache files, part of the
+# key of each cache file
+resource_cache_version = 3
+
+# The URLs of the resource files, by file name
+default_resource_urls = {
+    'go.obo': 'http://snapshot.geneontology.org/ontology/go.obo',
+    'goa_human.gaf.gz': ('http://geneontology.org/gene-associations/'
+                         'goa_human.gaf.gz'),
+    'PathwayCommons11.All.hgnc.sif.gz': (
+        'http://www.pathwaycommons.org/archives/PC2/v11/'
+        'PathwayCommons11.All.hgnc.sif.gz'),
+}
+
+# The number of seconds to wait for a response of a resource server
+download_timeout = 60
+
 
 class ResourceManager(object):
-    def __init__(self, base_folder=None):
+    """Manages the resource files of GeneWalk in a resource folder.
+
+    Parameters
+    ----------
+    base_folder : Optional[str]
+        The base folder in whose resources subfolder the resource files are
+        stored. Default: ~/genewalk
+    keep_compressed : Optional[bool]
+        If True, the GO annotations and the Pathway Commons network are
+        kept gzip-compressed as downloaded and parsed from the compressed
+        files. Otherwise they are decompressed while being downloaded.
+        Either way, existing files are used. Default: False
+    urls : Optional[dict]
+        URLs to download resource files from instead of the ones in
+        default_resource_urls, by file name.
+    cache_in_memory : Optional[bool]
+        If True, the parsed resources are also kept in memory once loaded
+        and the same objects are returned on later calls, which is useful
+        when several projects are run in one process or in processes
+        forked from it. The objects must then not be modified.
+        Default: False
+
+    The size and hash of each downloaded file are recorded in a manifest
+    (manifest.json) in the resource folder, and files that no longer match
+    them, e.g. because they were truncated, are downloaded again. Files
+    that are not in the manifest, e.g. because they were downloaded before
+    it was introduced, are checked once and added to it if complete.
+
+    Several processes can share a resource folder: each resource file is
+    downloaded and parsed by a single process holding a lock on it, while
+    the others wait and then use the same files.
+    """
+    def __init__(self, base_folder=None, keep_compressed=False, urls=None,
+                 cache_in_memory=False):
         self.base_folder = base_folder if base_folder else \
             os.path.join(os.path.expanduser('~'), 'genewalk')
+        self.keep_compressed = keep_compressed
+        self.urls = dict(default_resource_urls)
+        if urls:
+            self.urls.update(urls)
         self.resource_folder = self._get_resource_folder()
+        self.manifest_fname = os.path.join(self.resource_folder,
+                                           'manifest.json')
+        self._memo = {} if cache_in_memory else None
         logger.info('Using %s as resource folder.' % self.resource_folder)
 
     def get_go_obo(self):
-        fname = os.path.join(self.resource_folder, 'go.obo')
-        if not os.path.exists(fname):
-            download_go(fname)
-        return fname
+        return self._get_resource('go.obo')
 
     def get_goa_gaf(self):
-        fname = os.path.join(self.resource_folder, 'goa_human.gaf')
-        if not os.path.exists(fname):
-            url_goa = ('http://geneontology.org/gene-associations/'
-                       'goa_human.gaf.gz')
-            download_gz(fname, url_goa)
-        return fname
+        return self._get_resource('goa_human.gaf', compressed=True)
+
+    def _get_resource(self, name, compressed=False):
+        """Return the path of a resource file, downloading it if it does not
+        exist or does not match the manifest.
+
+        A resource distributed gzip-compressed is the decompressed file if
+        it exists and the compressed file otherwise.
+        """
+        fname = os.path.join(self.resource_folder, name)
+        gz_fname = fname + '.gz'
+        url = self.urls[name + '.gz' if compressed else name]
+        existing_fnames = [fname, gz_fname] if compressed else [fname]
+        for existing_fname in existing_fnames:
+            if os.path.exists(existing_fname) and \
+                    self._matches_manifest(existing_fname, url):
+                return existing_fname
+        with file_lock(fname + '.lock'):
+            # Another process may have downloaded the file while we waited
+            for existing_fname in existing_fnames:
+                if os.path.exists(existing_fname) and \
+                        self._matches_manifest(existing_fname, url):
+                    return existing_fname
+            # A decompressed file that is not in the manifest cannot be
+            # checked, but is still used if it cannot be downloaded again
+            unchecked = compressed and os.path.exists(fname) and \
+                os.path.basename(fname) not in self.get_manifest()
+            download_fname = gz_fname if compressed and self.keep_compressed \
+                else fname
+            try:
+                download_file(url, download_fname, decompress=compressed and
+                              not self.keep_compressed)
+            except (OSError, http.client.HTTPException) as e:
+                if not unchecked:
+                    raise
+                logger.warning('Could not download %s (%s), using %s '
+                               'without checking it.' % (url, e, fname))
+                return fname
+            self._add_to_manifest(download_fname, url)
+        return download_fname
+
+    def get_manifest(self):
+        """Return the manifest of the downloaded resource files, a dict with
+        the URL, size and SHA-256 hash of each file by file name."""
+        if not os.path.exists(self.manifest_fname):
+            return {}
+        with open(self.manifest_fname, 'r') as fh:
+            return json.load(fh)
+
+    def _matches_manifest(self, fname, url):
+        entry = self.get_manifest().get(os.path.basename(fname))
+        if entry is None:
+            return self._check_unlisted_file(fname, url)
+        if os.path.getsize(fname) == entry['size'] and \
+                get_file_hash(fname) == entry['sha256']:
+            return True
+        logger.warning('%s does not match the size and hash recorded when '
+                       'it was downloaded, downloading it again.' % fname)
+        return False
+
+    def _check_unlisted_file(self, fname, url):
+        """Return whether a file that is not in the manifest is complete,
+        adding it to the manifest if so.
+
+        A gzip-compressed file is complete if it can be decompressed, and a
+        file saved as downloaded if it has the size reported by the server.
+        A file decompressed while being downloaded cannot be checked and is
+        downloaded again.
+        """
+        if fname.endswith('.gz'):
+            complete = is_complete_gzip(fname)
+        elif url.endswith('.gz'):
+            logger.warning('%s is not in the manifest and cannot be checked, '
+                           'downloading it again.' % fname)
+            return False
+        else:
+            size = get_remote_size(url)
+            if size is None:
+                logger.warning('Could not get the size of %s, using %s '
+                               'without checking it.' % (url, fname))
+                return True
+            complete = os.path.getsize(fname) == size
+        if not complete:
+            logger.warning('%s is incomplete, downloading it again.' % fname)
+            return False
+        self._add_to_manifest(fname, url)
+        return True
+
+    def _add_to_manifest(self, fname, url):
+        with file_lock(self.manifest_fname + '.lock'):
+            manifest = self.get_manifest()
+            manifest[os.path.basename(fname)] = \
+                {'url': url, 'size': os.path.getsize(fname),
+                 'sha256': get_file_hash(fname)}
+            tmp_fname = self.manifest_fname + '.tmp'
+            with open(tmp_fname, 'w') as fh:
+                json.dump(manifest, fh, indent=1, sort_keys=True)
+            os.replace(tmp_fname, self.manifest_fname)
+
+    def get_go_ontology(self):
+        """Return the GO ontology parsed from the GO OBO file.
+
+        The parsed ontology is cached in the resource folder, keyed by the
+        hash of the OBO file.
+
+        Returns
+        -------
+        genewalk.go_index.GoOntology
+            The GO ontology.
+        """
+        def load():
+            arrays = self._get_parsed_resource(
+                'go_ontology', self.get_go_obo(), {},
+                lambda fname: GoOntology.from_obo(fname).to_arrays())
+            return GoOntology.from_arrays(arrays)
+
+        return self._get_memoized('go_ontology', load)
+
+    def get_goa(self, evidence_codes=None):
+        """Return the evidence-filtered GO annotations as a data frame with
+        categorical columns.
+
+        The parsed annotations are cached in the resource folder, keyed by
+        the hash of the GAF file and the evidence codes.
+
+        Parameters
+        ----------
+        evidence_codes : Optional[set]
+            The evidence codes of the annotations to keep. Default:
+            experimental evidence codes.
+        """
+        return goa_from_arrays(self._get_goa_arrays(evidence_codes))
+
+    def get_goa_index(self, evidence_codes=None):
+        """Return the UniProt to GO ID index of the evidence-filtered GO
+        annotations.
+
+        Parameters
+        ----------
+        evidence_codes : Optional[set]
+            The evidence codes of the annotations to keep. Default:
+            experimental evidence codes.
+
+        Returns
+        -------
+        genewalk.go_index.GoaIndex
+            The UniProt to GO ID index.
+        """
+        key = ('goa_index', None if evidence_codes is None
+               else tuple(sorted(evidence_codes)))
+        return self._get_memoized(key, lambda: GoaIndex.from_arrays(
+            self._get_goa_arrays(evidence_codes)))
+
+    def _get_goa_arrays(self, evidence_codes):
+        if evidence_codes is None:
+            evidence_codes = default_goa_evidence_codes
+
+        def parse_goa(fname):
+            goa = read_goa_gaf(fname, evidence_codes)
+            arrays = goa_to_arrays(goa)
+            arrays.update(GoaIndex.from_goa(goa).to_arrays())
+            return arrays
+
+        return self._get_parsed_resource(
+            'goa_human', self.get_goa_gaf(),
+            {'evidence_codes': sorted(evidence_codes)}, parse_goa)
+
+    def _get_parsed_resource(self, prefix, source_fname, settings, parse):
+        """Return the arrays of a parsed resource file, parsing the file
+        only if no cache exists for the file's hash and the settings.
+
+        The cache is a folder of numpy (npy) files, which are
+        memory-mapped read-only so that concurrent jobs share them.
+        """
+        source_key = get_file_hash(source_fname)[:16]
+        settings_key = json.dumps({'settings': settings,
+                                   'version': resource_cache_version},
+                                  sort_keys=True)
+        settings_key = \
+            hashlib.sha256(settings_key.encode('utf-8')).hexdigest()[:8]
+        dirname = os.path.join(self.resource_folder, '%s_%s_%s' %
+                               (prefix, source_key, settings_key))
+        if not os.path.isdir(dirname):
+            with file_lock(dirname + '.lock'):
+                # Another process may have parsed the file while we waited
+                if not os.path.isdir(dirname):
+                    self._save_parsed_resource(source_fname, dirname, parse)
+                    self._remove_parsed_resources(prefix, source_key)
+        logger.info('Loading parsed %s from %s' % (source_fname, dirname))
+        return {fname[:-len('.npy')]:
+                np.load(os.path.join(dirname, fname), mmap_mode='r',
+                        allow_pickle=False)
+                for fname in os.listdir(dirname) if fname.endswith('.npy')}
+
+    def _save_parsed_resource(self, source_fname, dirname, parse):
+        logger.info('Parsing %s into %s' % (source_fname, dirname))
+        arrays = parse(source_fname)
+        tmp_dirname = dirname + '.tmp'
+        if os.path.exists(tmp_dirname):
+            shutil.rmtree(tmp_dirname)
+        os.makedirs(tmp_dirname)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dirname, '%s.npy' % name), array,
+                    allow_pickle=False)
+        os.replace(tmp_dirname, dirname)
+
+    def _remove_parsed_resources(self, prefix, source_key):
+        """Remove the caches of earlier versions of a resource file and of
+        earlier cache formats."""
+        for old_fname in glob.glob(os.path.join(self.resource_folder,
+                                                '%s_*_*' % prefix)):
+            if os.path.basename(old_fname).startswith(
+                    '%s_%s_' % (prefix, source_key)) and \
+                    not old_fname.endswith('.npz'):
+                continue
+            elif os.path.isdir(old_fname):
+                shutil.rmtree(old_fname)
+            else:
+                os.remove(old_fname)
 
     def get_pc(self):
-        fname = os.path.join(self.resource_folder,
-                             'PathwayCommons11.All.hgnc.sif')
-        if not os.path.exists(fname):
-            url_pc = ('http://www.pathwaycommons.org/archives/PC2/v11/'
-                      'PathwayCommons11.All.hgnc.sif.gz')
-            download_gz(fname, url_pc)
-        return fname
+        return self._get_resource('PathwayCommons11.All.hgnc.sif',
+                                  compressed=True)
+
+    def get_pc_index(self):
+        """Return the edge index of the Pathway Commons network.
+
+        The index is cached in the resource folder, keyed by the hash of the
+        Pathway Commons SIF file.
+
+        Returns
+        -------
+        genewalk.edge_index.EdgeIndex
+            The edge index of the Pathway Commons network.
+        """
+        def load():
+            arrays = self._get_parsed_resource(
+                'pc_index', self.get_pc(), {},
+                lambda fname: EdgeIndex.from_sif(fname).to_arrays())
+            return EdgeIndex.from_arrays(arrays)
+
+        return self._get_memoized('pc_index', load)
+
+    def _get_memoized(self, key, load):
+        """Return a parsed resource, kept in memory if cache_in_memory is
+        set."""
+        if self._memo is None:
+            return load()
+        if key not in self._memo:
+            self._memo[key] = load()
+        return self._memo[key]
 
     def _get_resource_folder(self):
         resource_dir = os.path.join(self.base_folder, 'resources')
-
-        if not os.path.isdir(resource_dir):
-            try:
-                os.makedirs(resource_dir)
-            except Exception:
-                logger.warning(resource_dir + ' already exists')
+        os.makedirs(resource_dir, exist_ok=True)
         return resource_dir
 
     def download_all(self):
-        self.get_go_obo()
-        self.get_goa_gaf()
-        self.get_pc()
+        """Download the resource files that are missing, concurrently."""
+        getters = [self.get_go_obo, self.get_goa_gaf, self.get_pc]
+        with ThreadPoolExecutor(max_workers=len(getters)) as executor:
+            futures = [executor.submit(getter) for getter in getters]
+            for future in futures:
+                future.result()
+
+
+def get_file_hash(fname):
+    """Return the SHA-256 hash of a file.
+
+    The hash is stored next to the file and only recomputed if the size or
+    modification time of the file changed.
+    """
+    stat = os.stat(fname)
+    hash_fname = fname + '.sha256'
+    if os.path.exists(hash_fname):
+        with open(hash_fname, 'r') as fh:
+            info = json.load(fh)
+        if info['size'] == stat.st_size and info['mtime'] == stat.st_mtime:
+            return info['sha256']
+    sha = hashlib.sha256()
+    with open(fname, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            sha.update(block)
+    save_file_hash(fname, sha.hexdigest())
+    return sha.hexdigest()
+
+
+def save_file_hash(fname, sha256):
+    """Store the SHA-256 hash of a file next to it, see get_file_hash."""
+    stat = os.stat(fname)
+    info = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256}
+    # Concurrent processes may store the same hash
+    tmp_fname = '%s.sha256.%d.%d.tmp' % (fname, os.getpid(),
+                                         threading.get_ident())
+    with open(tmp_fname, 'w') as fh:
+        json.dump(info, fh)
+    os.replace(tmp_fname, fname + '.sha256')
+
 
+@contextmanager
+def file_lock(fname):
+    """Hold an exclusive lock on a lock file, waiting for the process or
+    thread holding it, if any."""
+    with open(fname, 'a') as fh:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info('Waiting for the lock on %s' % fname)
+                fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def is_complete_gzip(fname):
+    """Return whether a gzip-compressed file can be decompressed to its
+    end."""
+    try:
+        with gzip.open(fname, 'rb') as fh:
+            while fh.read(1 << 20):
+                pass
+    except (OSError, EOFError, zlib.error):
+        return False
+    return True
+
+
+def get_remote_size(url, timeout=download_timeout):
+    """Return the size of a file on a server from the Content-Length of a
+    HEAD request, or None if it cannot be determined."""
+    try:
+        request = urllib.request.Request(url, method='HEAD')
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            length = response.headers.get('Content-Length')
+    except (OSError, http.client.HTTPException):
+        return None
+    return int(length) if length is not None else None
+
+
+def download_file(url, fname, decompress=False, retries=3,
+                  timeout=download_timeout):
+    """Download a file.
+
+    The file is downloaded into fname.part, from which an interrupted
+    download is resumed with an HTTP range request if the file did not
+    change on the server, and only moved to fname once complete.
 
-def download_go(fname):
-    url = 'http://snapshot.geneontology.org/ontology/go.obo'
+    Parameters
+    ----------
+    url : str
+        The URL of the file.
+    fname : str
+        The path to save the file into.
+    decompress : Optional[bool]
+        If True, the file is gzip-compressed and the decompressed file is
+        saved. Default: False
+    retries : Optional[int]
+        The number of times an interrupted download is resumed before
+        giving up. Default: 3
+    timeout : Optional[float]
+        The number of seconds to wait for a response of the server.
+        Default: 60
+    """
     logger.info('Downloading %s into %s' % (url, fname))
-    urllib.request.urlretrieve(url, fname)
+    part_fname = fname + '.part'
+    for attempt in range(retries + 1):
+        try:
+            _download_part(url, part_fname, timeout)
+            break
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == retries:
+                raise
+            logger.warning('Download of %s interrupted (%s), resuming.' %
+                           (url, e))
+    if decompress:
+        logger.info('Extracting %s' % fname)
+        try:
+            with gzip.open(part_fname, 'rb') as stream:
+                _save_stream(stream, fname)
+        except (OSError, EOFError, zlib.error) as e:
+            # The next download starts over rather than resuming
+            _remove_part(part_fname)
+            raise IOError('Could not decompress %s: %s' % (url, e))
+        _remove_part(part_fname)
+    else:
+        os.replace(part_fname, fname)
+        _remove_part(part_fname)
+
+
+def _download_part(url, part_fname, timeout=download_timeout):
+    """Download the rest of a file into a partially downloaded file.
+
+    The ETag or Last-Modified validator and the size of the file are stored
+    in part_fname.json when its download starts. A download is only resumed
+    if the file on the server still has this validator, otherwise the whole
+    file is downloaded again.
+    """
+    info_fname = part_fname + '.json'
+    info = {}
+    if os.path.exists(part_fname) and os.path.exists(info_fname):
+        with open(info_fname, 'r') as fh:
+            info = json.load(fh)
+    validator = info.get('etag') or info.get('last_modified')
+    offset = os.path.getsize(part_fname) if validator else 0
+    headers = {'Range': 'bytes=%d-' % offset, 'If-Range': validator} \
+        if offset else {}
+    try:
+        response = urllib.request.urlopen(
+            urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        # The partially downloaded file is longer than the file
+        if e.code == 416:
+            logger.warning('Partial download of %s does not match the file '
+                           'on the server, starting over.' % url)
+            _remove_part(part_fname)
+            return _download_part(url, part_fname, timeout)
+        raise
+    with response:
+        if offset and response.status == 206:
+            start, total = _parse_content_range(
+                response.headers.get('Content-Range'))
+            if start != offset or total != info.get('size'):
+                response.close()
+                logger.warning('Partial download of %s does not match the '
+                               'file on the server, starting over.' % url)
+                _remove_part(part_fname)
+                return _download_part(url, part_fname, timeout)
+        else:
+            # The file changed on the server, or the server does not
+            # support range requests, and sent the whole file
+            offset = 0
+            length = response.headers.get('Content-Length')
+            etag = response.headers.get('ETag')
+            # Weak ETags cannot be used in If-Range
+            info = {'etag': etag if etag and not etag.startswith('W/')
+                    else None,
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': int(length) if length is not None else None}
+            with open(info_fname, 'w') as fh:
+                json.dump(info, fh)
+        with open(part_fname, 'ab' if offset else 'wb') as fh:
+            for block in iter(lambda: response.read(1 << 20), b''):
+                fh.write(block)
+    size = os.path.getsize(part_fname)
+    if info['size'] is not None and size != info['size']:
+        raise IOError('Downloaded %d of %d bytes of %s.' %
+                      (size, info['size'], url))
+
+
+def _parse_content_range(content_range):
+    """Return the first byte position and the total size of a Content-Range
+    header value such as bytes 100-199/200, with None for an unknown size or
+    a missing header."""
+    try:
+        byte_range, total = content_range.split(' ', 1)[1].split('/')
+        return int(byte_range.split('-')[0]), \
+            None if total == '*' else int(total)
+    except (AttributeError, IndexError, ValueError):
+        return None, None
+
+
+def _remove_part(part_fname):
+    """Remove a partially downloaded file and its validator."""
+    for fname in (part_fname, part_fname + '.json'):
+        if os.path.exists(fname):
+            os.remove(fname)
 
 
-def download_gz(fname, url):
-    logger.info('Downloading %s and extracting into %s' % (url, fname))
-    gz_file = fname + '.gz'
-    urllib.request.urlretrieve(url, gz_file)
-    with gzip.open(gz_file, 'rb') as fin:
-        with open(fname, 'wb') as fout:
-            shutil.copyfileobj(fin, fout)
+def _save_stream(stream, fname):
+    """Save the content of a stream into a file, which only appears once it
+    is complete, and store its hash."""
+    sha = hashlib.sha256()
+    tmp_fname = fname + '.tmp'
+    try:
+        with open(tmp_fname, 'wb') as fh:
+            for block in iter(lambda: stream.read(1 << 20), b''):
+                sha.update(block)
+                fh.write(block)
+    except BaseException:
+        os.remove(tmp_fname)
+        raise
+    os.replace(tmp_fname, fname)
+    save_file_hash(fname, sha.hexdigest())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import os
+import tempfile
+from genewalk.cli import read_manifest
+
+
+def write_manifest(dirname, lines):
+    fname = os.path.join(dirname, 'manifest.csv')
+    with open(fname, 'w') as fh:
+        fh.write(''.join(line + '\n' for line in lines))
+    return fname
+
+
+def test_read_manifest():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = write_manifest(dirname, [
+            'project,genes,id_type,annotate_ancestors,save_dw,nreps_graph',
+            'a,a.txt,hgnc_symbol,true,yes,',
+            'b,b.txt,hgnc_id,False,0,5',
+            'c,c.txt,hgnc_id,,,'])
+        projects = read_manifest(fname, ['--nreps_graph', '2'],
+                                 base_folder=dirname)
+        assert [p.project for p in projects] == ['a', 'b', 'c']
+        assert [p.annotate_ancestors for p in projects] == \
+            [True, False, False]
+        assert [p.save_dw for p in projects] == [True, False, False]
+        assert [p.nreps_graph for p in projects] == [2, 5, 2]
+        assert {p.base_folder for p in projects} == {dirname}
+        # A false flag cell unsets a flag passed to all projects
+        projects = read_manifest(fname, ['--annotate_ancestors',
+                                         '--save_dw', 'True'])
+        assert [p.annotate_ancestors for p in projects] == \
+            [True, False, True]
+        assert [p.save_dw for p in projects] == [True, False, True]
+
+
+def test_read_manifest_errors():
+    with tempfile.TemporaryDirectory() as dirname:
+        for lines, message in (
+                (['project,genes', 'a,a.txt'], 'no id_type column'),
+                (['project,genes,id_type,nproc', 'a,a.txt,hgnc_id,4'],
+                 'nproc columns'),
+                (['project,genes,id_type,genes_file', 'a,a.txt,hgnc_id,x'],
+                 'genes_file columns'),
+                (['project,genes,id_type,collapse_edges',
+                  'a,a.txt,hgnc_id,maybe'], 'value maybe'),
+                (['project,genes,id_type', 'a,a.txt,hgnc_id',
+                  'a,b.txt,hgnc_id'], 'projects a more than once'),
+                (['project,genes,id_type,nreps_graph',
+                  'a,a.txt,hgnc_id,3', 'b,b.txt,hgnc_id,three'],
+                 'project b'),
+                (['project,genes,id_type,nreps_graph',
+                  'a,a.txt,hgnc_id,3', 'b,b.txt,hgnc_id,three'],
+                 '--nreps_graph'),
+                (['project,genes,id_type', 'a,a.txt,ensembl'],
+                 'argument --id_type')):
+            fname = write_manifest(dirname, lines)
+            try:
+                read_manifest(fname)
+                assert False, message
+            except ValueError as e:
+                assert message in str(e), str(e)
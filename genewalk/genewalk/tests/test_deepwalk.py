@@ -0,0 +1,20 @@
+import random
+from genewalk.deepwalk import DeepWalk, estimate_walks_memory
+from genewalk.graph import GeneWalkGraph
+from genewalk.tests.util import get_graph
+
+
+def test_estimate_walks_memory():
+    graph, _ = get_graph()
+    # A self loop and parallel edges don't add walks
+    graph.add_edge('G0', 'G0', label='x')
+    graph.add_edge('G0', 'G1', label='y')
+    gwg = GeneWalkGraph.from_networkx(graph)
+    random.seed(0)
+    dw = DeepWalk(gwg, walk_length=5, niter=2)
+    dw.get_walks()
+    for g in (graph, gwg):
+        model_memory = estimate_walks_memory(g, walk_length=5, niter=0)
+        assert model_memory > 0
+        assert estimate_walks_memory(g, walk_length=5, niter=2) - \
+            model_memory == len(dw.walks) * (5 * 8 + 72)
@@ -0,0 +1,99 @@
+import os
+import gzip
+import shutil
+import tempfile
+import numpy as np
+from genewalk.edge_index import EdgeIndex, read_edges
+from genewalk.tests.util import write_sif
+
+
+def read_lines(fname):
+    with open(fname, 'r') as fh:
+        return [line.rstrip('\n').split('\t') for line in fh]
+
+
+def test_read_edges():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'network.sif')
+        write_sif(fname)
+        lines = read_lines(fname)
+        with open(fname, 'rb') as fh, \
+                gzip.open(fname + '.gz', 'wb') as fh_out:
+            shutil.copyfileobj(fh, fh_out)
+        for chunk_size in (1, 7, 1000000):
+            for fn in (fname, fname + '.gz'):
+                nodes, sources, targets, rel_type_codes, rel_types = \
+                    read_edges(fn, chunk_size=chunk_size)
+                # Nodes are interned in the order of their first appearance
+                assert nodes == list(dict.fromkeys(
+                    n for line in lines for n in (line[0], line[2])))
+                assert [(nodes[s], rel_types[r], nodes[t]) for s, t, r in
+                        zip(sources, targets, rel_type_codes)] == \
+                    [tuple(line) for line in lines]
+
+
+def test_read_edges_missing_nodes():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'network.sif')
+        with open(fname, 'w') as fh:
+            fh.write('A\tx\tB\nC\tx\t\n\ty\tD\n\nB\tx\tE\n')
+        for chunk_size in (1, 2, 1000000):
+            nodes, sources, targets, rel_type_codes, rel_types = \
+                read_edges(fname, chunk_size=chunk_size)
+            assert nodes == ['A', 'B', 'E']
+            assert sources.tolist() == [0, 1]
+            assert targets.tolist() == [1, 2]
+            assert [rel_types[r] for r in rel_type_codes] == ['x', 'x']
+
+
+def test_read_edges_missing_rel_types():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'network.el')
+        with open(fname, 'w') as fh:
+            fh.write('A,B,x\nB,C,y\nC,D\nD,E\n')
+        for chunk_size in (1, 2):
+            nodes, sources, targets, rel_type_codes, rel_types = \
+                read_edges(fname, source_col=0, target_col=1,
+                           rel_type_col=2, sep=',', chunk_size=chunk_size)
+            assert nodes == ['A', 'B', 'C', 'D', 'E']
+            assert [rel_types[r] for r in rel_type_codes] == \
+                ['x', 'y', '', '']
+        fname = os.path.join(dirname, 'network2.el')
+        with open(fname, 'w') as fh:
+            fh.write('A,B\nB,C\n')
+        nodes, sources, targets, rel_type_codes, rel_types = \
+            read_edges(fname, source_col=0, target_col=1, rel_type_col=2,
+                       sep=',', chunk_size=1)
+        assert rel_type_codes is None
+        assert rel_types == []
+
+
+def test_read_edges_many_rel_types():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'network.el')
+        nedges = 40000
+        with open(fname, 'w') as fh:
+            for i in range(nedges):
+                fh.write('N%d,N%d,%d\n' % (i, i + 1, i))
+        nodes, sources, targets, rel_type_codes, rel_types = \
+            read_edges(fname, source_col=0, target_col=1, rel_type_col=2,
+                       sep=',', chunk_size=10000)
+        assert len(rel_types) == nedges
+        assert [rel_types[r] for r in rel_type_codes] == \
+            [str(i) for i in range(nedges)]
+
+
+def test_edge_index():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'network.sif')
+        write_sif(fname)
+        lines = read_lines(fname)
+        edge_index = EdgeIndex.from_sif(fname, chunk_size=13)
+        genes = {'G%d' % i for i in range(0, 80, 3)} | {'X'}
+        node_names, edges = edge_index.get_subgraph(genes)
+        assert edges == [tuple(line[i] for i in (0, 2, 1)) for line in lines
+                         if line[0] in genes and line[2] in genes]
+        assert set(node_names) == {n for e in edges for n in e[:2]}
+        loaded = EdgeIndex.from_arrays(edge_index.to_arrays())
+        assert np.array_equal(loaded.get_subgraph_edges(genes),
+                              edge_index.get_subgraph_edges(genes))
@@ -0,0 +1,189 @@
+import os
+import tempfile
+from unittest import mock
+import pandas as pd
+from indra.databases import hgnc_client
+from genewalk.gene_lists import map_gene_ids, read_gene_list
+
+
+hgnc_ids = {'A': '1', 'B': '2', 'C': '3', 'D': '4'}
+hgnc_names = {'1': 'A', '2': 'B', '3': 'C', '4': 'D'}
+uniprot_ids = {'1': 'P1', '2': 'P2', '4': ''}
+mouse_ids = {'101': '1', '102': '3', '105': '5'}
+ensembl_ids = {'ENSG1': '1', 'ENSG2': '2', 'ENSG5': '5'}
+
+
+class HgncClient(object):
+    """Stand-in for the lookups of the INDRA HGNC client which counts the
+    calls to each lookup."""
+    def __init__(self):
+        self.calls = []
+
+    def lookup(self, name, table):
+        def lookup(value):
+            self.calls.append((name, value))
+            return table.get(value)
+        return lookup
+
+    def patch(self):
+        return mock.patch.multiple(
+            hgnc_client,
+            get_hgnc_id=self.lookup('get_hgnc_id', hgnc_ids),
+            get_hgnc_name=self.lookup('get_hgnc_name', hgnc_names),
+            get_uniprot_id=self.lookup('get_uniprot_id', uniprot_ids),
+            get_hgnc_from_mouse=self.lookup('get_hgnc_from_mouse',
+                                            mouse_ids),
+            get_hgnc_from_ensembl=self.lookup('get_hgnc_from_ensembl',
+                                              ensembl_ids))
+
+
+def get_baseline_refs(gene_ids, id_type):
+    """Return the references of gene IDs as mapped one ID at a time."""
+    refs = []
+    for gene_id in gene_ids:
+        ref = {}
+        if id_type == 'hgnc_symbol':
+            ref['HGNC_SYMBOL'] = gene_id
+            ref['HGNC'] = hgnc_client.get_hgnc_id(gene_id)
+        else:
+            if id_type == 'hgnc_id':
+                hgnc_id = gene_id[5:] if gene_id.startswith('HGNC:') \
+                    else gene_id
+            elif id_type == 'mgi_id':
+                mgi_id = gene_id[4:] if gene_id.startswith('MGI:') \
+                    else gene_id
+                hgnc_id = hgnc_client.get_hgnc_from_mouse(mgi_id)
+            else:
+                hgnc_id = hgnc_client.get_hgnc_from_ensembl(
+                    gene_id.split('.', maxsplit=1)[0])
+            if not hgnc_id:
+                continue
+            ref['HGNC_SYMBOL'] = hgnc_client.get_hgnc_name(hgnc_id)
+            ref['HGNC'] = hgnc_id
+        if not ref['HGNC'] or not ref['HGNC_SYMBOL']:
+            continue
+        ref['UP'] = hgnc_client.get_uniprot_id(ref['HGNC'])
+        if not ref['UP']:
+            continue
+        if id_type == 'mgi_id':
+            ref['MGI'] = mgi_id
+        elif id_type == 'ensembl_id':
+            ref['ENSEMBL'] = gene_id
+        refs.append(ref)
+    return refs
+
+
+gene_ids = {
+    'hgnc_symbol': ['A', 'X', 'C', 'B', 'D', 'A'],
+    'hgnc_id': ['HGNC:1', '2', '5', '3', 'HGNC:9'],
+    'mgi_id': ['MGI:101', '102', 'MGI:103', '105'],
+    'ensembl_id': ['ENSG1.4', 'ENSG2', 'ENSG3.1', 'ENSG5'],
+}
+
+
+def test_map_gene_ids():
+    expected_refs = {
+        'hgnc_symbol': [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'},
+                        {'HGNC_SYMBOL': 'B', 'HGNC': '2', 'UP': 'P2'},
+                        {'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'}],
+        'hgnc_id': [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'},
+                    {'HGNC_SYMBOL': 'B', 'HGNC': '2', 'UP': 'P2'}],
+        'mgi_id': [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1',
+                    'MGI': '101'}],
+        'ensembl_id': [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1',
+                        'ENSEMBL': 'ENSG1.4'},
+                       {'HGNC_SYMBOL': 'B', 'HGNC': '2', 'UP': 'P2',
+                        'ENSEMBL': 'ENSG2'}],
+    }
+    expected_unmapped = {
+        'hgnc_symbol': [('X', 'no HGNC ID'), ('C', 'no UniProt ID'),
+                        ('D', 'no UniProt ID')],
+        'hgnc_id': [('5', 'no HGNC symbol'), ('3', 'no UniProt ID'),
+                    ('HGNC:9', 'no HGNC symbol')],
+        'mgi_id': [('102', 'no UniProt ID'), ('MGI:103', 'no HGNC ID'),
+                   ('105', 'no HGNC symbol')],
+        'ensembl_id': [('ENSG3.1', 'no HGNC ID'),
+                       ('ENSG5', 'no HGNC symbol')],
+    }
+    client = HgncClient()
+    with client.patch():
+        for id_type, ids in gene_ids.items():
+            client.calls = []
+            refs, unmapped = map_gene_ids(ids, id_type)
+            assert refs == expected_refs[id_type], id_type
+            # Each distinct ID is looked up once per step
+            assert len(client.calls) == len(set(client.calls)), id_type
+            assert refs == get_baseline_refs(ids, id_type), id_type
+            assert list(unmapped.columns) == ['gene_id', 'id_type',
+                                              'reason']
+            assert (unmapped['id_type'] == id_type).all()
+            assert list(zip(unmapped['gene_id'], unmapped['reason'])) == \
+                expected_unmapped[id_type], id_type
+        try:
+            map_gene_ids(['A'], 'uniprot_id')
+            assert False
+        except ValueError:
+            pass
+
+
+def write_gene_list(fname, ids):
+    with open(fname, 'w') as fh:
+        fh.write(''.join(gene_id + '\n' for gene_id in ids))
+
+
+def test_read_gene_list():
+    client = HgncClient()
+    with tempfile.TemporaryDirectory() as dirname, client.patch():
+        fname = os.path.join(dirname, 'genes.txt')
+        unmapped_fname = os.path.join(dirname, 'unmapped.csv')
+        write_gene_list(fname, gene_ids['hgnc_symbol'] + [''])
+        # Duplicate and empty lines are left out
+        assert read_gene_list(fname, 'hgnc_symbol', unmapped_fname) == \
+            map_gene_ids(['A', 'X', 'C', 'B', 'D'], 'hgnc_symbol')[0]
+        unmapped = pd.read_csv(unmapped_fname)
+        assert unmapped.values.tolist() == \
+            [['X', 'hgnc_symbol', 'no HGNC ID'],
+             ['C', 'hgnc_symbol', 'no UniProt ID'],
+             ['D', 'hgnc_symbol', 'no UniProt ID']]
+        write_gene_list(fname, ['X', 'C'])
+        try:
+            read_gene_list(fname, 'hgnc_symbol')
+            assert False
+        except ValueError:
+            pass
+
+
+def test_gene_refs_cache():
+    client = HgncClient()
+    with tempfile.TemporaryDirectory() as dirname, client.patch():
+        fname = os.path.join(dirname, 'genes.txt')
+        unmapped_fname = os.path.join(dirname, 'unmapped.csv')
+        write_gene_list(fname, ['A', 'X', '1', '2'])
+        refs = read_gene_list(fname, 'hgnc_symbol', unmapped_fname,
+                              cache_folder=dirname)
+        assert refs == [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'}]
+        assert client.calls
+        unmapped = pd.read_csv(unmapped_fname)
+        assert len(unmapped) == 3
+        assert len(os.listdir(os.path.join(dirname, 'gene_refs'))) == 1
+        # The second time, the references and the unmapped IDs are taken
+        # from the cache without mapping the IDs
+        os.remove(unmapped_fname)
+        client.calls = []
+        assert read_gene_list(fname, 'hgnc_symbol', unmapped_fname,
+                              cache_folder=dirname) == refs
+        assert client.calls == []
+        assert pd.read_csv(unmapped_fname).equals(unmapped)
+        # A different ID type or file content is mapped again
+        assert read_gene_list(fname, 'hgnc_id', cache_folder=dirname) == \
+            [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'},
+             {'HGNC_SYMBOL': 'B', 'HGNC': '2', 'UP': 'P2'}]
+        assert client.calls
+        write_gene_list(fname, ['A', 'B'])
+        client.calls = []
+        assert read_gene_list(fname, 'hgnc_symbol',
+                              cache_folder=dirname) == \
+            [{'HGNC_SYMBOL': 'A', 'HGNC': '1', 'UP': 'P1'},
+             {'HGNC_SYMBOL': 'B', 'HGNC': '2', 'UP': 'P2'}]
+        assert client.calls
+        assert len(os.listdir(os.path.join(dirname, 'gene_refs'))) == 3
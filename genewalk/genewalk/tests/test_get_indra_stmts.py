@@ -0,0 +1,156 @@
+import os
+import tempfile
+import threading
+import random
+import pandas as pd
+import networkx as nx
+from indra.statements import Agent, Phosphorylation
+from genewalk.get_indra_stmts import IndraStatementFrame, \
+    download_statements, dump_jsonl, dump_pickle, filter_to_genes, \
+    get_famplex_links, iter_statements
+from genewalk.nx_mg_assembler import IndraNxMgAssembler
+from genewalk.resources import ResourceManager, default_resource_urls
+from genewalk.tests.util import ResourceServer, write_resources
+
+
+class StatementServer(object):
+    """Stand-in for the INDRA DB REST API which fails a number of times
+    and returns Statements by the requested hash."""
+    def __init__(self, nfailures=0):
+        self.nfailures = nfailures
+        self.requested = []
+        self.lock = threading.Lock()
+
+    def __call__(self, hashes, ev_limit):
+        with self.lock:
+            self.requested += hashes
+            if self.nfailures:
+                self.nfailures -= 1
+                raise IOError('Service unavailable')
+        # Hashes divisible by 7 are not in the DB
+        return {h: get_statement(h) for h in hashes if h % 7}
+
+
+def get_statement(stmt_hash):
+    return Phosphorylation(Agent('G%d' % stmt_hash, db_refs={'HGNC': '1'}),
+                           Agent('G0', db_refs={'HGNC': '2'}))
+
+
+def get_names(stmts):
+    return [stmt.agent_list()[0].name for stmt in stmts]
+
+
+def test_download_statements():
+    hashes = list(range(1, 300))
+    df = pd.DataFrame({'hash': hashes + hashes[:10]})
+    expected = ['G%d' % h for h in hashes if h % 7]
+    with tempfile.TemporaryDirectory() as dirname:
+        cache_fname = os.path.join(dirname, 'cache.db')
+        fetch = StatementServer(nfailures=2)
+        stmts = download_statements(df, cache_fname=cache_fname,
+                                    batch_size=50, backoff=0.01,
+                                    fetch=fetch)
+        assert get_names(stmts) == expected
+        # The two failed batches were fetched again
+        assert len(fetch.requested) == len(hashes) + 100
+        assert set(fetch.requested) == set(hashes)
+        # Statements are cached by the requested hash, which differs from
+        # their own hash, and only the missing ones are fetched again
+        fetch = StatementServer()
+        df = pd.DataFrame({'hash': list(range(250, 350))})
+        stmts = download_statements(df, cache_fname=cache_fname,
+                                    batch_size=50, fetch=fetch)
+        assert get_names(stmts) == \
+            ['G%d' % h for h in range(250, 350) if h % 7]
+        assert sorted(fetch.requested) == \
+            [h for h in range(250, 300) if not h % 7] + list(range(300, 350))
+        # A batch that keeps failing raises an error after the retries
+        fetch = StatementServer(nfailures=10)
+        try:
+            download_statements(pd.DataFrame({'hash': [1000]}),
+                                cache_fname=cache_fname, retries=1,
+                                backoff=0.01, fetch=fetch)
+            assert False
+        except IOError:
+            pass
+        assert fetch.requested == [1000, 1000]
+
+
+def get_statement_df(nrows=500, seed=0):
+    rng = random.Random(seed)
+    agents = [('HGNC', str(i), 'G%d' % i) for i in range(30)] + \
+        [('HGNC', '1097', 'BRAF'), ('HGNC', '9829', 'RAF1'),
+         ('FPLX', 'RAF', 'RAF'), ('FPLX', 'FAM0', 'FAM0'),
+         ('FPLX', 'FAMTOP', 'FAMTOP'), ('CHEBI', 'CHEBI:1', 'x')]
+    go_terms = [('GO', 'GO:%07d' % i, 'term %d' % i) for i in range(5)]
+    rows = []
+    for stmt_hash in range(nrows):
+        source = rng.choice(agents)
+        target = rng.choice(agents + go_terms)
+        rows.append(source + target + (stmt_hash,))
+    return pd.DataFrame(rows, columns=['agA_ns', 'agA_id', 'agA_name',
+                                       'agB_ns', 'agB_id', 'agB_name',
+                                       'hash'])
+
+
+def read_links(fname):
+    with open(fname, 'r') as fh:
+        return sorted(fh)
+
+
+def test_statement_frame():
+    df = get_statement_df()
+    frame = IndraStatementFrame(df)
+    genes = [str(i) for i in range(0, 30, 4)] + ['1097']
+    fplx_terms = ['RAF', 'FAM0']
+    assert filter_to_genes(frame, genes, fplx_terms).hash.tolist() == \
+        filter_to_genes(df, genes, fplx_terms).hash.tolist()
+    with tempfile.TemporaryDirectory() as dirname:
+        get_famplex_links(df, os.path.join(dirname, 'df.csv'))
+        get_famplex_links(frame, os.path.join(dirname, 'frame.csv'))
+        assert read_links(os.path.join(dirname, 'frame.csv')) == \
+            read_links(os.path.join(dirname, 'df.csv'))
+
+
+def get_statements(nstmts=200, seed=0):
+    rng = random.Random(seed)
+    agents = [Agent('G%d' % i, db_refs={'HGNC': str(i), 'UP': 'P%d' % i})
+              for i in range(30)] + \
+        [Agent('FAM0', db_refs={'FPLX': 'FAM0'})]
+    go_terms = [Agent('term %d' % i, db_refs={'GO': 'GO:%07d' % i})
+                for i in range(0, 10, 3)]
+    return [Phosphorylation(rng.choice(agents), rng.choice(agents + go_terms))
+            for _ in range(nstmts)]
+
+
+def test_statement_files():
+    stmts = get_statements()
+    genes = [{'HGNC_SYMBOL': 'G%d' % i, 'HGNC': str(i), 'UP': 'P%d' % i}
+             for i in range(0, 30, 2)]
+    with tempfile.TemporaryDirectory() as dirname:
+        srv_folder = os.path.join(dirname, 'srv')
+        os.makedirs(srv_folder)
+        write_resources(srv_folder)
+        fnames = [os.path.join(dirname, name) for name in
+                  ('stmts.pkl', 'stmts_chunks.pkl', 'stmts.jsonl')]
+        dump_pickle(stmts, fnames[0])
+        dump_pickle(stmts, fnames[1], chunk_size=7)
+        dump_jsonl(stmts, fnames[2])
+        with ResourceServer(srv_folder) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls={name: server.url + name for name
+                                       in default_resource_urls})
+            graph = IndraNxMgAssembler(genes, stmts,
+                                       resource_manager=rm).graph
+            for fname in fnames:
+                assert [stmt.to_json() for stmt in
+                        iter_statements(fname)] == \
+                    [stmt.to_json() for stmt in stmts], fname
+                # The Statements streamed from the file into the assembler
+                # give the same graph as the list of Statements
+                mg = IndraNxMgAssembler(genes, iter_statements(fname),
+                                        resource_manager=rm)
+                assert list(mg.graph.nodes(data=True)) == \
+                    list(graph.nodes(data=True)), fname
+                assert nx.utils.edges_equal(mg.graph.edges(data=True),
+                                            graph.edges(data=True)), fname
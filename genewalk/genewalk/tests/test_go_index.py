@@ -0,0 +1,63 @@
+import os
+import tempfile
+import numpy as np
+import networkx as nx
+from goatools.obo_parser import GODag
+from genewalk.go_index import GoOntology
+from genewalk.tests.util import write_go_obo
+
+
+def get_ontology():
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'go.obo')
+        write_go_obo(fname)
+        return GoOntology.from_obo(fname), GODag(fname)
+
+
+def test_from_obo():
+    go_ontology, go_dag = get_ontology()
+    assert set(go_ontology.go_ids) == {term.id for term in go_dag.values()}
+    for go_id, term in go_dag.items():
+        pos = go_ontology.get_pos(go_id)
+        assert go_ontology.go_ids[pos] == term.id
+        assert go_ontology.is_obsolete[pos] == term.is_obsolete
+        assert {go_ontology.go_ids[p] for p in
+                go_ontology.get_parents(pos)} == \
+            {p.id for p in term.parents}
+        assert {go_ontology.go_ids[p] for p in
+                go_ontology.get_ancestor_positions(pos)} == \
+            term.get_all_parents()
+    # Round trip through the arrays of the resource cache
+    loaded = GoOntology.from_arrays(go_ontology.to_arrays())
+    assert list(loaded.go_ids) == list(go_ontology.go_ids)
+    assert loaded.get_pos('GO:0009995') == go_ontology.get_pos('GO:0000005')
+
+
+def test_get_subontology():
+    go_ontology, go_dag = get_ontology()
+    terms = {term.id: term for term in go_dag.values()}
+    is_a = nx.Graph()
+    is_a.add_nodes_from(go_id for go_id, term in terms.items()
+                        if not term.is_obsolete)
+    is_a.add_edges_from((go_id, parent.id) for go_id, term in terms.items()
+                        for parent in term.parents
+                        if not term.is_obsolete and not parent.is_obsolete)
+    seeds = ['GO:0000012', 'GO:0000025', 'GO:0000038']
+    for neighborhood in (0, 1, 2):
+        keep = go_ontology.get_subontology(
+            [go_ontology.get_pos(go_id) for go_id in seeds], neighborhood)
+        # The seeds, the terms within the neighborhood of
+        # them, and all their ancestors
+        expected = set()
+        for seed in seeds:
+            expected |= set(nx.single_source_shortest_path_length(
+                is_a, seed, cutoff=neighborhood))
+        for go_id in list(expected):
+            expected |= terms[go_id].get_all_parents()
+        assert {go_ontology.go_ids[p] for p in np.flatnonzero(keep)} == \
+            expected, neighborhood
+        # The pruned ontology is closed under ancestors
+        children, parents = go_ontology.get_is_a_edges(keep)
+        assert keep[children].all() and keep[parents].all()
+        for pos in np.flatnonzero(keep):
+            assert keep[go_ontology.get_ancestor_positions(pos)].all()
@@ -0,0 +1,123 @@
+import random
+import tempfile
+import numpy as np
+import networkx as nx
+from genewalk.graph import GeneWalkGraph
+from genewalk.tests.util import get_graph
+
+
+def get_multigraph():
+    graph, _ = get_graph()
+    # Parallel edges with different labels and a self loop
+    graph.add_edge('G0', 'G1', label='y')
+    graph.add_edge('G0', 'G1', label='y')
+    graph.add_edge('G2', 'G2', label='x')
+    return graph
+
+
+def assert_same_graph(gwg, graph, ordered=True):
+    assert gwg.nodes() == list(graph.nodes())
+    assert gwg.number_of_nodes() == graph.number_of_nodes()
+    assert gwg.number_of_edges() == graph.number_of_edges()
+    for node in graph.nodes():
+        if ordered:
+            assert gwg[node] == list(graph[node])
+        else:
+            assert sorted(gwg[node]) == sorted(graph[node])
+        assert gwg.degree(node) == graph.degree(node)
+        assert gwg.get_node_data(node) == graph.nodes[node]
+        for neighbor, edges in graph[node].items():
+            assert gwg.get_edge_data(node, neighbor) == \
+                {'count': len(edges),
+                 'labels': {e['label'] for e in edges.values()}}
+    assert list(gwg.degree()) == [d for _, d in graph.degree()]
+    assert gwg.get_edge_data('G0', 'G3') is None
+    assert gwg.get_node_attributes('GO') == \
+        {n: d['GO'] for n, d in graph.nodes(data=True) if 'GO' in d}
+
+
+def test_from_networkx():
+    graph = get_multigraph()
+    assert_same_graph(GeneWalkGraph.from_networkx(graph), graph)
+
+
+def test_from_edges():
+    # The neighbours are ordered by their first edge in the edge list
+    edges = list(get_multigraph().edges(data='label'))
+    random.Random(0).shuffle(edges)
+    graph = nx.MultiGraph()
+    graph.add_nodes_from(get_multigraph().nodes(data=True))
+    for u, v, label in edges:
+        graph.add_edge(u, v, label=label)
+    gwg = GeneWalkGraph.from_networkx(graph)
+    node_pos = {n: i for i, n in enumerate(graph.nodes())}
+    from_edges = GeneWalkGraph.from_edges(
+        list(graph.nodes()), [node_pos[u] for u, _, _ in edges],
+        [node_pos[v] for _, v, _ in edges],
+        [gwg.labels.index(label) for _, _, label in edges], gwg.labels,
+        gwg.node_attributes)
+    assert_same_graph(from_edges, graph)
+
+
+def test_to_networkx():
+    graph = get_multigraph()
+    gwg = GeneWalkGraph.from_networkx(graph)
+    collapsed = gwg.to_networkx()
+    assert list(collapsed.nodes(data=True)) == list(graph.nodes(data=True))
+    assert collapsed.number_of_edges() == \
+        len({frozenset(e) for e in graph.edges()})
+    assert collapsed['G0']['G1'] == gwg.get_edge_data('G0', 'G1')
+    # A graph with collapsed edges converts back to the same graph
+    assert_same_graph(GeneWalkGraph.from_networkx(collapsed), graph,
+                      ordered=False)
+
+
+def test_save_load():
+    graph = get_multigraph()
+    gwg = GeneWalkGraph.from_networkx(graph)
+    with tempfile.TemporaryDirectory() as dirname:
+        gwg.save(dirname + '/graph')
+        for mmap_mode in ('r', None):
+            loaded = GeneWalkGraph.load(dirname + '/graph', mmap_mode)
+            assert_same_graph(loaded, graph)
+            assert loaded.labels == gwg.labels
+            for name in ('indptr', 'indices', 'counts', 'label_masks'):
+                assert np.array_equal(getattr(loaded, name),
+                                      getattr(gwg, name))
+            del loaded
+
+
+def test_random_walk():
+    graph = get_multigraph()
+    gwg = GeneWalkGraph.from_networkx(graph)
+    random.seed(0)
+    for node in ['G0', 'G2', 'GO:0000001']:
+        walk = gwg.random_walk(node, 20)
+        assert len(walk) == 20 and walk[0] == node
+        for u, v in zip(walk, walk[1:]):
+            assert graph.has_edge(u, v)
+
+
+def test_node_attribute_types():
+    graph = get_multigraph()
+    graph.nodes['G0'].update(score=0.5, rank=3, hit=True, ids=['a', 'b'])
+    graph.nodes['G1']['rank'] = 'unranked'
+    gwg = GeneWalkGraph.from_networkx(graph)
+    for gw in (gwg, GeneWalkGraph.from_networkx(gwg.to_networkx())):
+        assert gw.get_node_data('G0') == graph.nodes['G0']
+        assert gw.get_node_data('G1') == graph.nodes['G1']
+        assert type(gw.get_node_data('G0')['rank']) is int
+        assert type(gw.get_node_data('G0')['hit']) is bool
+    with tempfile.TemporaryDirectory() as dirname:
+        gwg.save(dirname + '/graph')
+        loaded = GeneWalkGraph.load(dirname + '/graph')
+        assert_same_graph(loaded, graph)
+        assert type(loaded.get_node_data('G0')['score']) is float
+        # Values that cannot be saved are rejected
+        graph.nodes['G2']['ids'] = {'a'}
+        try:
+            GeneWalkGraph.from_networkx(graph).save(dirname + '/graph2')
+        except ValueError:
+            pass
+        else:
+            assert False, 'save did not fail'
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import numpy as np
+import networkx as nx
+from genewalk.go_index import GoOntology
+from genewalk.graph import GeneWalkGraph
+from genewalk.nx_mg_assembler import UserNxMgAssembler
+from genewalk.tests.util import write_go_obo
+
+
+class GoOntologyResources(object):
+    """Resource manager providing a GO ontology read from an OBO file."""
+    def __init__(self, fname):
+        self.go_ontology = GoOntology.from_obo(fname)
+
+    def get_go_ontology(self):
+        return self.go_ontology
+
+
+def write_edge_list(fname, gwn_format, nedges=300, seed=0):
+    rs = np.random.RandomState(seed)
+    nodes = ['G%d' % i for i in range(30)] + \
+        ['GO:%07d' % i for i in range(0, 40, 2)]
+    lines = []
+    for _ in range(nedges):
+        u, v = rs.choice(nodes, 2)
+        rel_type = rs.choice(['x', 'y', 'GO:annotation'])
+        lines.append((u, rel_type, v) if gwn_format == 'sif' else
+                     (u, v, rel_type))
+    with open(fname, 'w') as fh:
+        fh.write(''.join(','.join(line) + '\n' for line in lines))
+    return lines
+
+
+def test_user_network():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_go_obo(os.path.join(dirname, 'go.obo'))
+        resources = GoOntologyResources(os.path.join(dirname, 'go.obo'))
+        for gwn_format in ('el', 'sif'):
+            fname = os.path.join(dirname, 'network.csv')
+            lines = write_edge_list(fname, gwn_format)
+            if gwn_format == 'sif':
+                edges = [(u, v, r) for u, r, v in lines]
+            else:
+                edges = lines
+            # The same network is read in small chunks and at once
+            graph = None
+            for chunk_size in (7, 1000000):
+                mg = UserNxMgAssembler(fname, gwn_format,
+                                       resource_manager=resources,
+                                       chunk_size=chunk_size)
+                assert isinstance(mg.graph, nx.MultiGraph)
+                assert list(mg.graph.edges(data='rel_type')) == \
+                    list(nx.MultiGraph(
+                        [(u, v, {'rel_type': r}) for u, v, r in edges])
+                        .edges(data='rel_type'))
+                assert mg.graph.nodes['GO:0000004'] == \
+                    {'GO': 'GO:0000004', 'name': 'term 4',
+                     'domain': resources.go_ontology.namespaces[4]}
+                gwg = GeneWalkGraph.from_networkx(mg.graph)
+                for name in ('indptr', 'indices', 'counts', 'label_masks'):
+                    assert np.array_equal(getattr(gwg, name),
+                                          getattr(mg.genewalk_graph, name))
+                if graph is not None:
+                    assert nx.utils.edges_equal(mg.graph.edges(data=True),
+                                                graph.edges(data=True))
+                graph = mg.graph
+            mg = UserNxMgAssembler(fname, gwn_format, collapse_edges=True,
+                                   resource_manager=resources)
+            assert not mg.graph.is_multigraph()
+            for u, v, data in mg.graph.edges(data=True):
+                assert data['count'] == graph.number_of_edges(u, v)
+                assert data['labels'] == \
+                    {d['rel_type'] for d in graph[u][v].values()}
+
+
+def test_user_network_many_rel_types():
+    # A third column with more distinct values than fit into the label
+    # masks, such as a score, is kept as an edge attribute only
+    with tempfile.TemporaryDirectory() as dirname:
+        write_go_obo(os.path.join(dirname, 'go.obo'))
+        resources = GoOntologyResources(os.path.join(dirname, 'go.obo'))
+        fname = os.path.join(dirname, 'network.csv')
+        edges = [('G%d' % i, 'G%d' % (i + 1), '%.2f' % (i / 100))
+                 for i in range(100)]
+        with open(fname, 'w') as fh:
+            fh.write(''.join(','.join(edge) + '\n' for edge in edges))
+        mg = UserNxMgAssembler(fname, 'el', resource_manager=resources)
+        assert list(mg.graph.edges(data='rel_type')) == edges
+        assert mg.genewalk_graph.labels == []
+        assert not mg.genewalk_graph.label_masks.any()
+        assert mg.genewalk_graph.number_of_edges() == 100
+        gwg = GeneWalkGraph.from_networkx(mg.graph)
+        assert gwg.labels == []
+        assert np.array_equal(gwg.counts, mg.genewalk_graph.counts)
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from genewalk.perform_statistics import GeneWalk
+from genewalk.tests.util import NodeVectors, get_graph
+
+
+def get_genewalk():
+    graph, refs = get_graph()
+    nvs = [NodeVectors(graph.nodes, seed) for seed in range(3)]
+    null_dist = np.sort(np.random.RandomState(5).uniform(-1, 1, 5000))
+    return GeneWalk(graph, refs, nvs, null_dist)
+
+
+def test_write_output_matches_generate_output():
+    GW = get_genewalk()
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'genewalk_results.csv')
+        for alpha_fdr in (1, 0.5):
+            for base_id_type in ('hgnc_symbol', 'mgi_id'):
+                df = GW.generate_output(alpha_fdr=alpha_fdr,
+                                        base_id_type=base_id_type)
+                df.to_csv(fname, index=False, float_format='%.3e')
+                with open(fname, 'r') as fh:
+                    expected = fh.read()
+                # Small chunks have genes without missing counts only
+                for chunk_size in (1, 4, 7, 1000):
+                    GW.write_output(fname, alpha_fdr=alpha_fdr,
+                                    base_id_type=base_id_type,
+                                    chunk_size=chunk_size)
+                    with open(fname, 'r') as fh:
+                        assert fh.read() == expected, \
+                            (alpha_fdr, base_id_type, chunk_size)
+
+
+def test_write_output_no_rows():
+    GW = get_genewalk()
+    GW.genes = GW.genes[3:4]
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'genewalk_results.csv')
+        GW.write_output(fname, alpha_fdr=0.5, chunk_size=2)
+        df = pd.read_csv(fname)
+        assert df.empty
+        assert list(df.columns) == \
+            list(GW.generate_output(alpha_fdr=0.5).columns)
+
+
+def test_write_output_failure():
+    GW = get_genewalk()
+    format_output = GW.format_output
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'genewalk_results.csv')
+        GW.write_output(fname, chunk_size=4)
+        with open(fname, 'r') as fh:
+            expected = fh.read()
+        # A failure while writing the second chunk keeps the previous
+        # results and leaves no temporary files behind
+        calls = []
+
+        def fail_format_output(df, base_id_type):
+            calls.append(len(df))
+            if len(calls) == 2:
+                raise RuntimeError('Failed to format the output.')
+            return format_output(df, base_id_type)
+        GW.format_output = fail_format_output
+        try:
+            GW.write_output(fname, chunk_size=4)
+        except RuntimeError:
+            pass
+        else:
+            assert False, 'write_output did not fail'
+        assert len(calls) == 2
+        assert os.listdir(dirname) == ['genewalk_results.csv']
+        with open(fname, 'r') as fh:
+            assert fh.read() == expected
+
+
+def test_pair_stats_cache():
+    GW = get_genewalk()
+    # Only the pairs of the input genes are kept
+    GW.genes = GW.genes[:20]
+    GW = GeneWalk(GW.index, GW.genes, GW.nvs, GW.srd)
+    npairs = sum(len(GW.index.get_go_neighbors(g['HGNC_SYMBOL']))
+                 for g in GW.genes if g['HGNC_SYMBOL'] in GW.index)
+    assert GW.sims.shape == (3, npairs)
+    with tempfile.TemporaryDirectory() as dirname:
+        fname = os.path.join(dirname, 'genewalk_pair_stats.npz')
+        GW.save_pair_stats(fname)
+        # The cache of a gene list can be used for any subset of it
+        for genes in (GW.genes, GW.genes[5:12]):
+            cached = GeneWalk(GW.index, genes, None, None)
+            cached.load_pair_stats(fname)
+            expected = GeneWalk(GW.index, genes, GW.nvs, GW.srd)
+            pd.testing.assert_frame_equal(
+                cached.generate_output(alpha_fdr=0.5),
+                expected.generate_output(alpha_fdr=0.5))
+        other = GeneWalk(GW.index, get_genewalk().genes[20:30], None, None)
+        try:
+            other.load_pair_stats(fname)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_uncached_pair_stats():
+    GW = get_genewalk()
+    uncached = GeneWalk(GW.index, GW.genes, GW.nvs, GW.srd,
+                        cache_pair_stats=False)
+    assert uncached.sims is None
+    pd.testing.assert_frame_equal(uncached.generate_output(alpha_fdr=0.5),
+                                  GW.generate_output(alpha_fdr=0.5))
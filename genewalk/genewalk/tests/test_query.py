@@ -0,0 +1,84 @@
+import os
+import json
+import pickle
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+from genewalk.annotation_index import AnnotationIndex
+from genewalk.perform_statistics import GeneWalk
+from genewalk.query import GeneWalkQuery, get_server
+from genewalk.tests.util import NodeVectors, get_graph
+
+
+def make_project(project_folder, nreps):
+    graph, refs = get_graph()
+    nvs = [NodeVectors(graph.nodes, seed) for seed in range(nreps)]
+    null_dist = np.sort(np.random.RandomState(5).uniform(-1, 1, 5000))
+    AnnotationIndex.from_graph(graph).save(
+        os.path.join(project_folder, 'annotation_index.npz'))
+    objs = {'genes': refs, 'genewalk_rand_simdists': null_dist}
+    objs.update({'deepwalk_node_vectors_%d' % (i + 1): nv
+                 for i, nv in enumerate(nvs)})
+    for prefix, obj in objs.items():
+        with open(os.path.join(project_folder, '%s.pkl' % prefix),
+                  'wb') as fh:
+            pickle.dump(obj, fh)
+    return GeneWalk(graph, refs, nvs, null_dist)
+
+
+def test_query_matches_statistics():
+    with tempfile.TemporaryDirectory() as project_folder:
+        GW = make_project(project_folder, 3)
+        gwq = GeneWalkQuery(project_folder)
+        assert gwq.gw.nreps == 3
+        df = GW.generate_output(alpha_fdr=0.5)
+        df = df[df['hgnc_symbol'] == 'G0']
+        res = gwq.query('G0', alpha_fdr=0.5)
+        assert {r['go_id'] for r in res} == set(df['go_id'])
+        for r in res:
+            row = df[df['go_id'] == r['go_id']].iloc[0]
+            assert np.isclose(r['gene_padj'], row['gene_padj'])
+            assert np.isclose(r['sim'], row['sim'])
+        assert [r['gene_padj'] for r in res] == \
+            sorted(r['gene_padj'] for r in res)
+        # The same gene by its HGNC ID
+        assert gwq.query('HGNC:0', alpha_fdr=0.5) == res
+        try:
+            gwq.query('XYZ')
+            assert False
+        except KeyError:
+            pass
+
+
+def test_server():
+    with tempfile.TemporaryDirectory() as project_folder:
+        # With a single replicate the confidence intervals are missing
+        make_project(project_folder, 1)
+        gwq = GeneWalkQuery(project_folder)
+        server = get_server(gwq, port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        url = 'http://127.0.0.1:%d/genes/' % server.server_port
+        try:
+            with urllib.request.urlopen(url + 'G0') as fh:
+                body = fh.read().decode('utf-8')
+
+            def reject_constant(name):
+                raise ValueError('Invalid JSON constant %s' % name)
+
+            res = json.loads(body, parse_constant=reject_constant)
+            assert [r['go_id'] for r in res] == \
+                [r['go_id'] for r in gwq.query('G0')]
+            assert res[0]['cilow_gene_padj'] is None
+            for path, status in (('XYZ', 404), ('G0?alpha_fdr=x', 400)):
+                try:
+                    urllib.request.urlopen(url + path)
+                    assert False
+                except urllib.error.HTTPError as e:
+                    assert e.code == status
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -0,0 +1,55 @@
+import os
+import random
+import tempfile
+import numpy as np
+from genewalk.graph import GeneWalkGraph
+from genewalk.nx_mg_assembler import PcNxMgAssembler
+from genewalk.reference import ReferenceNetwork, get_reference_fname
+from genewalk.resources import ResourceManager, default_resource_urls
+from genewalk.tests.util import ResourceServer, write_resources
+
+
+def assert_same_graph(gwg, ref_gwg):
+    assert gwg.node_names == ref_gwg.node_names
+    for name in ('indptr', 'indices', 'counts'):
+        assert np.array_equal(getattr(gwg, name), getattr(ref_gwg, name))
+    assert [gwg._get_labels(m) for m in gwg.label_masks] == \
+        [ref_gwg._get_labels(m) for m in ref_gwg.label_masks]
+    assert gwg.node_attributes == ref_gwg.node_attributes
+
+
+def test_reference_network():
+    with tempfile.TemporaryDirectory() as dirname:
+        srv_folder = os.path.join(dirname, 'srv')
+        os.makedirs(srv_folder)
+        write_resources(srv_folder)
+        with ResourceServer(srv_folder) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls={name: server.url + name for name
+                                       in default_resource_urls})
+            fname = get_reference_fname(rm.base_folder, 'pc')
+            ReferenceNetwork.build(rm).save(fname)
+            reference = ReferenceNetwork.load(fname)
+            rng = random.Random(0)
+            pruned = False
+            for _ in range(4):
+                genes = [{'HGNC_SYMBOL': 'G%d' % i, 'HGNC': str(i),
+                          'UP': 'P%d' % i}
+                         for i in rng.sample(range(90), rng.randint(5, 60))]
+                for go_ontology, go_neighborhood, annotate_ancestors in \
+                        (('full', 0, False), ('ancestors', 0, False),
+                         ('ancestors', 2, False), ('full', 0, True),
+                         ('ancestors', 1, True)):
+                    kwargs = dict(go_ontology=go_ontology,
+                                  go_neighborhood=go_neighborhood,
+                                  annotate_ancestors=annotate_ancestors)
+                    mg = PcNxMgAssembler(genes, resource_manager=rm,
+                                         **kwargs)
+                    gwg = reference.get_graph(genes, **kwargs)
+                    assert_same_graph(gwg,
+                                      GeneWalkGraph.from_networkx(mg.graph))
+                    go_nodes = gwg.get_node_attributes('GO')
+                    pruned |= len(go_nodes) < \
+                        (~rm.get_go_ontology().is_obsolete).sum()
+            # Some of the GO ontologies were pruned
+            assert pruned
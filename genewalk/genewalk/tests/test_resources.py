@@ -0,0 +1,186 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from genewalk.resources import ResourceManager, default_resource_urls
+from genewalk.tests.util import ResourceServer, write_resources
+
+
+def read(fname):
+    with open(fname, 'rb') as fh:
+        return fh.read()
+
+
+def get_urls(server):
+    return {name: server.url + name for name in default_resource_urls}
+
+
+def test_resume_download():
+    with tempfile.TemporaryDirectory() as dirname:
+        srv_folder = os.path.join(dirname, 'srv')
+        os.makedirs(srv_folder)
+        write_resources(srv_folder)
+        with ResourceServer(srv_folder) as server:
+            for keep_compressed in (False, True):
+                base_folder = os.path.join(dirname, str(keep_compressed))
+                server.cut = {'go.obo': 1,
+                              'PathwayCommons11.All.hgnc.sif.gz': 2}
+                server.requests = []
+                rm = ResourceManager(base_folder, urls=get_urls(server),
+                                     keep_compressed=keep_compressed)
+                rm.download_all()
+                # Interrupted downloads are resumed where they stopped
+                resumed = [r for r in server.requests if r[2]]
+                assert sorted(r[1] for r in resumed) == \
+                    ['PathwayCommons11.All.hgnc.sif.gz'] * 2 + ['go.obo']
+                assert len(server.requests) == 6
+                for fname in (rm.get_go_obo(), rm.get_goa_gaf(),
+                              rm.get_pc()):
+                    name = os.path.basename(fname)
+                    assert name.endswith('.gz') == \
+                        (keep_compressed and name != 'go.obo')
+                    assert read(fname) == \
+                        read(os.path.join(srv_folder, name))
+                    entry = rm.get_manifest()[name]
+                    assert entry['size'] == os.path.getsize(fname)
+                    assert entry['sha256'] == \
+                        hashlib.sha256(read(fname)).hexdigest()
+                assert len(server.requests) == 6
+
+
+def test_download_without_ranges():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_resources(dirname)
+        with ResourceServer(dirname) as server:
+            server.support_ranges = False
+            server.cut = {'go.obo': 2}
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls=get_urls(server))
+            fname = rm.get_go_obo()
+            assert read(fname) == read(os.path.join(dirname, 'go.obo'))
+            assert [r[2] > 0 for r in server.requests] == \
+                [False, True, True]
+
+
+def test_changed_file():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_resources(dirname)
+        with ResourceServer(dirname) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls=get_urls(server))
+            fname = rm.get_go_obo()
+            with open(fname, 'r+') as fh:
+                fh.truncate(100)
+            assert rm.get_go_obo() == fname
+            assert read(fname) == read(os.path.join(dirname, 'go.obo'))
+            assert len(server.requests) == 2
+
+
+def test_unlisted_files():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_resources(dirname)
+        with ResourceServer(dirname) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls=get_urls(server), keep_compressed=True)
+            # A complete file is checked against its size on the server
+            # and added to the manifest
+            go_obo = os.path.join(rm.resource_folder, 'go.obo')
+            shutil.copy(os.path.join(dirname, 'go.obo'), go_obo)
+            assert rm.get_go_obo() == go_obo
+            assert server.requests == [('HEAD', 'go.obo', 0)]
+            assert 'go.obo' in rm.get_manifest()
+            # Truncated files are downloaded again
+            goa_gaf = os.path.join(rm.resource_folder, 'goa_human.gaf.gz')
+            with open(goa_gaf, 'wb') as fh:
+                fh.write(read(os.path.join(dirname,
+                                           'goa_human.gaf.gz'))[:500])
+            pc = os.path.join(rm.resource_folder,
+                              'PathwayCommons11.All.hgnc.sif')
+            with open(pc, 'wb') as fh:
+                fh.write(read(os.path.join(
+                    dirname, 'PathwayCommons11.All.hgnc.sif'))[:500])
+            server.requests = []
+            assert rm.get_goa_gaf() == goa_gaf
+            assert read(goa_gaf) == \
+                read(os.path.join(dirname, 'goa_human.gaf.gz'))
+            # A decompressed file cannot be checked
+            assert rm.get_pc() == pc + '.gz'
+            assert [r[:2] for r in server.requests] == \
+                [('GET', 'goa_human.gaf.gz'),
+                 ('GET', 'PathwayCommons11.All.hgnc.sif.gz')]
+        # It is used if it cannot be downloaded again
+        os.remove(pc + '.gz')
+        assert rm.get_pc() == pc
+
+
+def write_part(fname, content, etag, size):
+    with open(fname + '.part', 'wb') as fh:
+        fh.write(content)
+    with open(fname + '.part.json', 'w') as fh:
+        json.dump({'etag': etag, 'last_modified': None, 'size': size}, fh)
+
+
+def get_etag(fname):
+    return '"%s"' % hashlib.sha256(read(fname)).hexdigest()
+
+
+def test_corrupt_part():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_resources(dirname)
+        with ResourceServer(dirname) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls=get_urls(server))
+            # A partial download of the current file that is corrupt fails
+            # to decompress once complete and is removed
+            gz_fname = os.path.join(dirname, 'goa_human.gaf.gz')
+            fname = os.path.join(rm.resource_folder, 'goa_human.gaf')
+            size = os.path.getsize(gz_fname)
+            write_part(fname, b'x' * (size - 10), get_etag(gz_fname), size)
+            try:
+                rm.get_goa_gaf()
+                assert False
+            except IOError:
+                pass
+            assert server.requests == \
+                [('GET', 'goa_human.gaf.gz', size - 10)]
+            assert not os.path.exists(fname + '.part')
+            assert not os.path.exists(fname + '.part.json')
+            assert rm.get_goa_gaf() == fname
+            assert read(fname) == read(os.path.join(dirname,
+                                                    'goa_human.gaf'))
+
+
+def test_stale_part():
+    with tempfile.TemporaryDirectory() as dirname:
+        write_resources(dirname)
+        with ResourceServer(dirname) as server:
+            rm = ResourceManager(os.path.join(dirname, 'base'),
+                                 urls=get_urls(server))
+            srv_fname = os.path.join(dirname, 'go.obo')
+            fname = os.path.join(rm.resource_folder, 'go.obo')
+            # A partial download of a previous version of the file is
+            # replaced by the current file
+            old = b'format-version: 1.0\n' * 1000
+            write_part(fname, old[:100], '"old"', len(old))
+            assert rm.get_go_obo() == fname
+            assert read(fname) == read(srv_fname)
+            assert server.requests == [('GET', 'go.obo', 100)]
+            assert not os.path.exists(fname + '.part.json')
+            # As is one that is longer than the current file
+            os.remove(fname)
+            server.requests = []
+            size = os.path.getsize(srv_fname)
+            write_part(fname, old, get_etag(srv_fname), size)
+            assert rm.get_go_obo() == fname
+            assert read(fname) == read(srv_fname)
+            assert server.requests == [('GET', 'go.obo', len(old)),
+                                       ('GET', 'go.obo', 0)]
+            # A partial download without validator is not resumed
+            os.remove(fname)
+            server.requests = []
+            with open(fname + '.part', 'wb') as fh:
+                fh.write(old[:100])
+            assert rm.get_go_obo() == fname
+            assert read(fname) == read(srv_fname)
+            assert server.requests == [('GET', 'go.obo', 0)]
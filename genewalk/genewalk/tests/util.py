@@ -0,0 +1,208 @@
+"""Helpers shared by the tests."""
+import os
+import gzip
+import hashlib
+import random
+import shutil
+import threading
+import numpy as np
+import networkx as nx
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+class NodeVectors(object):
+    """Random node vectors with the similarity method of gensim's
+    KeyedVectors."""
+    def __init__(self, nodes, seed):
+        rs = np.random.RandomState(seed)
+        self.vectors = {node: rs.randn(8) for node in nodes}
+
+    def similarity(self, a, b):
+        x, y = self.vectors[a], self.vectors[b]
+        return float(np.dot(x, y) / np.linalg.norm(x) / np.linalg.norm(y))
+
+
+def get_graph(ngenes=60, ngo=40, seed=0):
+    """Return a random GeneWalk network and the references of its genes,
+    some of which are not in the network or have no GO annotations."""
+    rng = random.Random(seed)
+    graph = nx.MultiGraph()
+    genes = ['G%d' % i for i in range(ngenes)]
+    go_ids = ['GO:%07d' % i for i in range(ngo)]
+    for i, gene in enumerate(genes):
+        if i % 7 != 3:
+            graph.add_node(gene, HGNC=str(i), UP='P%d' % i)
+    for go_id in go_ids:
+        graph.add_node(go_id, name='term %s' % go_id, GO=go_id,
+                       domain=rng.choice(['biological_process',
+                                          'molecular_function']))
+    in_graph = [gene for gene in genes if gene in graph]
+    for _ in range(150):
+        graph.add_edge(*rng.sample(in_graph, 2), label='x')
+    for gene in in_graph:
+        if rng.random() < 0.8:
+            for go_id in rng.sample(go_ids, rng.randint(1, 6)):
+                graph.add_edge(gene, go_id, label='GO:annotation')
+    for i in range(1, ngo):
+        graph.add_edge(go_ids[i], go_ids[rng.randrange(i)], label='GO:is_a')
+    refs = [{'HGNC_SYMBOL': gene, 'HGNC': str(i), 'UP': 'P%d' % i,
+             'MGI': 'M%d' % i} for i, gene in enumerate(genes)]
+    return graph, refs
+
+
+def write_go_obo(fname, ngo=40, seed=1):
+    """Write a random GO OBO file with an obsolete term and an alternative
+    ID."""
+    rng = random.Random(seed)
+    with open(fname, 'w') as fh:
+        fh.write('format-version: 1.2\ndata-version: releases/2020-01-01\n\n')
+        for i in range(ngo):
+            fh.write('[Term]\nid: GO:%07d\nname: term %d\nnamespace: %s\n' %
+                     (i, i, rng.choice(['biological_process',
+                                        'molecular_function',
+                                        'cellular_component'])))
+            if i > 2:
+                for parent in sorted({rng.randrange(i)
+                                      for _ in range(rng.randint(1, 2))}):
+                    fh.write('is_a: GO:%07d ! term %d\n' % (parent, parent))
+            if i == ngo - 1:
+                fh.write('is_obsolete: true\n')
+            if i == 5:
+                fh.write('alt_id: GO:0009995\n')
+            fh.write('\n')
+
+
+def write_goa_gaf(fname, nup=50, ngo=40, nannotations=600, seed=1):
+    """Write a random GOA GAF file annotating UniProt IDs P0, P1, ...
+    with various qualifiers and evidence codes."""
+    rng = random.Random(seed)
+    with open(fname, 'w') as fh:
+        for i in range(23):
+            fh.write('!header %d\n' % i)
+        for _ in range(nannotations):
+            up_id = 'P%d' % rng.randrange(nup)
+            go_id = 'GO:%07d' % rng.randrange(ngo) if rng.random() > 0.02 \
+                else 'GO:0009995'
+            qualifier = rng.choice(['', '', '', 'NOT', 'contributes_to'])
+            evidence_code = rng.choice(['EXP', 'IDA', 'IEA', 'TAS', 'IBA'])
+            fh.write('\t'.join(['UniProtKB', up_id, 'S' + up_id, qualifier,
+                                go_id, 'PMID:1', evidence_code, '', 'P',
+                                'name', 'syn', 'protein', 'taxon:9606',
+                                '20200101', 'UniProt', '', '']) + '\n')
+
+
+def write_sif(fname, ngenes=80, nedges=400, seed=1):
+    """Write a random SIF file of edges between genes G0, G1, ..."""
+    rng = random.Random(seed)
+    with open(fname, 'w') as fh:
+        for _ in range(nedges):
+            a, b = rng.sample(range(ngenes), 2)
+            fh.write('G%d\t%s\tG%d\n' %
+                     (a, rng.choice(['interacts-with',
+                                     'controls-state-change-of',
+                                     'in-complex-with']), b))
+
+
+def write_resources(folder):
+    """Write random versions of the resource files into a folder, the GO
+    annotations and the Pathway Commons network both compressed and
+    decompressed."""
+    write_go_obo(os.path.join(folder, 'go.obo'))
+    for name, write in (('goa_human.gaf', write_goa_gaf),
+                        ('PathwayCommons11.All.hgnc.sif', write_sif)):
+        fname = os.path.join(folder, name)
+        write(fname)
+        with open(fname, 'rb') as fh, \
+                gzip.open(fname + '.gz', 'wb') as fh_out:
+            shutil.copyfileobj(fh, fh_out)
+
+
+class ResourceServer(object):
+    """A local HTTP server of the files in a folder, supporting HEAD and
+    range requests with ETags, which can be made to interrupt responses and
+    to ignore ranges.
+
+    Attributes
+    ----------
+    cut : dict
+        The number of responses to interrupt after a third of their body,
+        by file name.
+    support_ranges : bool
+        Whether range requests are answered with the requested range rather
+        than the whole file.
+    requests : list of tuple
+        The method, file name and range start of each request.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.cut = {}
+        self.support_ranges = True
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                name = self.path.strip('/')
+                fname = os.path.join(server.folder, name)
+                if not os.path.exists(fname):
+                    self.send_error(404)
+                    return
+                with open(fname, 'rb') as fh:
+                    body = fh.read()
+                etag = '"%s"' % hashlib.sha256(body).hexdigest()
+                start = 0
+                range_header = self.headers.get('Range')
+                if range_header:
+                    start = int(range_header.split('=')[1].rstrip('-'))
+                server.requests.append((self.command, name, start))
+                # A range of a file that changed is answered with the whole
+                # file
+                if_range = self.headers.get('If-Range')
+                if range_header and server.support_ranges and \
+                        if_range in (None, etag):
+                    if start >= len(body):
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                                     (start, len(body) - 1, len(body)))
+                    body = body[start:]
+                else:
+                    self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not send_body:
+                    return
+                if server.cut.get(name):
+                    server.cut[name] -= 1
+                    self.wfile.write(body[:len(body) // 3])
+                    self.wfile.flush()
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/' % self.httpd.server_port
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
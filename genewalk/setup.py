@@ -35,7 +35,8 @@ def main():
           install_requires=install_list,
           tests_require=['nose'],
           include_package_data=True,
-          entry_points={'console_scripts': ['genewalk = genewalk.cli:main']},
+          entry_points={'console_scripts': [
+              'genewalk = genewalk.cli:main']},
         )
 
 